@@ -90,9 +90,9 @@ class PlayerChart(commands.Cog):
                 pid = pids[i]
                 matches = {'Time':[],'RP':[],'Player':[]}
                 if 'ratinghistory' in data and len(data['ratinghistory']):
-                    history = sorted(data['ratinghistory'], key=lambda m: datetime.fromisoformat(m['matchdate']))
-                    for h in history:
-                        h_date = datetime.fromisoformat(h['matchdate'])
+                    history = data['ratinghistory'] # a RatingHistory, in match date order with the dates already parsed
+                    for h, t in zip(history, history.times):
+                        h_date = datetime.fromtimestamp(t / 1000000)
                         matches['Time'].append(h_date)
                         matches['RP'].append(h['ratingafter'])
                         matches['Player'].append(playername)
@@ -229,7 +229,8 @@ class PlayerChart(commands.Cog):
         pid = player.id
         pids = []
         pids.append(pid)
-        rkData = ctx.bot.get_cog('PUG').pugInfo.loadPugRatings(self.ratingsFile, True)
+        await ctx.bot.get_cog('PUG').ratingsRepo.load([mode])
+        rkData = ctx.bot.get_cog('PUG').pugInfo.loadPugRatings(self.ratingsFile, True, mode)
         rsResult = self.getRankStats(mode, rkData, pids)
         if rsResult not in [None,'']:
             embedInfo = discord.Embed(color=discord.Color.dark_embed(),title='Ratings history for {0}'.format(player.display_name))
@@ -268,7 +269,8 @@ class PlayerChart(commands.Cog):
                 playernames.append(p.display_name)
         log.debug('rkmpstats() - Generating graph for players {0}'.format(', '.join(playernames)))
         if len(pids) and len(playernames) and len(pids) == len(playernames):
-            rkData = ctx.bot.get_cog('PUG').pugInfo.loadPugRatings(self.ratingsFile, True)
+            await ctx.bot.get_cog('PUG').ratingsRepo.load([mode])
+            rkData = ctx.bot.get_cog('PUG').pugInfo.loadPugRatings(self.ratingsFile, True, mode)
             rsResult = self.getRankStats(mode, rkData, pids)
             if rsResult not in [None,''] and 'image' in rsResult and rsResult['image'] not in [None,'']:
                 embedInfo = discord.Embed(color=discord.Color.dark_embed())
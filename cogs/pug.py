@@ -1,19 +1,28 @@
+import abc
+import asyncio
+import bisect
 import collections
+import collections.abc
+import copy
 import time
+import aiohttp
 import asyncpg
 from datetime import datetime
 from datetime import timezone
 from datetime import timedelta
 from math import gcd
 import functools
+import heapq
+import ipaddress
 import itertools
 import logging
+import os
 import random
 import re
-import requests # should replace with aiohttp. See https://discordpy.readthedocs.io/en/latest/faq.html#what-does-blocking-mean
 import json
-import discord
 import socket
+import sqlite3
+import discord
 import dns.resolver
 from discord.ext import commands, tasks
 from cogs import admin
@@ -48,6 +57,81 @@ DEFAULT_STATS_MATCH_URL = f'{DEFAULT_POST_SERVER}/pugstats/index.php?p=uta_match
 DEFAULT_THUMBNAIL_SERVER = f'{DEFAULT_POST_SERVER}/pugstats/images/maps/'
 DEFAULT_CONFIG_FILE = 'servers/config.json'
 DEFAULT_RATING_FILE = 'players/ratings.json'
+DEFAULT_RATING_DB = 'players/ratings.db'
+
+# HTTP connection pool used for the setup and sync APIs
+DEFAULT_HTTP_POOL_LIMIT = 20
+DEFAULT_HTTP_POOL_LIMIT_PER_HOST = 8
+DEFAULT_HTTP_KEEPALIVE = 60
+
+# Connect/read timeouts (seconds) per setup API call type, overridable with setupapi.timeouts in the config file.
+# The total time for one call is bounded by connect + read.
+Timeout = collections.namedtuple('Timeout', 'connect read')
+DEFAULT_API_TIMEOUTS = {
+    'check': Timeout(5, 10),
+    'list': Timeout(5, 15),
+    'setup': Timeout(5, 30),
+    'endgame': Timeout(5, 20),
+    'remote': Timeout(5, 30),
+    'sync': Timeout(5, 15)
+}
+DEFAULT_SETUP_DEADLINE = 180 # Overall time allowed for all setupPug() attempts, including on-demand server start-up
+DEFAULT_SERVER_REGISTRY_TTL = 600 # Seconds before the shared server list is re-validated against the setup API
+
+# UT GameSpy queries: seconds to wait for a complete reply, and how many times to re-send before giving up
+UT_QUERY_TIMEOUT = 3
+UT_QUERY_RETRIES = 1
+UT_QUERY_CACHE_TTL = 5 # Seconds a reply is reused for the same query to the same server
+UT_QUERY_GAP_GRACE = 0.5 # Seconds to wait for stragglers once the final packet is in but earlier packets are missing
+# Multi-query used by the stats card for lots of info in one request
+UT_QUERY_STATUS = 'status\\\\level_property\\timedilation\\\\game_property\\teamscore\\\\game_property\\teamnamered\\\\game_property\\teamnameblue\\\\player_property\\Health\\\\game_property\\elapsedtime\\\\game_property\\remainingtime\\\\game_property\\bmatchmode\\\\game_property\\friendlyfirescale\\\\game_property\\currentdefender\\\\game_property\\bdefenseset\\\\game_property\\matchcode\\\\game_property\\fraglimit\\\\game_property\\timelimit\\\\rules'
+
+# Console relay: seconds between flushes of buffered console lines, and Discord's per-message character limit
+CONSOLE_RELAY_INTERVAL = 2
+DISCORD_MESSAGE_LIMIT = 2000
+# Minimum seconds between edits of a pug's scoreboard message, keeping well inside Discord's per-message edit limits
+SCOREBOARD_EDIT_INTERVAL = 5
+# Outbound message pacing per channel: sends per second on average, and how many may go out back to back
+OUTBOUND_RATE = 1
+OUTBOUND_BURST = 5
+# Console lines that prompt a fresh stats card
+SCORE_LINE_PATTERN = re.compile(r'1\sminutes\suntil\sgame\sstart|conquered\sthe\sbase|defended\sthe\sbase', re.IGNORECASE)
+# Console lines that can mean a map or the whole match has ended. Each prompts an immediate status check (then a few
+# follow-ups, as the setup API can lag the server), since the API stays the authority on whether the match is finished
+MATCH_END_PATTERN = re.compile(r'conquered\sthe\sbase|defended\sthe\sbase|match\s(has\s)?(ended|finished)|game\s(has\s)?ended', re.IGNORECASE)
+MATCH_END_CHECK_DELAYS = [0, 5, 15, 30]
+# Seconds between API status polls for pugs whose console is being watched for the end of the match
+MATCH_STATUS_FALLBACK_INTERVAL = 300
+
+# Reporter polling adapts to each pug's server: console polls while chat is flowing, during a live round and when quiet,
+# stats cards during a live round and when idle, the ceiling for backing off an unresponsive server, and the cap on
+# reporter polls sent per second across all pugs
+UT_POLL_TICK = 1
+UT_POLL_CONSOLE_BUSY = 2
+UT_POLL_CONSOLE_LIVE = 4
+UT_POLL_CONSOLE_IDLE = 20
+UT_POLL_STATS_LIVE = 60
+UT_POLL_STATS_IDLE = 300
+UT_POLL_BACKOFF_MAX = 120
+UT_POLL_MAX_PER_SECOND = 4
+
+# Password DMs at match start: how many are sent at once, and seconds allowed for each
+DM_CONCURRENCY = 5
+DM_TIMEOUT = 10
+
+# Seconds between background retries of unsaved ratings changes and checks for journal compaction, and the journal size
+# (bytes) beyond which it is folded into a new ratings file snapshot
+RATINGS_FLUSH_INTERVAL = 30
+RATINGS_JOURNAL_COMPACT_BYTES = 1024 * 1024
+# Most recent ranked games per mode kept in memory; older ones are left to the ratings store (monthly archive files for JSON)
+RATINGS_HOT_GAMES = 100
+
+# Setup retries and on-demand server start-up checks back off exponentially, with jitter, between attempts
+SETUP_ATTEMPTS = 5
+SETUP_BACKOFF_BASE = 2
+SETUP_BACKOFF_MAX = 15
+ONDEMAND_START_ATTEMPTS = 3
+ONDEMAND_MAX_ATTEMPTS = 10
 
 # Valid modes with default config
 Mode = collections.namedtuple('Mode', 'name isRanked minPlayers maxPlayers friendlyFireScale gameType mutators modeGroup')
@@ -182,6 +266,2006 @@ def getDuration(then, now, interval: str = 'default'):
         return ', '.join(msg)
     return {'years': int(years()[0]),'days': int(days()[0]),'hours': int(hours()[0]),'minutes': int(minutes()[0]),'seconds': int(seconds()),'default': totalDuration()}[interval]
 
+def backoffDelay(attempt: int, base: float = SETUP_BACKOFF_BASE, cap: float = SETUP_BACKOFF_MAX):
+    """Exponential backoff with jitter: a random delay between half and all of min(cap, base * 2^attempt)"""
+    delay = min(cap, base * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+#########################################################################################
+# HTTP client
+#########################################################################################
+class APIResponse:
+    """Fully-read response from the setup/sync APIs, exposing the parts of requests.Response used by the bot"""
+    __slots__ = ('url', 'status_code', 'headers', 'content')
+
+    def __init__(self, url: str, status_code: int, headers, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+class APIClient:
+    """Process-wide aiohttp session with a pooled, keep-alive connector."""
+    def __init__(self, limit: int = DEFAULT_HTTP_POOL_LIMIT, limitPerHost: int = DEFAULT_HTTP_POOL_LIMIT_PER_HOST, keepalive: int = DEFAULT_HTTP_KEEPALIVE):
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.keepalive = keepalive
+        self._session = None
+
+    @property
+    def session(self):
+        # Created lazily, as the session must be bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limitPerHost, keepalive_timeout=self.keepalive, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def post(self, url: str, headers, json=None, timeout: Timeout = DEFAULT_API_TIMEOUTS['check']):
+        clientTimeout = aiohttp.ClientTimeout(total=timeout.connect + timeout.read, sock_connect=timeout.connect, sock_read=timeout.read)
+        try:
+            async with self.session.post(url, headers=headers, json=json, timeout=clientTimeout) as r:
+                content = await r.read()
+                return APIResponse(str(r.url), r.status, r.headers, content)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error(f'APIClient.post() - request to {url} failed: {e!r}')
+            return None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+httpClient = APIClient()
+
+#########################################################################################
+# UT GameSpy query engine
+#########################################################################################
+# Protocol info: https://wiki.beyondunreal.com/Legacy:UT_Server_Query
+# UTA servers extend the protocol server-side to offer Assault-related info and Event streams (e.g. chat)
+def parseUTQueryPacket(data: bytes):
+    """Splits one reply packet into its key/value pairs, queryid (e.g. "45.2" as (45, 2)) and final marker"""
+    tokens = data.decode('utf-8','ignore').split('\\')[1:]
+    pairs = []
+    queryId = None
+    final = False
+    for key, value in zip(tokens[0::2], tokens[1::2]):
+        if key == 'queryid':
+            queryNum, _, packetNum = value.partition('.')
+            try:
+                queryId = (int(queryNum), int(packetNum or 1))
+            except ValueError:
+                log.debug(f'parseUTQueryPacket() - ignoring malformed queryid: {value}')
+        elif key == 'final':
+            final = True
+        else:
+            pairs.append((key, value))
+    return pairs, queryId, final
+
+class UTQueryReply:
+    """Reassembles a multi-packet reply in queryid order, ignoring duplicates and packets from other queries"""
+    def __init__(self):
+        self.queryNum = None
+        self.fragments = {}
+        self.total = None
+
+    def add(self, data: bytes):
+        pairs, queryId, final = parseUTQueryPacket(data)
+        if queryId is None:
+            # Servers that don't number their packets are taken in arrival order
+            queryId = (self.queryNum, len(self.fragments) + 1)
+        queryNum, packetNum = queryId
+        if self.queryNum is None:
+            self.queryNum = queryNum
+        elif queryNum != self.queryNum:
+            log.debug(f'UTQueryReply.add() - dropping stale packet {queryNum}.{packetNum}, expecting query {self.queryNum}')
+            return
+        self.fragments.setdefault(packetNum, pairs)
+        if final:
+            self.total = packetNum
+
+    @property
+    def missing(self):
+        if self.total is None:
+            return []
+        return [x for x in range(1, self.total + 1) if x not in self.fragments]
+
+    @property
+    def complete(self):
+        return self.total is not None and not self.missing
+
+    def result(self):
+        data = {}
+        for packetNum in sorted(self.fragments):
+            data.update(self.fragments[packetNum])
+        return data
+
+class UTQueryRequest:
+    """One batch of queries to a single server, answered by one (possibly multi-packet) reply"""
+    def __init__(self, address):
+        self.address = address
+        self.queryTypes = []
+        self.sent = False
+        self.reply = None
+        self.received = None
+        self.gapTimer = None
+        self.task = None
+        self.done = asyncio.get_running_loop().create_future()
+        # Waiters may all have been cancelled by the time a failure lands; don't warn about it going unread
+        self.done.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    @property
+    def packet(self):
+        return str.encode(''.join(f'\\{queryType}\\' for queryType in self.queryTypes))
+
+    def start(self):
+        """Resets the reply state for a new attempt"""
+        self.stopGapTimer()
+        self.reply = UTQueryReply()
+        self.received = asyncio.get_running_loop().create_future()
+
+    def datagramReceived(self, data):
+        if self.received is None or self.received.done():
+            return
+        self.reply.add(data)
+        if self.reply.complete:
+            self.received.set_result(self.reply.result())
+        elif self.reply.missing and self.gapTimer is None:
+            # The final packet is in but some before it are not; give them a moment, then re-request
+            self.gapTimer = asyncio.get_running_loop().call_later(UT_QUERY_GAP_GRACE, self.gapExpired)
+
+    def gapExpired(self):
+        self.gapTimer = None
+        if not self.received.done():
+            self.received.set_exception(asyncio.TimeoutError(f'missing packets {self.reply.missing} of {self.reply.total}'))
+
+    def stopGapTimer(self):
+        if self.gapTimer is not None:
+            self.gapTimer.cancel()
+            self.gapTimer = None
+
+class UTQueryProtocol(asyncio.DatagramProtocol):
+    """Hands every packet received on the shared query socket to the engine for routing"""
+    def __init__(self, engine):
+        self.engine = engine
+
+    def datagram_received(self, data, addr):
+        self.engine.dispatch(data, addr)
+
+    def error_received(self, exc):
+        # Unconnected sockets can't tell which server an error belongs to; the request times out instead
+        log.debug(f'UTQueryProtocol.error_received() - {exc!r}')
+
+    def connection_lost(self, exc):
+        self.engine.transport = None
+
+class UTQueryEngine:
+    """Sends GameSpy queries for every server from one UDP socket, routing replies by (ip, port)"""
+    def __init__(self, timeout: float = UT_QUERY_TIMEOUT, retries: int = UT_QUERY_RETRIES, cacheTTL: float = UT_QUERY_CACHE_TTL):
+        self.timeout = timeout
+        self.retries = retries
+        self.cacheTTL = cacheTTL
+        self.transport = None
+        self.transportLock = None
+        self.requests = {}
+        self.cache = {}
+        self.inflight = {}
+
+    async def getTransport(self):
+        if self.transportLock is None:
+            self.transportLock = asyncio.Lock()
+        async with self.transportLock:
+            if self.transport is None:
+                self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: UTQueryProtocol(self), local_addr=('0.0.0.0', 0))
+        return self.transport
+
+    async def resolve(self, ip: str, port: int):
+        """Returns the numeric address replies will come from, so they can be matched to the request"""
+        try:
+            # Numeric addresses skip the resolver, so concurrent queries to a server still land in the same batch
+            return (str(ipaddress.IPv4Address(ip)), int(port))
+        except ValueError:
+            pass
+        info = await asyncio.get_running_loop().getaddrinfo(ip, int(port), family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        return info[0][4]
+
+    def dispatch(self, data: bytes, addr):
+        request = self.requests.get(addr[:2])
+        if request is None:
+            log.debug(f'UTQueryEngine.dispatch() - dropping unexpected packet from {addr[0]}:{addr[1]}')
+            return
+        request.datagramReceived(data)
+
+    async def query(self, ip: str, port: int, queryType: str, maxAge: float = None):
+        """Returns a dict of the key/value pairs in the reply, or raises asyncio.TimeoutError.
+        Replies younger than maxAge (default: the cache TTL, 0 to always ask) are reused, and identical queries share one exchange."""
+        address = await self.resolve(ip, port)
+        key = (address, queryType)
+        if maxAge is None:
+            maxAge = self.cacheTTL
+        if maxAge > 0 and key in self.cache:
+            received, result = self.cache[key]
+            if time.monotonic() - received <= maxAge:
+                return dict(result)
+        fetch = self.inflight.get(key)
+        if fetch is None:
+            fetch = self.inflight[key] = asyncio.get_running_loop().create_task(self.fetch(address, queryType))
+            fetch.add_done_callback(lambda task: self.fetchDone(key, task))
+        return dict(await asyncio.shield(fetch))
+
+    def fetchDone(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        now = time.monotonic()
+        self.cache[key] = (now, task.result())
+        # Drop replies that have gone stale, e.g. from one-off !serverquery lookups
+        for cacheKey in [k for k, (received, _) in self.cache.items() if now - received > self.cacheTTL]:
+            del self.cache[cacheKey]
+
+    async def fetch(self, address, queryType: str):
+        await self.getTransport()
+        while True:
+            request = self.requests.get(address)
+            if request is None:
+                # The send is scheduled rather than run, so other queries to this server made now join the same packet
+                request = self.requests[address] = UTQueryRequest(address)
+                request.task = asyncio.get_running_loop().create_task(self.send(request))
+            if not request.sent:
+                if queryType not in request.queryTypes:
+                    request.queryTypes.append(queryType)
+                return await asyncio.shield(request.done)
+            # Only one request per server can be on the wire, as replies are routed by address alone
+            await asyncio.wait([request.done])
+
+    async def send(self, request: UTQueryRequest):
+        request.sent = True
+        try:
+            for attempt in range(self.retries + 1):
+                request.start()
+                transport = await self.getTransport()
+                transport.sendto(request.packet, request.address)
+                try:
+                    result = await asyncio.wait_for(request.received, self.timeout)
+                    if not request.done.done():
+                        request.done.set_result(result)
+                    return
+                except asyncio.TimeoutError as e:
+                    if attempt >= self.retries:
+                        raise
+                    # GameSpy has no way to ask for single packets, so a gap means sending the query again
+                    log.debug(f'UTQueryEngine.send() - incomplete reply for {request.queryTypes} from {request.address[0]}:{request.address[1]} ({e or "no final packet"}), retrying ({attempt+1}/{self.retries})')
+        except (asyncio.TimeoutError, OSError) as e:
+            if not request.done.done():
+                request.done.set_exception(e)
+        except asyncio.CancelledError:
+            request.done.cancel()
+            raise
+        finally:
+            request.stopGapTimer()
+            if self.requests.get(request.address) is request:
+                del self.requests[request.address]
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        for request in list(self.requests.values()):
+            if request.task is not None:
+                request.task.cancel()
+            request.stopGapTimer()
+            request.done.cancel()
+        self.requests.clear()
+        for fetch in list(self.inflight.values()):
+            fetch.cancel()
+        self.inflight.clear()
+        self.cache.clear()
+        return True
+
+utQueryEngine = UTQueryEngine()
+
+#########################################################################################
+# UT query results
+#########################################################################################
+# Each query replaces the records it covers as a whole, so nothing from an earlier map or query lingers
+def utQueryInt(value, default: int = 0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def utQueryBaseType(queryType: str):
+    """Returns the leading query type of a (possibly multi-part) query, e.g. "status" for UT_QUERY_STATUS"""
+    return queryType.split('\\')[0]
+
+class UTServerInfo:
+    """Server details from the info, status and rules queries"""
+    __slots__ = ('hostname', 'mapName', 'mapTitle', 'gameType', 'numPlayers', 'maxPlayers', 'maxTeams', 'password', 'mutators',
+                 'remainingTime', 'elapsedTime', 'timeLimit', 'fragLimit', 'goalTeamScore', 'matchMode', 'adminName',
+                 'teamNameRed', 'teamNameBlue', 'currentDefender', 'defenseSet')
+
+    def __init__(self, data: dict):
+        self.hostname = data.get('hostname', '')
+        self.mapName = data.get('mapname', '')
+        self.mapTitle = data.get('maptitle', '')
+        self.gameType = data.get('gametype', '')
+        self.numPlayers = utQueryInt(data.get('numplayers'))
+        self.maxPlayers = utQueryInt(data.get('maxplayers'))
+        self.maxTeams = utQueryInt(data.get('maxteams')) if 'maxteams' in data else None
+        self.password = data.get('password') == 'True'
+        self.mutators = data.get('mutators', '')
+        self.remainingTime = utQueryInt(data['remainingtime']) if 'remainingtime' in data else None
+        self.elapsedTime = utQueryInt(data['elapsedtime']) if 'elapsedtime' in data else None
+        self.timeLimit = utQueryInt(data.get('timelimit'))
+        self.fragLimit = utQueryInt(data.get('fraglimit'))
+        self.goalTeamScore = utQueryInt(data.get('goalteamscore'))
+        self.matchMode = 'bmatchmode' in data
+        self.adminName = data.get('AdminName')
+        self.teamNameRed = data.get('teamnamered')
+        self.teamNameBlue = data.get('teamnameblue')
+        self.currentDefender = data.get('currentdefender')
+        self.defenseSet = data['bdefenseset'] in ['true','True','1'] if 'bdefenseset' in data else None
+
+    @property
+    def isUTAssault(self):
+        return self.matchMode and self.gameType == 'Assault'
+
+    @property
+    def isPublic(self):
+        return self.adminName in ['OPEN - PUBLIC','LOCKED - PRIVATE']
+
+class UTPlayer:
+    """One player line from a status query"""
+    __slots__ = ('name', 'frags', 'ping', 'team')
+
+    def __init__(self, data: dict, index: int):
+        self.name = data.get(f'player_{index}', '').replace('`','').strip()
+        self.frags = data.get(f'frags_{index}', '0').strip()
+        self.ping = data.get(f'ping_{index}', '0').strip()
+        self.team = utQueryInt(data.get(f'team_{index}'), 255)
+
+class UTTeam:
+    """A team score from the UTA teams query"""
+    __slots__ = ('index', 'score')
+
+    def __init__(self, data: dict, index: int):
+        self.index = index
+        self.score = utQueryInt(data.get(f'score_{index}'))
+
+class UTObjective:
+    """A fort and its status from the UTA objectives query"""
+    __slots__ = ('name', 'status')
+
+    def __init__(self, data: dict, index: int):
+        self.name = str(data.get(f'fort_{index}', ''))
+        self.status = str(data.get(f'fortstatus_{index}', ''))
+
+class UTQueryData:
+    """Query target, outcome bookkeeping and the latest parsed results for one game server"""
+    __slots__ = ('ip', 'gamePort', 'queryPort', 'code', 'status', 'lastQuery', 'attempts', 'lastStats',
+                 'server', 'players', 'teams', 'objectives', 'consoleLog')
+
+    def __init__(self, ip: str = None, gamePort: int = None):
+        self.ip = ip
+        self.gamePort = gamePort
+        self.queryPort = int(gamePort) + 1 if gamePort is not None else None
+        self.code = None
+        self.status = ''
+        self.lastQuery = 0
+        self.attempts = 0
+        self.lastStats = 0
+        self.server = None
+        self.players = ()
+        self.teams = ()
+        self.objectives = ()
+        self.consoleLog = None
+
+    @property
+    def online(self):
+        return self.code == 200
+
+    @property
+    def address(self):
+        return f'unreal://{self.ip}:{self.gamePort}'
+
+    def apply(self, queryTypes, data: dict):
+        """Replaces the records covered by the given query types with those parsed from their (merged) reply"""
+        queryTypes = {utQueryBaseType(queryType) for queryType in queryTypes}
+        if queryTypes & {'info', 'status', 'basic', 'rules'}:
+            self.server = UTServerInfo(data)
+        if queryTypes & {'status', 'players'}:
+            self.players = tuple(UTPlayer(data, x) for x in range(utQueryInt(data.get('numplayers'))) if f'player_{x}' in data)
+        if 'teams' in queryTypes or 'score_0' in data:
+            self.teams = tuple(UTTeam(data, x) for x in itertools.takewhile(lambda x: f'score_{x}' in data, itertools.count()))
+        if 'objectives' in queryTypes:
+            self.objectives = tuple(UTObjective(data, x) for x in range(utQueryInt(data.get('fortcount'))))
+        if 'consolelog' in queryTypes:
+            self.consoleLog = data.get('consolelog')
+
+#########################################################################################
+# UT console relay
+#########################################################################################
+def watermarkAge(watermark: int):
+    """Seconds between now and a console watermark (YYYYmmddHHMMSSfff, as made by GameServer.format_new_watermark)"""
+    try:
+        stamp = datetime.strptime(str(watermark)[:17], '%Y%m%d%H%M%S%f').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return (datetime.now(timezone.utc) - stamp).total_seconds()
+
+class EmojiReplacer:
+    """Swaps :name: tokens in relayed chat for guild emojis in one pass, using a single precompiled alternation"""
+    def __init__(self, staticEmojis: dict = None, animatedEmojis: dict = None):
+        self.replacements = {}
+        for em, emojiId in (animatedEmojis or {}).items():
+            self.replacements[em] = f'<a{em}{emojiId}>'
+        # Static emojis win where a name is used by both, as they always have
+        for em, emojiId in (staticEmojis or {}).items():
+            self.replacements[em] = f'<{em}{emojiId}>'
+        self.pattern = None
+        if self.replacements:
+            # Longest names first, so the alternation prefers the most specific match
+            self.pattern = re.compile('|'.join(re.escape(em) for em in sorted(self.replacements, key=len, reverse=True)))
+
+    def sub(self, text: str):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(lambda match: self.replacements[match.group(0)], text)
+
+class ConsoleRelay:
+    """Buffers console lines for the reporter channel and sends them in as few messages as the Discord limit allows"""
+    def __init__(self, limit: int = DISCORD_MESSAGE_LIMIT):
+        self.limit = limit
+        self.lines = collections.deque()
+        self.sentWatermark = 0
+        self.lag = None
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, line: str, watermark: int = 0):
+        if len(line):
+            self.lines.append((line, watermark))
+
+    def takeMessage(self):
+        """Pops as many whole lines as fit in one message, splitting any single line that is too long by itself"""
+        parts = []
+        size = 0
+        watermark = 0
+        while self.lines:
+            line, stamp = self.lines[0]
+            if len(line) > self.limit:
+                if parts:
+                    break
+                self.lines[0] = (line[self.limit:], stamp)
+                return line[:self.limit], 0
+            newSize = size + len(line) + (1 if parts else 0)
+            if newSize > self.limit:
+                break
+            self.lines.popleft()
+            parts.append(line)
+            size = newSize
+            watermark = max(watermark, stamp)
+        return '\n'.join(parts), watermark
+
+    async def flush(self, channel):
+        async with self.lock:
+            while self.lines:
+                message, watermark = self.takeMessage()
+                try:
+                    await channel.send(message)
+                except discord.HTTPException as e:
+                    log.error(f'ConsoleRelay.flush() - failed to relay {len(message)} characters to {channel}: {e}')
+                    continue
+                if watermark > self.sentWatermark:
+                    self.sentWatermark = watermark
+        # Lag is how old the newest relayed line was by the time it reached the channel
+        self.lag = watermarkAge(self.sentWatermark)
+        if self.lag is not None:
+            log.debug(f'ConsoleRelay.flush() - relay lag {self.lag:.1f}s')
+
+class Scoreboard:
+    """A pug's stats card in the reporter channel, edited in place when its content changes"""
+    def __init__(self, editInterval: float = SCOREBOARD_EDIT_INTERVAL):
+        self.editInterval = editInterval
+        self.message = None
+        self.contentHash = None
+        self.lastEdit = 0
+        self.pending = None
+        self.task = None
+
+    async def update(self, channel, embed):
+        """Publishes the card, or holds it until the throttle allows; unchanged cards are dropped"""
+        contentHash = hash(json.dumps(embed.to_dict(), sort_keys=True))
+        if contentHash == self.contentHash:
+            return False
+        self.pending = (channel, embed, contentHash)
+        wait = self.lastEdit + self.editInterval - time.monotonic()
+        if wait > 0:
+            if self.task is None or self.task.done():
+                self.task = asyncio.get_running_loop().create_task(self.publish(wait))
+            return False
+        return await self.publish()
+
+    async def publish(self, delay: float = 0):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.pending is None:
+            return False
+        channel, embed, contentHash = self.pending
+        self.pending = None
+        try:
+            if self.message is not None and self.message.channel == channel:
+                try:
+                    await self.message.edit(embed=embed)
+                except discord.NotFound:
+                    # Deleted from the channel, so start a fresh card
+                    self.message = None
+            if self.message is None or self.message.channel != channel:
+                self.message = await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            log.error(f'Scoreboard.publish() - failed to update the scoreboard in {channel}: {e}')
+            return False
+        self.contentHash = contentHash
+        self.lastEdit = time.monotonic()
+        return True
+
+    def reset(self):
+        """Forgets the current card, so the next update posts a new one"""
+        if self.task is not None:
+            self.task.cancel()
+        self.message = None
+        self.contentHash = None
+        self.pending = None
+        self.task = None
+
+class PollScheduler:
+    """Tracks when each pug's reporter polls are next due, and caps the total polls sent per second"""
+    def __init__(self, maxPerSecond: float = UT_POLL_MAX_PER_SECOND):
+        self.maxPerSecond = maxPerSecond
+        self.nextRun = {}
+        self.failures = {}
+        self.tokens = maxPerSecond
+        self.tokenTime = time.monotonic()
+
+    def due(self, key):
+        return time.monotonic() >= self.nextRun.get(key, 0)
+
+    def acquire(self):
+        """Takes one poll from the per-second budget; False means the budget is spent until a later tick"""
+        now = time.monotonic()
+        self.tokens = min(self.maxPerSecond, self.tokens + (now - self.tokenTime) * self.maxPerSecond)
+        self.tokenTime = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def schedule(self, key, interval: float, failed: bool = False):
+        """Sets when a poll is next due; each consecutive failure doubles the interval, up to UT_POLL_BACKOFF_MAX"""
+        if failed:
+            self.failures[key] = self.failures.get(key, 0) + 1
+            interval = min(UT_POLL_BACKOFF_MAX, interval * 2 ** self.failures[key])
+        else:
+            self.failures.pop(key, None)
+        self.nextRun[key] = time.monotonic() + interval
+        return interval
+
+    def reset(self, pug):
+        """Makes every poll for a pug due straight away"""
+        for key in [k for k in self.nextRun if k[0] is pug]:
+            del self.nextRun[key]
+            self.failures.pop(key, None)
+
+    def prune(self, pugs):
+        """Forgets pugs that are no longer active"""
+        for key in [k for k in self.nextRun if k[0] not in pugs]:
+            del self.nextRun[key]
+            self.failures.pop(key, None)
+
+#########################################################################################
+# Outbound messages
+#########################################################################################
+def splitMessage(text: str, limit: int = DISCORD_MESSAGE_LIMIT):
+    """Splits text into chunks no longer than limit, on line boundaries where possible"""
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f'{current}\n{line}' if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+class OutboundQueue:
+    """Per-channel queue of outgoing messages: adjacent small messages are merged, long ones split, and sends paced to the channel rate limit"""
+    def __init__(self, limit: int = DISCORD_MESSAGE_LIMIT, rate: float = OUTBOUND_RATE, burst: int = OUTBOUND_BURST):
+        self.limit = limit
+        self.rate = rate
+        self.burst = burst
+        self.queues = {} # channelId -> deque of [target, content, embed, futures]
+        self.workers = {}
+        self.tokens = {} # channelId -> (tokens, monotonic time they were counted)
+
+    def post(self, target, content: str = None, embed: discord.Embed = None):
+        """Queues a message for the target (a channel or command context), returning a future resolved once it is sent.
+        Commands await it, so their later sends cannot overtake it; only callbacks that cannot await leave it unawaited."""
+        channel = target.channel if isinstance(target, commands.Context) else target
+        loop = asyncio.get_running_loop()
+        parts = splitMessage(content, self.limit) if content else [None]
+        queue = self.queues.setdefault(channel.id, collections.deque())
+        future = None
+        for i, part in enumerate(parts):
+            future = loop.create_future()
+            queue.append([target, part, embed if i == len(parts) - 1 else None, [future]])
+        if channel.id not in self.workers:
+            self.workers[channel.id] = loop.create_task(self.run(channel.id))
+        return future
+
+    def merge(self, queue):
+        """Pops the next message, folding in any plain text for the same target queued right behind it that still fits"""
+        target, content, embed, futures = queue.popleft()
+        while content is not None and embed is None and queue and queue[0][0] is target and queue[0][2] is None and queue[0][1] is not None:
+            if len(content) + 1 + len(queue[0][1]) > self.limit:
+                break
+            content = f'{content}\n{queue[0][1]}'
+            futures.extend(queue.popleft()[3])
+        return target, content, embed, futures
+
+    async def takeToken(self, channelId):
+        now = time.monotonic()
+        tokens, counted = self.tokens.get(channelId, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - counted) * self.rate)
+        if tokens < 1:
+            await asyncio.sleep((1 - tokens) / self.rate)
+            now = time.monotonic()
+            tokens = 1
+        self.tokens[channelId] = (tokens - 1, now)
+
+    async def run(self, channelId):
+        queue = self.queues[channelId]
+        try:
+            while queue:
+                # Messages queued while this waits for the rate limit are merged into the next send
+                await self.takeToken(channelId)
+                target, content, embed, futures = self.merge(queue)
+                message = None
+                try:
+                    message = await target.send(content, embed=embed)
+                except Exception as e:
+                    log.error(f'OutboundQueue.run() - failed to send to channel {channelId}: {e}')
+                for future in futures:
+                    if not future.done():
+                        future.set_result(message)
+        finally:
+            del self.workers[channelId]
+            if not queue:
+                self.queues.pop(channelId, None)
+
+    def close(self):
+        """Cancels pending sends, releasing anything awaiting them"""
+        for worker in list(self.workers.values()):
+            worker.cancel()
+        for queue in self.queues.values():
+            for entry in queue:
+                for future in entry[3]:
+                    if not future.done():
+                        future.cancel()
+        self.queues.clear()
+
+#########################################################################################
+# Ratings storage
+#########################################################################################
+# Ratings data is kept in memory by RatingsRepository in the JSON ratings file schema; a store persists it.
+# The database stores hold each mode, player rating and game as its own row, so a save only writes the rows that changed.
+# Tables: name, key columns, other columns
+RATINGS_STORE_TABLES = {
+    'meta': ('ranked_meta', ['key'], ['value']),
+    'modes': ('ranked_modes', ['mode'], ['position', 'settings']),
+    'ratings': ('ranked_ratings', ['mode', 'did'], ['data']),
+    'games': ('ranked_games', ['mode', 'gameref'], ['startdate', 'data'])
+}
+RATINGS_STORE_JSON_COLUMNS = ['value', 'settings', 'data']
+RATINGS_STORE_ORDER = {'meta': 'key', 'modes': 'position', 'ratings': 'did', 'games': 'startdate'}
+RATINGS_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ranked_meta (key TEXT PRIMARY KEY, value {json} NOT NULL);
+CREATE TABLE IF NOT EXISTS ranked_modes (mode TEXT PRIMARY KEY, position INTEGER NOT NULL, settings {json} NOT NULL);
+CREATE TABLE IF NOT EXISTS ranked_ratings (mode TEXT NOT NULL, did TEXT NOT NULL, data {json} NOT NULL, PRIMARY KEY (mode, did));
+CREATE TABLE IF NOT EXISTS ranked_games (mode TEXT NOT NULL, gameref TEXT NOT NULL, startdate TEXT NOT NULL, data {json} NOT NULL, PRIMARY KEY (mode, gameref));
+CREATE INDEX IF NOT EXISTS ranked_games_recent ON ranked_games (mode, startdate);
+CREATE INDEX IF NOT EXISTS ranked_games_ref ON ranked_games (mode, upper(gameref));
+"""
+
+def encodeRatings(value):
+    """json.dumps() default for the ratings data, which holds each ratinghistory as a RatingHistory"""
+    if isinstance(value, RatingHistory):
+        return value.entries
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def writeFileAtomic(path: str, payload: str):
+    """Writes beside the file then renames over it, so a crash mid-write never leaves it truncated"""
+    tempFile = f'{path}.tmp'
+    with open(tempFile, 'w') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tempFile, path)
+
+class RatingsStore(abc.ABC):
+    """Persists the ratings data held by RatingsRepository"""
+    async def open(self):
+        pass
+
+    @abc.abstractmethod
+    async def load(self):
+        """Returns the stored ratings data, or None if there is none"""
+
+    @abc.abstractmethod
+    async def save(self, data: dict, changes: dict):
+        """Stores the meta fields of data and the changed records given as MODE -> {'mode': name, 'record': the mode, or
+        None once deleted, 'ratings': {did: rating, or None once deleted}, 'games': {gameref: game}, 'complete': the
+        names of those maps that hold every record of the mode}. Reads the records before its first await."""
+
+    async def compact(self, data: dict):
+        """Background housekeeping; returns True if anything was done"""
+        return False
+
+    def modeNames(self, data: dict):
+        """Names of all stored modes, whether loaded or not"""
+        return [x['mode'] for x in data.get('rankedgames') or [] if 'mode' in x]
+
+    def unloaded(self):
+        """MODEs the store has left out of the data until they are asked for"""
+        return set()
+
+    async def loadModes(self, data: dict, modes: list = None):
+        """Adds the given modes (all if None) to data if the store left them unloaded, returning the names added"""
+        return []
+
+    def loadModesNow(self, data: dict, modes: list = None):
+        """loadModes() for callers that cannot await, blocking the event loop while the modes are read"""
+        return []
+
+    async def evictGames(self, mode: str, games: list):
+        """Lets the given games of a mode be dropped from memory, keeping them where findGame() and storedGames() read
+        them back. Returns False if the store cannot, in which case they stay in memory."""
+        return False
+
+    async def findGame(self, mode: str, gameref: str):
+        """A copy of a game dropped from memory by evictGames(), or None"""
+        return None
+
+    async def storedGames(self, mode: str):
+        """Copies of every game the store holds for a mode, possibly including some also in memory"""
+        return []
+
+    async def close(self):
+        pass
+
+class JsonRatingsStore(RatingsStore):
+    """The ratings data as JSON snapshots (a manifest plus one file per mode, in a directory named after the ratings file)
+    and an append-only journal of the changes made since. A mode's file is only read when the mode is first used.
+    Each save appends one fsynced journal line holding only the changed records (a ratinghistory is spliced from its
+    first changed entry rather than rewritten); compact() folds the journal into fresh snapshots of the modes it touched."""
+    def __init__(self, ratingsFile: str = DEFAULT_RATING_FILE):
+        self.ratingsFile = ratingsFile # single-file layout, migrated from on first load
+        self.shardDir = os.path.splitext(ratingsFile)[0]
+        self.manifestFile = os.path.join(self.shardDir, 'manifest.json')
+        self.journalFile = os.path.join(self.shardDir, 'journal')
+        self.seq = 0 # sequence number of the last journal entry written or read
+        self.manifestSeq = 0 # last journal entry included in the manifest
+        self.journalSize = 0
+        self.journalBroken = False # a partial journal line may be present, so the next save compacts first
+        self.saved = {} # (table, mode, key) -> record JSON as last saved; for ratings, (JSON without the history, history, its length)
+        self.shards = {} # MODE -> {'mode': name, 'seq': last journal entry in its file, 'loaded': bool}
+        self.pending = {} # MODE -> [(seq, ops)] from the journal, for modes not loaded yet
+        self.touched = set() # MODEs changed since their file was written
+        self.loading = {} # MODE -> task reading its file
+        self.archive = RankedGamesArchive(os.path.join(self.shardDir, 'archive'))
+
+    def shardFile(self, mode: str):
+        return os.path.join(self.shardDir, re.sub(r'[^A-Za-z0-9_-]', '_', mode) + '.json')
+
+    def records(self, data: dict, modes: set = None, meta: bool = True):
+        """Yields (table, mode, key) and record for the meta fields, the loaded modes, and the ratings and games of the
+        given MODEs (all if None)"""
+        if meta:
+            yield ('meta', '', ''), data
+        for x in data.get('rankedgames') or []:
+            if 'mode' not in x:
+                continue
+            mode = x['mode']
+            yield ('modes', '', mode), x
+            if modes is None or str(mode).upper() in modes:
+                for r in x.get('ratings') or []:
+                    yield ('ratings', mode, str(r['did'])), r
+                for g in x.get('games') or []:
+                    yield ('games', mode, g['gameref']), g
+
+    @staticmethod
+    def state(table: str, record: dict):
+        """What is kept of a record as last saved, to tell which of its fields a later save has to write"""
+        if table == 'ratings':
+            history = RatingHistory.of(record)
+            return (json.dumps({k: v for k, v in record.items() if k != 'ratinghistory'}), history, len(history))
+        skip = {'meta': ['rankedgames'], 'modes': ['ratings', 'games']}.get(table, [])
+        return json.dumps({k: v for k, v in record.items() if k not in skip})
+
+    def states(self, data: dict, modes: set = None, meta: bool = True):
+        return {ident: self.state(ident[0], record) for ident, record in self.records(data, modes, meta)}
+
+    @staticmethod
+    def opMode(op: list):
+        """The MODE a journal operation belongs to, or None for the meta fields"""
+        action, table, mode, key = op[:4]
+        if table == 'meta':
+            return None
+        return str(key if table == 'modes' else mode).upper()
+
+    def diff(self, data: dict, changes: dict):
+        """Journal operations for the meta fields and the changed records, the states they leave behind (None once
+        deleted), and the ratinghistory changes taken, to be handed back if the save fails"""
+        ops = []
+        states = {}
+        taken = []
+        def put(ident, record, text):
+            if self.saved.get(ident) != text:
+                ops.append(['put', *ident, record])
+                states[ident] = text
+        def delete(ident):
+            if ident in self.saved:
+                ops.append(['del', *ident])
+                states[ident] = None
+        meta = {k: v for k, v in data.items() if k != 'rankedgames'}
+        put(('meta', '', ''), meta, json.dumps(meta))
+        for key, change in changes.items():
+            mode = change['mode']
+            if change['record'] is None:
+                delete(('modes', '', mode)) # its ratings and games go with it
+                continue
+            settings = {k: v for k, v in change['record'].items() if k not in ['ratings', 'games']}
+            put(('modes', '', mode), settings, json.dumps(settings))
+            for did, r in change['ratings'].items():
+                ident = ('ratings', mode, str(did))
+                if r is None:
+                    delete(ident)
+                    continue
+                old = self.saved.get(ident)
+                fields = {k: v for k, v in r.items() if k != 'ratinghistory'}
+                text = json.dumps(fields)
+                history = r.get('ratinghistory', [])
+                start = history.takeChanges() if isinstance(history, RatingHistory) else None
+                taken.append((history, start))
+                if old is None or old[0] != text:
+                    ops.append(['put', *ident, fields])
+                if old is None or old[1] is not history:
+                    start = 0 if old is not None or len(history) else None
+                elif start is not None:
+                    start = min(start, old[2])
+                if start is not None:
+                    ops.append(['splice', *ident, 'ratinghistory', start, list(history[start:])])
+                states[ident] = (text, history, len(history))
+            for gameref, g in change['games'].items():
+                ident = ('games', mode, gameref)
+                put(ident, g, json.dumps(g))
+            for table in change['complete']:
+                current = {str(k) for k in change[table]}
+                for ident in [i for i in self.saved if i[0] == table and i[1] == mode and i[2] not in current]:
+                    delete(ident)
+        return ops, states, taken
+
+    def replay(self, data: dict, ops: list, found: dict):
+        """Applies journal operations to data; found maps (table, mode, key) to the records already in it. Operations on
+        records whose mode has since been deleted are skipped."""
+        data.setdefault('rankedgames', [])
+        children = {'modes': ['ratings', 'games'], 'ratings': ['ratinghistory']}
+        for op in ops:
+            action, table, mode, key = op[:4]
+            ident = (table, mode, key)
+            if table == 'meta':
+                if action in ['new', 'put']:
+                    data.update(op[4])
+                elif action == 'set':
+                    data[op[4]] = op[5]
+                elif action == 'unset':
+                    data.pop(op[4], None)
+                continue
+            parent = found.get(('modes', '', mode)) if table != 'modes' else None
+            record = found.get(ident)
+            if action in ['new', 'put']:
+                if record is None:
+                    record = dict(op[4])
+                    if table == 'modes':
+                        data['rankedgames'].append(record)
+                    elif parent is None:
+                        continue
+                    else:
+                        parent.setdefault(table, []).append(record)
+                    for child in children.get(table, []):
+                        record.setdefault(child, [])
+                    found[ident] = record
+                else:
+                    kept = {k: record[k] for k in children.get(table, []) if k in record and k not in op[4]}
+                    record.clear()
+                    record.update(op[4])
+                    record.update(kept)
+            elif record is None:
+                continue
+            elif action == 'splice':
+                record.setdefault(op[4], [])[op[5]:] = op[6]
+            elif action == 'set':
+                record[op[4]] = op[5]
+            elif action == 'add':
+                record.setdefault(op[4], []).extend(op[5])
+            elif action == 'unset':
+                record.pop(op[4], None)
+            elif action == 'del':
+                del found[ident]
+                if table == 'modes':
+                    siblings = data['rankedgames']
+                    for child in [i for i in found if i[0] != 'modes' and i[1] == key]:
+                        del found[child]
+                elif parent is not None:
+                    siblings = parent.get(table, [])
+                else:
+                    continue
+                siblings[:] = [x for x in siblings if x is not record]
+
+    def readJournal(self, journalFile: str, afterSeq: int):
+        """Journal entries after the given seq, the journal size in bytes, and whether it ends in a partial line"""
+        entries = []
+        journalSize = 0
+        partial = False
+        if os.path.exists(journalFile):
+            with open(journalFile, 'r') as f:
+                for line in f:
+                    journalSize += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        log.warning(f'JsonRatingsStore.readJournal() - ignoring a partly written entry at the end of {journalFile}')
+                        partial = True
+                        break
+                    if entry['seq'] > afterSeq:
+                        entries.append(entry)
+        return entries, journalSize, partial
+
+    def readLegacy(self):
+        """Reads the single-file layout, with its journal"""
+        with open(self.ratingsFile, 'r') as f:
+            data = json.load(f)
+        entries, journalSize, partial = self.readJournal(f'{self.ratingsFile}.journal', data.pop('journalseq', 0))
+        found = dict(self.records(data))
+        self.replay(data, [op for entry in entries for op in entry['ops']], found)
+        return data
+
+    def readManifest(self):
+        with open(self.manifestFile, 'r') as f:
+            manifest = json.load(f)
+        return (manifest,) + self.readJournal(self.journalFile, 0)
+
+    async def load(self):
+        if not os.path.exists(self.manifestFile):
+            log.debug(f'JsonRatingsStore.load() - no manifest in {self.shardDir}; reading {self.ratingsFile}')
+            try:
+                data = await asyncio.to_thread(self.readLegacy)
+            except (OSError, ValueError) as e:
+                log.warning(f'JsonRatingsStore.load() - could not read {self.ratingsFile}: {e}')
+                return None
+            log.info(f'JsonRatingsStore.load() - splitting {self.ratingsFile} into per-mode files in {self.shardDir}')
+            self.shards = {str(x['mode']).upper(): {'mode': x['mode'], 'seq': 0, 'loaded': True} for x in data.get('rankedgames') or [] if 'mode' in x}
+            self.touched = set(self.shards)
+            await self.writeSnapshot(data)
+            self.saved = self.states(data)
+            return data
+        log.debug(f'JsonRatingsStore.load() - reading {self.manifestFile}')
+        try:
+            manifest, entries, self.journalSize, self.journalBroken = await asyncio.to_thread(self.readManifest)
+        except (OSError, ValueError) as e:
+            log.warning(f'JsonRatingsStore.load() - could not read {self.manifestFile}: {e}')
+            return None
+        data = manifest['meta']
+        data['rankedgames'] = []
+        self.seq = self.manifestSeq = manifest['seq']
+        self.shards = {str(name).upper(): {'mode': name, 'seq': seq, 'loaded': False} for name, seq in manifest['modes']}
+        # Changes to the meta fields are applied now; the rest wait for their mode to be loaded
+        found = {('meta', '', ''): data}
+        for entry in entries:
+            self.seq = max(self.seq, entry['seq'])
+            for op in entry['ops']:
+                mode = self.opMode(op)
+                if mode is None:
+                    if entry['seq'] > self.manifestSeq:
+                        self.replay(data, [op], found)
+                    continue
+                if op[0] in ['new', 'put'] and op[1] == 'modes' and mode not in self.shards:
+                    # Created since the manifest was written; any file under its name belongs to a deleted mode
+                    self.shards[mode] = {'mode': op[3], 'seq': 0, 'loaded': False, 'fresh': True}
+                if mode in self.shards:
+                    self.pending.setdefault(mode, []).append((entry['seq'], op))
+                if op[0] == 'del' and op[1] == 'modes':
+                    self.shards.pop(mode, None)
+                    self.pending.pop(mode, None)
+        self.saved = self.states(data)
+        return data
+
+    def modeNames(self, data: dict):
+        names = self.modes(data) # includes modes added since the last save
+        for key, shard in self.shards.items():
+            names.setdefault(key, shard['mode'])
+        return list(names.values())
+
+    def unloaded(self):
+        return {key for key, shard in self.shards.items() if not shard['loaded']}
+
+    def readShard(self, shard: dict, ops: list):
+        """Reads a mode's file and applies its journal entries; touches nothing shared, so it runs in a worker thread.
+        Returns the mode (None if there is nothing of it), the journal entry its file ends at, the number of entries
+        applied, and its saved states."""
+        found = {}
+        part = {'rankedgames': []}
+        seq = shard['seq']
+        shardFile = self.shardFile(shard['mode'])
+        if os.path.exists(shardFile) and not shard.get('fresh'):
+            with open(shardFile, 'r') as f:
+                x = json.load(f)
+            seq = x.pop('journalseq', 0)
+            part['rankedgames'].append(x)
+            found = dict(self.records(part, meta=False))
+        ops = [op for opSeq, op in ops if opSeq > seq]
+        self.replay(part, ops, found)
+        return (part['rankedgames'] or [None])[0], seq, len(ops), self.states(part, meta=False)
+
+    def moveCorrupt(self, shard: dict, error: Exception):
+        """Moves an unreadable mode file aside, so the mode is rebuilt from the journal and its file rewritten"""
+        shardFile = self.shardFile(shard['mode'])
+        log.error(f'JsonRatingsStore.moveCorrupt() - could not parse {shardFile}: {error}; moving it to {shardFile}.corrupt')
+        os.replace(shardFile, f'{shardFile}.corrupt')
+        shard['fresh'] = True
+
+    def addShard(self, data: dict, key: str, result: tuple):
+        """Puts a mode read by readShard() into data, returning its name, or None if another load got there first"""
+        shard = self.shards.get(key)
+        if shard is None or shard['loaded']:
+            return None
+        x, shard['seq'], count, states = result
+        shard['loaded'] = True
+        self.pending.pop(key, None)
+        if count or shard.get('fresh'):
+            self.touched.add(key)
+        log.debug(f'JsonRatingsStore.addShard() - loaded {shard["mode"]} with {count} journal changes')
+        if x is None:
+            return None
+        data['rankedgames'].append(x)
+        self.saved.update(states)
+        return x['mode']
+
+    async def loadModes(self, data: dict, modes: list = None):
+        keys = self.unloaded() if modes is None else self.unloaded() & {str(m).upper() for m in modes}
+        added = []
+        for key in keys:
+            if key not in self.loading: # a load already under way is shared
+                self.loading[key] = asyncio.ensure_future(self.loadShard(data, key))
+            try:
+                name = await asyncio.shield(self.loading[key])
+            except (OSError, ValueError) as e:
+                log.error(f'JsonRatingsStore.loadModes() - could not read {key}: {e}')
+                continue
+            if name is not None:
+                added.append(name)
+        return added
+
+    async def loadShard(self, data: dict, key: str):
+        shard = self.shards[key]
+        ops = list(self.pending.get(key, []))
+        try:
+            try:
+                result = await asyncio.to_thread(self.readShard, shard, ops)
+            except ValueError as e:
+                await asyncio.to_thread(self.moveCorrupt, shard, e)
+                result = await asyncio.to_thread(self.readShard, shard, ops)
+            return self.addShard(data, key, result)
+        finally:
+            self.loading.pop(key, None)
+
+    def loadModesNow(self, data: dict, modes: list = None):
+        keys = self.unloaded() if modes is None else self.unloaded() & {str(m).upper() for m in modes}
+        added = []
+        for key in keys - set(self.loading):
+            shard = self.shards[key]
+            ops = list(self.pending.get(key, []))
+            try:
+                try:
+                    result = self.readShard(shard, ops)
+                except ValueError as e:
+                    self.moveCorrupt(shard, e)
+                    result = self.readShard(shard, ops)
+            except (OSError, ValueError) as e:
+                log.error(f'JsonRatingsStore.loadModesNow() - could not read {key}: {e}')
+                continue
+            name = self.addShard(data, key, result)
+            if name is not None:
+                added.append(name)
+        return added
+
+    def writeFiles(self, payloads: list):
+        os.makedirs(self.shardDir, exist_ok=True)
+        for path, payload in payloads:
+            writeFileAtomic(path, payload)
+
+    def append(self, line: str):
+        os.makedirs(self.shardDir, exist_ok=True)
+        with open(self.journalFile, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clearJournal(self):
+        with open(self.journalFile, 'w') as f:
+            os.fsync(f.fileno())
+
+    async def writeSnapshot(self, data: dict):
+        """Writes the files of the modes touched since their last snapshot, then the manifest, then empties the journal"""
+        await self.loadModes(data, list(self.pending)) # journal entries for unloaded modes must reach their files first
+        unread = self.unloaded() & set(self.pending)
+        if len(unread):
+            raise OSError(f'journal entries for {", ".join(sorted(unread))} could not be applied to their files')
+        payloads = []
+        for x in data.get('rankedgames') or []:
+            key = str(x.get('mode')).upper()
+            if key in self.touched and key in self.shards:
+                payloads.append((self.shardFile(x['mode']), json.dumps(dict(x, journalseq=self.seq), indent=4, default=encodeRatings)))
+                self.shards[key]['seq'] = self.seq
+        # Mode files go first and record the last journal entry they include, so a crash before the manifest or the
+        # journal is written never has an entry applied twice
+        manifest = {
+            'seq': self.seq,
+            'meta': {k: v for k, v in data.items() if k != 'rankedgames'},
+            'modes': [[shard['mode'], shard['seq']] for shard in self.shards.values()]
+        }
+        payloads.append((self.manifestFile, json.dumps(manifest, indent=4)))
+        await asyncio.to_thread(self.writeFiles, payloads)
+        await asyncio.to_thread(self.clearJournal)
+        self.manifestSeq = self.seq
+        self.touched = set()
+        self.journalSize = 0
+        self.journalBroken = False
+        log.debug(f'JsonRatingsStore.writeSnapshot() - wrote {len(payloads) - 1} mode files and the manifest up to journal entry {self.seq}')
+
+    async def save(self, data: dict, changes: dict):
+        if self.journalBroken or not len(self.saved): # nothing to journal against without a snapshot
+            for key, mode in self.modes(data).items():
+                self.shards.setdefault(key, {'mode': mode, 'seq': 0, 'loaded': True})
+                self.touched.add(key)
+            await self.writeSnapshot(data)
+            self.saved = self.states(data)
+            return
+        ops, states, taken = self.diff(data, changes)
+        if not len(ops):
+            return
+        try:
+            await self.journal(ops)
+        except Exception:
+            for history, start in taken:
+                if isinstance(history, RatingHistory):
+                    history.restoreChanges(start)
+            raise
+        for ident, state in states.items():
+            if state is not None:
+                self.saved[ident] = state
+            elif ident[0] == 'modes':
+                for child in [i for i in self.saved if i == ident or (i[0] != 'modes' and i[1] == ident[2])]:
+                    del self.saved[child]
+            else:
+                self.saved.pop(ident, None)
+        for op in ops:
+            mode = self.opMode(op)
+            if mode is None:
+                continue
+            if op[0] == 'del' and op[1] == 'modes':
+                self.shards.pop(mode, None)
+                self.touched.discard(mode)
+                continue
+            self.shards.setdefault(mode, {'mode': op[3] if op[1] == 'modes' else op[2], 'seq': 0, 'loaded': True})
+            self.touched.add(mode)
+
+    async def journal(self, ops: list):
+        """Appends one entry to the journal"""
+        line = json.dumps({'seq': self.seq + 1, 'ops': ops}, default=encodeRatings) + '\n'
+        try:
+            await asyncio.to_thread(self.append, line)
+        except OSError:
+            self.journalBroken = True
+            raise
+        self.seq += 1
+        self.journalSize += len(line)
+
+    async def evictGames(self, mode: str, games: list):
+        """Moves the games to the archive, then journals their removal from the mode's file"""
+        await asyncio.to_thread(self.archive.store, mode, copy.deepcopy(games))
+        idents = [('games', mode, g['gameref']) for g in games]
+        ops = [['del', *ident] for ident in idents if ident in self.saved]
+        if len(ops):
+            await self.journal(ops)
+            for ident in idents:
+                self.saved.pop(ident, None)
+            self.touched.add(str(mode).upper())
+        return True
+
+    async def findGame(self, mode: str, gameref: str):
+        return await asyncio.to_thread(self.archive.find, mode, gameref)
+
+    async def storedGames(self, mode: str):
+        return await asyncio.to_thread(self.archive.readAll, mode)
+
+    @staticmethod
+    def modes(data: dict):
+        return {str(x['mode']).upper(): x['mode'] for x in data.get('rankedgames') or [] if 'mode' in x}
+
+    async def compact(self, data: dict):
+        if self.journalSize < RATINGS_JOURNAL_COMPACT_BYTES and not self.journalBroken:
+            return False
+        await self.writeSnapshot(data)
+        return True
+
+class SqlRatingsStore(RatingsStore):
+    """Base for the database stores: maps the ratings data to rows and works out which rows a save has to write.
+    Only the meta fields and mode settings are read at start-up; a mode's ratings and its RATINGS_HOT_GAMES most recent
+    games are read by their key index when the mode is first used. Older games stay in the database, which serves them
+    back by index, so they can be dropped from memory without writing anything."""
+    def __init__(self):
+        self.saved = {'meta': {}, 'modes': {}} # key -> row as last saved
+        self.keys = {'ratings': {}, 'games': {}} # table -> mode -> keys of its saved rows
+        self.unread = {} # MODE -> name, for modes whose ratings and games have not been read
+
+    @abc.abstractmethod
+    def param(self, index: int, column: str):
+        """The placeholder for a query parameter"""
+
+    def selectColumn(self, column: str):
+        return column
+
+    def selectSql(self, table: str, byMode: bool = False, recent: int = 0):
+        name, keys, columns = RATINGS_STORE_TABLES[table]
+        where = f' WHERE mode = {self.param(1, "mode")}' if byMode else ''
+        order = f'{RATINGS_STORE_ORDER[table]} DESC LIMIT {int(recent)}' if recent else RATINGS_STORE_ORDER[table]
+        return f'SELECT {", ".join(self.selectColumn(c) for c in keys + columns)} FROM {name}{where} ORDER BY {order}'
+
+    def findGameSql(self):
+        return f'SELECT {self.selectColumn("data")} FROM ranked_games WHERE mode = {self.param(1, "mode")} AND upper(gameref) = upper({self.param(2, "gameref")})'
+
+    def upsertSql(self, table: str):
+        name, keys, columns = RATINGS_STORE_TABLES[table]
+        params = ', '.join(self.param(i, c) for i, c in enumerate(keys + columns, 1))
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns)
+        return f'INSERT INTO {name} ({", ".join(keys + columns)}) VALUES ({params}) ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}'
+
+    def deleteSql(self, table: str, keys: list = None):
+        name = RATINGS_STORE_TABLES[table][0]
+        keys = keys or RATINGS_STORE_TABLES[table][1]
+        return f'DELETE FROM {name} WHERE {" AND ".join(f"{c} = {self.param(i, c)}" for i, c in enumerate(keys, 1))}'
+
+    @abc.abstractmethod
+    async def query(self, sql: str, args: tuple = ()):
+        """Returns the rows, as tuples, of one query"""
+
+    @abc.abstractmethod
+    async def apply(self, statements: list):
+        """Runs each (sql, rows) statement for all of its rows, in one transaction"""
+
+    async def load(self):
+        meta = await self.query(self.selectSql('meta'))
+        modes = await self.query(self.selectSql('modes'))
+        if not len(modes) and not len(meta):
+            return None
+        data = {}
+        for key, value in meta:
+            data[key] = json.loads(value)
+            self.saved['meta'][key] = (key, json.dumps(data[key]))
+        data['rankedgames'] = []
+        for mode, position, settings in modes:
+            self.saved['modes'][mode] = (mode, position, json.dumps(json.loads(settings)))
+            self.unread[str(mode).upper()] = mode
+        return data
+
+    def modeNames(self, data: dict):
+        names = {str(name).upper(): name for name in super().modeNames(data)}
+        for key, name in self.unread.items():
+            names.setdefault(key, name)
+        return list(names.values())
+
+    def unloaded(self):
+        return set(self.unread)
+
+    def parseMode(self, mode: str, ratings: list, games: list):
+        """Builds a mode from its settings and rows; touches nothing shared, so it runs in a worker thread"""
+        x = json.loads(self.saved['modes'][mode][2])
+        x['ratings'] = [json.loads(value) for mode, did, value in ratings]
+        for r in x['ratings']:
+            RatingHistory.of(r)
+        x['games'] = [json.loads(value) for mode, gameref, startdate, value in sorted(games, key=lambda row: row[2])]
+        return x, {did for mode, did, value in ratings}, {gameref for mode, gameref, startdate, value in games}
+
+    def addMode(self, data: dict, key: str, result: tuple):
+        if key not in self.unread: # another load got there first
+            return None
+        x, self.keys['ratings'][x['mode']], self.keys['games'][x['mode']] = result
+        del self.unread[key]
+        data['rankedgames'].append(x)
+        return x['mode']
+
+    async def loadModes(self, data: dict, modes: list = None):
+        keys = self.unloaded() if modes is None else self.unloaded() & {str(m).upper() for m in modes}
+        added = []
+        for key in keys:
+            mode = self.unread[key]
+            try:
+                ratings = await self.query(self.selectSql('ratings', True), (mode,))
+                games = await self.query(self.selectSql('games', True, RATINGS_HOT_GAMES), (mode,))
+                name = self.addMode(data, key, await asyncio.to_thread(self.parseMode, mode, ratings, games))
+            except Exception as e:
+                log.error(f'{type(self).__name__}.loadModes() - could not read {mode}: {e}')
+                continue
+            if name is not None:
+                added.append(name)
+        return added
+
+    async def evictGames(self, mode: str, games: list):
+        return True # their rows stay
+
+    async def findGame(self, mode: str, gameref: str):
+        rows = await self.query(self.findGameSql(), (mode, gameref))
+        return json.loads(rows[0][0]) if len(rows) else None
+
+    async def storedGames(self, mode: str):
+        rows = await self.query(self.selectSql('games', True), (mode,))
+        return await asyncio.to_thread(lambda: [json.loads(value) for mode, gameref, startdate, value in rows])
+
+    def diff(self, data: dict, changes: dict):
+        """The statements writing the meta fields and the changed records, and the saved rows and keys they leave behind"""
+        saved = {'meta': {}, 'modes': {}}
+        keys = {'ratings': {}, 'games': {}}
+        upserts = {table: [] for table in RATINGS_STORE_TABLES}
+        deletes = {table: [] for table in RATINGS_STORE_TABLES}
+        for key, value in data.items():
+            if key != 'rankedgames':
+                saved['meta'][key] = (key, json.dumps(value))
+        positions = {str(x['mode']).upper(): i for i, x in enumerate(data.get('rankedgames') or []) if 'mode' in x}
+        modeDeletes = []
+        for key, change in changes.items():
+            mode = change['mode']
+            if change['record'] is None:
+                modeDeletes.append((mode,))
+                saved['modes'][mode] = None
+                keys['ratings'][mode] = keys['games'][mode] = set()
+                continue
+            settings = {k: v for k, v in change['record'].items() if k not in ['ratings', 'games']}
+            saved['modes'][mode] = (mode, positions.get(key, 0), json.dumps(settings))
+            for table, records in [('ratings', change['ratings']), ('games', change['games'])]:
+                current = set(self.keys[table].get(mode, ()))
+                if table == 'ratings' and table in change['complete']: # games evicted from memory keep their rows
+                    gone = current - {str(k) for k in records}
+                    deletes[table].extend((mode, k) for k in gone)
+                    current -= gone
+                for k, record in records.items():
+                    k = str(k)
+                    if record is None:
+                        if k in current:
+                            deletes[table].append((mode, k))
+                            current.discard(k)
+                    elif table == 'ratings':
+                        upserts[table].append((mode, k, json.dumps(record, default=encodeRatings)))
+                        current.add(k)
+                    else:
+                        upserts[table].append((mode, k, record['startdate'], json.dumps(record)))
+                        current.add(k)
+                keys[table][mode] = current
+        for table in ['meta', 'modes']:
+            upserts[table] = [row for k, row in saved[table].items() if row is not None and self.saved[table].get(k) != row]
+        deletes['meta'] = [(k,) for k in self.saved['meta'].keys() - saved['meta'].keys()]
+        statements = [(self.deleteSql(table, ['mode']), modeDeletes) for table in ['ratings', 'games', 'modes']]
+        statements += [(self.deleteSql(table), deletes[table]) for table in RATINGS_STORE_TABLES]
+        statements += [(self.upsertSql(table), upserts[table]) for table in RATINGS_STORE_TABLES]
+        return [(sql, rows) for sql, rows in statements if len(rows)], saved, keys
+
+    async def save(self, data: dict, changes: dict):
+        statements, saved, keys = self.diff(data, changes)
+        await self.apply(statements)
+        self.saved['meta'] = saved['meta']
+        for mode, row in saved['modes'].items():
+            if row is None:
+                self.saved['modes'].pop(mode, None)
+            else:
+                self.saved['modes'][mode] = row
+        for table in keys:
+            self.keys[table].update(keys[table])
+        log.debug(f'{type(self).__name__}.save() - wrote {sum(len(rows) for sql, rows in statements)} rows in {len(statements)} statements')
+
+class SqliteRatingsStore(SqlRatingsStore):
+    """Ratings in a local SQLite database file"""
+    def __init__(self, path: str = DEFAULT_RATING_DB):
+        super().__init__()
+        self.path = path
+        self.db = None
+
+    def param(self, index: int, column: str):
+        return '?'
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(RATINGS_STORE_SCHEMA.format(json='TEXT'))
+        return db
+
+    async def open(self):
+        self.db = await asyncio.to_thread(self.connect)
+
+    def fetchRows(self, sql: str, args: tuple = ()):
+        return self.db.execute(sql, args).fetchall()
+
+    async def query(self, sql: str, args: tuple = ()):
+        return await asyncio.to_thread(self.fetchRows, sql, args)
+
+    def loadModesNow(self, data: dict, modes: list = None):
+        keys = self.unloaded() if modes is None else self.unloaded() & {str(m).upper() for m in modes}
+        added = []
+        for key in keys:
+            mode = self.unread[key]
+            result = self.parseMode(mode, self.fetchRows(self.selectSql('ratings', True), (mode,)), self.fetchRows(self.selectSql('games', True, RATINGS_HOT_GAMES), (mode,)))
+            added.append(self.addMode(data, key, result))
+        return [name for name in added if name is not None]
+
+    def write(self, statements: list):
+        with self.db:
+            for sql, rows in statements:
+                self.db.executemany(sql, rows)
+
+    async def apply(self, statements: list):
+        await asyncio.to_thread(self.write, statements)
+
+    async def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+class PostgresRatingsStore(SqlRatingsStore):
+    """Ratings in a Postgres database, with the JSON held as jsonb"""
+    def __init__(self, dsn: str):
+        super().__init__()
+        self.dsn = dsn
+        self.pool = None
+
+    def param(self, index: int, column: str):
+        return f'${index}::jsonb' if column in RATINGS_STORE_JSON_COLUMNS else f'${index}'
+
+    def selectColumn(self, column: str):
+        return f'{column}::text' if column in RATINGS_STORE_JSON_COLUMNS else column
+
+    async def open(self):
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=2)
+        async with self.pool.acquire() as db:
+            await db.execute(RATINGS_STORE_SCHEMA.format(json='JSONB'))
+
+    async def query(self, sql: str, args: tuple = ()):
+        async with self.pool.acquire() as db:
+            return [tuple(r) for r in await db.fetch(sql, *args)]
+
+    async def apply(self, statements: list):
+        async with self.pool.acquire() as db:
+            async with db.transaction():
+                for sql, rows in statements:
+                    await db.executemany(sql, rows)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+def makeRatingsStore(configFile: str = DEFAULT_CONFIG_FILE, ratingsFile: str = DEFAULT_RATING_FILE):
+    """Creates the ratings store named by ratingsstore.backend in the config file: json (default), sqlite or postgres"""
+    try:
+        with open(configFile) as f:
+            storeInfo = json.load(f).get('ratingsstore', {})
+    except (OSError, ValueError) as e:
+        log.warning(f'makeRatingsStore() - could not read {configFile}: {e}')
+        storeInfo = {}
+    backend = str(storeInfo.get('backend', 'json')).lower()
+    if backend == 'sqlite':
+        return SqliteRatingsStore(storeInfo.get('path') or DEFAULT_RATING_DB)
+    if backend == 'postgres':
+        if storeInfo.get('dsn'):
+            return PostgresRatingsStore(storeInfo['dsn'])
+        log.warning('makeRatingsStore() - ratingsstore.dsn is required for the postgres backend; using the JSON ratings file')
+    elif backend != 'json':
+        log.warning(f'makeRatingsStore() - unknown ratingsstore.backend: {backend}; using the JSON ratings file')
+    return JsonRatingsStore(ratingsFile)
+
+class RankedGamesArchive:
+    """Ranked games moved out of the ratings data, as one JSON file per mode and month (by start date) with an index of
+    which month holds each game. Files are read only when an archived game is asked for; every method may touch the
+    files, so the JSON store calls them from a worker thread."""
+    def __init__(self, archiveDir: str):
+        self.archiveDir = archiveDir
+        self.indexes = {} # MODE -> {GAMEREF: month}
+
+    def modeDir(self, mode: str):
+        return os.path.join(self.archiveDir, re.sub(r'[^A-Za-z0-9_-]', '_', mode))
+
+    def index(self, mode: str):
+        key = str(mode).upper()
+        if key not in self.indexes:
+            indexFile = os.path.join(self.modeDir(mode), 'index.json')
+            try:
+                with open(indexFile, 'r') as f:
+                    self.indexes[key] = json.load(f)
+            except FileNotFoundError:
+                self.indexes[key] = {}
+        return self.indexes[key]
+
+    def months(self, mode: str):
+        return sorted(set(self.index(mode).values()))
+
+    def read(self, mode: str, month: str):
+        """Games archived for a mode in the given month (YYYY-MM), oldest first"""
+        try:
+            with open(os.path.join(self.modeDir(mode), f'{month}.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def readAll(self, mode: str):
+        """Every game archived for a mode, oldest first"""
+        return [g for month in self.months(mode) for g in self.read(mode, month)]
+
+    def find(self, mode: str, gameref: str):
+        month = self.index(mode).get(str(gameref).upper())
+        if month is None:
+            return None
+        for g in self.read(mode, month):
+            if str(g['gameref']).upper() == str(gameref).upper():
+                return g
+        return None
+
+    def store(self, mode: str, games: list):
+        """Adds games to (or replaces them in) their month files, then updates the index"""
+        byMonth = {}
+        for g in games:
+            byMonth.setdefault(g['startdate'][:7], []).append(g)
+        os.makedirs(self.modeDir(mode), exist_ok=True)
+        index = dict(self.index(mode))
+        for month, monthGames in byMonth.items():
+            refs = {str(g['gameref']).upper() for g in monthGames}
+            merged = [g for g in self.read(mode, month) if str(g['gameref']).upper() not in refs] + monthGames
+            merged.sort(key=lambda g: datetime.fromisoformat(g['startdate']))
+            writeFileAtomic(os.path.join(self.modeDir(mode), f'{month}.json'), json.dumps(merged, indent=4))
+            index.update({ref: month for ref in refs})
+        writeFileAtomic(os.path.join(self.modeDir(mode), 'index.json'), json.dumps(index))
+        self.indexes[str(mode).upper()] = index
+
+#########################################################################################
+# Ratings repository
+#########################################################################################
+class RatingHistory(collections.abc.Sequence):
+    """A player's ratinghistory entries in match date order, with the dates parsed once into epoch microseconds (times)
+    so a new entry is placed by bisection instead of re-sorting. It reads like a list, but only append(), extend() and
+    pop() change it, which keeps the entries and times in step. Entries keep their ISO matchdate, which is what gets
+    saved (see encodeRatings())."""
+    def __init__(self, entries: list = ()):
+        entries = list(entries)
+        times = [self.timeOf(h) for h in entries]
+        order = sorted(range(len(entries)), key=times.__getitem__)
+        self.entries = [entries[i] for i in order]
+        self.times = [times[i] for i in order]
+        self.changedFrom = None # lowest index changed since a store last took the changes
+
+    def __getitem__(self, index):
+        return self.entries[index] # a slice is a plain list copy
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __eq__(self, other):
+        if isinstance(other, RatingHistory):
+            other = other.entries
+        return self.entries == other if isinstance(other, list) else NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'RatingHistory({self.entries!r})'
+
+    def __reduce__(self):
+        return (RatingHistory, (self.entries,))
+
+    @staticmethod
+    def timeOf(entry: dict):
+        try:
+            return int(datetime.fromisoformat(entry['matchdate']).timestamp() * 1000000)
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning(f'RatingHistory.timeOf() - unreadable matchdate, sorting the entry first: {e} ({str(entry)[:100]})')
+            return 0
+
+    @classmethod
+    def of(cls, rating: dict):
+        """The rating's history, converted in place if it is missing or still a plain list"""
+        history = rating.get('ratinghistory')
+        if not isinstance(history, cls):
+            history = rating['ratinghistory'] = cls(history or [])
+        return history
+
+    def changed(self, index: int):
+        self.changedFrom = index if self.changedFrom is None else min(self.changedFrom, index)
+
+    def takeChanges(self):
+        """The lowest index changed since the last call, or None; a store saves the entries from there on"""
+        start = self.changedFrom
+        self.changedFrom = None
+        return start
+
+    def restoreChanges(self, start: int):
+        """Hands back changes taken by a save that failed"""
+        if start is not None:
+            self.changed(start)
+
+    def append(self, entry: dict):
+        """Adds an entry in match date order, after any with the same date"""
+        t = self.timeOf(entry)
+        i = bisect.bisect_right(self.times, t)
+        self.entries.insert(i, entry)
+        self.times.insert(i, t)
+        self.changed(i)
+
+    def extend(self, entries: list):
+        for entry in entries:
+            self.append(entry)
+
+    def pop(self, index: int = -1):
+        index = range(len(self.entries))[index]
+        self.times.pop(index)
+        self.changed(index)
+        return self.entries.pop(index)
+
+    def newestFirst(self):
+        return list(reversed(self.entries))
+
+class RatingsRepository:
+    """Ranked ratings data for all modes, loaded from a RatingsStore and indexed in memory. Stores that keep each mode
+    separately only have a mode read, in the background, when load() is first asked for it. Each mode keeps its RATINGS_HOT_GAMES most recent
+    games in memory; once saved, flush() lets the store evict older ones, which findGame() and allGames() read back.
+    Changes are recorded with markDirty(), which has flush() write them to the store as soon as the event loop is free."""
+    def __init__(self, store: RatingsStore = None, ratingsFile: str = DEFAULT_RATING_FILE):
+        self.ratingsFile = ratingsFile
+        self.store = store if store is not None else JsonRatingsStore(ratingsFile)
+        self.data = None
+        self.modes = {} # MODE -> ranked mode data
+        self.ratingsByDid = {} # MODE -> {did: player rating}
+        self.gamesByRef = {} # MODE -> {GAMEREF: game}
+        self.gamesByDate = {} # MODE -> games, oldest first
+        self.registrations = {} # MODE -> set of registered dids
+        self.dirty = {} # MODE -> {'mode': name, 'ratings': dids, 'games': GAMEREFs} changed since the last flush; None for all
+        self.lock = asyncio.Lock()
+        self.flushTask = None
+        self.opened = False
+
+    async def open(self):
+        """Loads the ratings data from the store. An empty database store is first filled from the JSON ratings file."""
+        await self.store.open()
+        self.data = await self.store.load()
+        if self.data is None and not isinstance(self.store, JsonRatingsStore):
+            jsonStore = JsonRatingsStore(self.ratingsFile)
+            self.data = await jsonStore.load()
+            if self.data is not None:
+                await jsonStore.loadModes(self.data)
+                log.info(f'RatingsRepository.open() - importing {self.ratingsFile} into {type(self.store).__name__}')
+                self.reindex()
+                for key, x in self.modes.items():
+                    self.noteChange(key, x['mode'])
+                await self.flush()
+        self.reindex()
+        self.opened = True
+        return self.data
+
+    def checkOpen(self):
+        """Raises if the repository is used before open() has loaded it"""
+        if not self.opened:
+            raise RuntimeError('RatingsRepository used before open() was awaited')
+
+    async def close(self):
+        await self.flush()
+        await self.store.close()
+
+    async def load(self, modes: list = None):
+        """Has the store read the given modes (every mode if None) that it left unloaded, off the event loop"""
+        self.checkOpen()
+        if self.data is not None:
+            for name in await self.store.loadModes(self.data, None if modes is None else [str(m) for m in modes if m]):
+                self.reindex(name)
+
+    def get(self, mode: str = None):
+        """Returns the live ratings data. Modes are read by load(), which commands await before they run; one still unread
+        is read here instead, blocking the event loop."""
+        self.checkOpen()
+        if self.data is not None:
+            unloaded = self.store.unloaded() if mode is None else self.store.unloaded() & {str(mode).upper()}
+            if len(unloaded):
+                log.warning(f'RatingsRepository.get() - reading {", ".join(sorted(unloaded))} on the event loop; await load() first')
+                for name in self.store.loadModesNow(self.data, list(unloaded)):
+                    self.reindex(name)
+        return self.data
+
+    def ensureMode(self, mode: str):
+        """Makes sure a mode the store has is loaded, returning its MODE key"""
+        key = str(mode).upper()
+        if key not in self.modes:
+            self.get(mode)
+        return key
+
+    def indexLoaded(self):
+        """Indexes modes the store has loaded by itself (e.g. to compact them)"""
+        for x in self.data.get('rankedgames') or [] if self.data else []:
+            if 'mode' in x and str(x['mode']).upper() not in self.modes:
+                self.reindex(x['mode'])
+
+    def modeNames(self):
+        """Names of every ranked mode, loaded or not"""
+        self.checkOpen()
+        return self.store.modeNames(self.data) if self.data is not None else []
+
+    def reindex(self, mode: str = None):
+        """Rebuilds the indexes for one mode, or for all modes"""
+        for index in [self.modes, self.ratingsByDid, self.gamesByRef, self.gamesByDate, self.registrations]:
+            if mode is None:
+                index.clear()
+            else:
+                index.pop(mode.upper(), None)
+        rankedGames = self.data.get('rankedgames') if self.data else None
+        for x in rankedGames or []:
+            if 'mode' not in x or (mode is not None and str(x['mode']).upper() != mode.upper()):
+                continue
+            key = str(x['mode']).upper()
+            self.modes[key] = x
+            self.ratingsByDid[key] = {r['did']: r for r in x.get('ratings') or []}
+            for r in self.ratingsByDid[key].values():
+                RatingHistory.of(r)
+            games = x.get('games') or []
+            self.gamesByRef[key] = {str(g['gameref']).upper(): g for g in games}
+            self.gamesByDate[key] = sorted(games, key=lambda g: datetime.fromisoformat(g['startdate']))
+            self.registrations[key] = set(x.get('registrations') or [])
+            if len(games) > RATINGS_HOT_GAMES:
+                self.noteChange(key, x['mode'], (), ()) # the next flush evicts the oldest
+
+    def replaceModes(self, rankedGames: list):
+        """Swaps in a new list of ranked modes, unless it is already the live one"""
+        if self.data is None:
+            self.data = {}
+        if rankedGames is not self.data.get('rankedgames'):
+            self.data['rankedgames'] = rankedGames
+
+    def markDirty(self, mode: str = None, ratings: list = None, games: list = None):
+        """Records that a mode (or every mode) has changed, filling in missing settings and refreshing its indexes.
+        Naming the changed player ratings (by did) and games (by gameref) has only those saved with the mode settings;
+        None saves all of them. A mode no longer in the data is deleted from the store."""
+        self.checkOpen()
+        if self.data is None:
+            return
+        found = set()
+        for x in self.data.get('rankedgames') or []:
+            if 'mode' not in x or (mode is not None and str(x['mode']).upper() != mode.upper()):
+                continue
+            x['lastupdated'] = datetime.now().isoformat()
+            for key in ['maps','eligibility','registrations','ratings','lastsync','fixedpicklimit','startmapfrompick','capMode','capWindow','capRole','games','scoring','lastupdated','randomorder']:
+                if key not in x:
+                    if key in ['registrations','ratings','games']:
+                        x[key] = []
+                    elif key in ['maps','scoring']:
+                        x[key] = {}
+                    else:
+                        x[key] = ""
+            key = str(x['mode']).upper()
+            if key in self.modes:
+                self.noteChange(key, x['mode'], ratings, games)
+            else:
+                self.noteChange(key, x['mode']) # new, so everything in it is
+            found.add(key)
+        for key in [k for k in self.modes if k not in found and (mode is None or k == mode.upper())]:
+            self.noteChange(key, self.modes[key]['mode'])
+        if mode is None:
+            self.reindex()
+        else:
+            self.reindex(mode)
+        self.scheduleFlush()
+
+    def noteChange(self, key: str, name: str, ratings: list = None, games: list = None):
+        """Adds to the records of a mode to be saved by the next flush"""
+        change = self.dirty.setdefault(key, {'mode': name, 'ratings': set(), 'games': set()})
+        change['mode'] = name
+        for kind, ids in [('ratings', ratings), ('games', games)]:
+            if ids is None:
+                change[kind] = None
+            elif change[kind] is not None:
+                change[kind].update(str(i).upper() if kind == 'games' else i for i in ids)
+
+    def takeChanges(self):
+        """Clears the dirty record ids, returning the changes they name for RatingsStore.save()"""
+        changes = {}
+        for key, change in self.dirty.items():
+            x = self.modes.get(key)
+            if x is None:
+                changes[key] = {'mode': change['mode'], 'record': None, 'ratings': {}, 'games': {}, 'complete': []}
+                continue
+            ratings = self.ratingsByDid.get(key, {})
+            games = self.gamesByRef.get(key, {})
+            changes[key] = {
+                'mode': x['mode'],
+                'record': x,
+                'ratings': {str(did): r for did, r in ratings.items()} if change['ratings'] is None else {str(did): ratings.get(did) for did in change['ratings']},
+                'games': {g['gameref']: g for g in games.values()} if change['games'] is None else {games[ref]['gameref']: games[ref] for ref in change['games'] if ref in games},
+                'complete': [kind for kind in ['ratings', 'games'] if change[kind] is None]
+            }
+        dirty = self.dirty
+        self.dirty = {}
+        return changes, dirty
+
+    def restoreChanges(self, dirty: dict):
+        """Puts back the dirty record ids of a flush that failed"""
+        for key, change in dirty.items():
+            self.noteChange(key, change['mode'], change['ratings'], change['games'])
+
+    def scheduleFlush(self):
+        """Starts a flush unless one is already running, which will pick up this change before it finishes"""
+        if self.flushTask is not None and not self.flushTask.done():
+            return
+        try:
+            self.flushTask = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            pass # no event loop yet; flushRatings() will catch up
+
+    def getMode(self, mode: str):
+        return self.modes.get(self.ensureMode(mode))
+
+    def getRating(self, mode: str, did: int):
+        return self.ratingsByDid.get(self.ensureMode(mode), {}).get(did)
+
+    def getRatingByName(self, mode: str, name: str):
+        """Finds a player rating by last known nickname"""
+        for r in self.ratingsByDid.get(self.ensureMode(mode), {}).values():
+            if str(r.get('dlastnick', '')).lower() == name.lower():
+                return r
+        return None
+
+    def isRegistered(self, mode: str, did: int):
+        registrations = self.registrations.get(self.ensureMode(mode), ())
+        return did in registrations or str(did) in registrations
+
+    def getGame(self, mode: str, gameref: str):
+        """Finds a game by reference among the recent games held in memory"""
+        return self.gamesByRef.get(self.ensureMode(mode), {}).get(str(gameref).upper())
+
+    async def findGame(self, mode: str, gameref: str):
+        """Finds a game by reference, asking the store for one evicted from memory. An evicted game is a copy for reading;
+        restoreGame() it before changing it."""
+        await self.load([mode])
+        game = self.getGame(mode, gameref)
+        if game is None and str(mode).upper() in self.modes:
+            try:
+                game = await self.store.findGame(self.modes[str(mode).upper()]['mode'], gameref)
+            except (OSError, ValueError) as e:
+                log.warning(f'RatingsRepository.findGame() - could not read {gameref} for {mode}: {e}')
+        return game
+
+    async def restoreGame(self, mode: str, gameref: str):
+        """Puts a game evicted from memory back with the recent games, so it can be changed (and is evicted again once
+        saved). Returns the live game, or None if there is no such game."""
+        game = await self.findGame(mode, gameref)
+        key = str(mode).upper()
+        if game is None or key not in self.modes:
+            return None
+        live = self.getGame(mode, gameref)
+        if live is not None: # held in memory, or restored by someone else while the store was read
+            return live
+        x = self.modes[key]
+        x.setdefault('games', []).append(game)
+        self.reindex(x['mode'])
+        self.noteChange(key, x['mode'], (), [game['gameref']])
+        log.debug(f'RatingsRepository.restoreGame() - restored {gameref} for {x["mode"]}')
+        return game
+
+    def recentGames(self, mode: str):
+        """Games for a mode still held in memory, most recent first"""
+        return list(reversed(self.gamesByDate.get(self.ensureMode(mode), [])))
+
+    async def allGames(self, mode: str):
+        """Every game for a mode, oldest first, with those held in memory in place of the store's copies"""
+        await self.load([mode])
+        key = str(mode).upper()
+        if key not in self.modes:
+            return []
+        try:
+            stored = await self.store.storedGames(self.modes[key]['mode'])
+        except (OSError, ValueError) as e:
+            log.warning(f'RatingsRepository.allGames() - could not read the stored {mode} games: {e}')
+            stored = []
+        recent = self.gamesByDate.get(key, [])
+        refs = self.gamesByRef.get(key, {})
+        older = sorted((g for g in stored if str(g['gameref']).upper() not in refs), key=lambda g: datetime.fromisoformat(g['startdate']))
+        return list(heapq.merge(older, recent, key=lambda g: datetime.fromisoformat(g['startdate'])))
+
+    async def evictGames(self, keys: list):
+        """Drops all but the RATINGS_HOT_GAMES most recent games of the given (just saved) modes from memory, leaving them
+        to the store. Games changed again while the store was busy stay until they have been saved."""
+        for key in keys:
+            games = self.gamesByDate.get(key, [])
+            if len(games) <= RATINGS_HOT_GAMES:
+                continue
+            x = self.modes[key]
+            old = games[:-RATINGS_HOT_GAMES]
+            try:
+                if not await self.store.evictGames(x['mode'], old):
+                    continue
+            except (OSError, ValueError) as e:
+                log.warning(f'RatingsRepository.evictGames() - could not evict {x["mode"]} games: {e}')
+                continue
+            if self.modes.get(key) is not x:
+                continue # replaced while the store was busy
+            change = self.dirty.get(key, {'games': set()})
+            if change['games'] is None:
+                continue
+            moved = {id(g) for g in old if str(g['gameref']).upper() not in change['games']}
+            x['games'][:] = [g for g in x['games'] if id(g) not in moved]
+            self.reindex(x['mode'])
+            log.debug(f'RatingsRepository.evictGames() - evicted {len(moved)} {x["mode"]} games')
+
+    async def flush(self):
+        """Saves any changes made since the last flush, including those made while saving"""
+        async with self.lock:
+            saved = False
+            while self.dirty and self.data is not None:
+                changes, dirty = self.takeChanges()
+                self.data['savedate'] = datetime.now().isoformat()
+                try:
+                    await self.store.save(self.data, changes)
+                except Exception as e:
+                    self.restoreChanges(dirty)
+                    log.error(f'RatingsRepository.flush() - failed to save ratings to {type(self.store).__name__}: {e}')
+                    return False
+                log.debug(f'RatingsRepository.flush() - saved ratings for {", ".join(sorted(changes))}')
+                saved = True
+                await self.evictGames([key for key in changes if key in self.modes])
+            self.indexLoaded()
+            return saved
+
+    async def compact(self):
+        """Lets the store tidy up (e.g. fold its journal into a snapshot) between saves"""
+        async with self.lock:
+            if self.data is None:
+                return False
+            try:
+                compacted = await self.store.compact(self.data)
+            except Exception as e:
+                log.error(f'RatingsRepository.compact() - failed to compact {type(self.store).__name__}: {e}')
+                compacted = False
+            self.indexLoaded()
+            return compacted
+
 #########################################################################################
 # CLASS
 #########################################################################################
@@ -752,78 +2836,30 @@ class PugTeams(Players):
 #########################################################################################
 # CLASS
 #########################################################################################
-class GameServer:
-    def __init__(self, configFile=DEFAULT_CONFIG_FILE, parent=None, channelId=None):
-        # Initialise the class with hardcoded defaults, then parse in JSON config
-        self.parent = parent
-        self.channelId = channelId
+class ServerRegistry:
+    """Process-wide server list and setup API settings, shared by every GameServer.
+    Loaded once from the config file, then re-validated against the setup API in the background once the TTL expires."""
+    def __init__(self, configFile=DEFAULT_CONFIG_FILE, ttl: int = DEFAULT_SERVER_REGISTRY_TTL):
         self.configFile = configFile
+        self.ttl = timedelta(seconds=ttl)
         self.configMaps = []
 
-        # POST server, game server and map thumbnails / info:
+        # POST server, map thumbnails and API settings:
         self.postServer = DEFAULT_POST_SERVER
         self.authtoken = DEFAULT_POST_TOKEN
         self.thumbnailServer = DEFAULT_THUMBNAIL_SERVER
+        self.apiTimeouts = dict(DEFAULT_API_TIMEOUTS)
+        self.setupDeadline = DEFAULT_SETUP_DEADLINE
 
-        # All servers
-        if parent is not None and parent.parent is not None and parent.parent.cachedServers is not None and (datetime.now() - parent.parent.cachedServersTime) < timedelta(minutes=10):
-            log.debug('GameServer(): Using cached server list from grandparent PUG instance.')
-            self.allServers = parent.parent.cachedServers
-        else:
-            self.allServers = DEFAULT_SERVER_LIST
-
-        # Chosen game server details
-        self.gameServerRef = DEFAULT_GAME_SERVER_REF
-        self.gameServerIP = DEFAULT_GAME_SERVER_IP
-        self.gameServerPort = DEFAULT_GAME_SERVER_PORT
-        self.gameServerName = DEFAULT_GAME_SERVER_NAME
-        self.gameServerState = ''
-        self.gameServerOnDemand = False
-        self.gameServerOnDemandReady = True
+        # All servers, the default server and the weekly rotation
+        self.allServers = list(DEFAULT_SERVER_LIST)
+        self.defaultServerRef = DEFAULT_GAME_SERVER_REF
         self.gameServerRotation = []
 
-        # Setup details and live score
-        self.redPassword = DEFAULT_RED_PASSWORD
-        self.bluePassword = DEFAULT_BLUE_PASSWORD
-        self.redScore = 0
-        self.blueScore = 0
-        self.spectatorPassword = DEFAULT_SPECTATOR_PASSWORD
-        self.numSpectators = DEFAULT_NUM_SPECTATORS
-        self.matchCode = ''
-        self.lastMatchCode = ''
-
-        # We keep a track of the server's match status and also if we have used "endMatch" since the last server setup, which
-        # can be used to override the updating matchInProgress when a match has been ended since the last server setup.
-        # This avoids the need to wait for the last map to complete before the server shows as match finished.
-        self.matchInProgress = False
-        self.endMatchPerformed = False
-
-        # Store the responses from the setup server.
-        self.lastSetupResult = ''
-        self.lastCheckJSON = {}
-        self.lastSetupJSON = {}
-        self.lastEndGameJSON = {}
-
-        self.lastUpdateTime = datetime.now()
+        self.refreshTime = None
+        self.refreshTask = None
 
         self.loadServerConfig(configFile)
-        if self.allServers == DEFAULT_SERVER_LIST or parent.parent.cachedServersTime is 0 or (datetime.now() - parent.parent.cachedServersTime) > timedelta(minutes=10):
-            self.validateServers()
-            log.debug('GameServer(): Caching server list in grandparent PUG instance.')
-            parent.parent.cachedServers = self.allServers
-            parent.parent.cachedServersTime = datetime.now()
-        self.updateServerStatus()
-        
-        # Stream GameSpy Unreal Query data using UDP sockets to send packets to the query port of the target server, then
-        # receive back data into an array. Protocol info: https://wiki.beyondunreal.com/Legacy:UT_Server_Query
-        # UTA servers extend the protocol server-side to offer Assault-related info and Event streams (e.g. chat)
-        self.udpSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udpSock.settimeout(3)
-        self.utQueryStatsActive = False
-        self.utQueryReporterActive = False
-        self.utQueryConsoleWatermark = self.format_new_watermark
-        self.utQueryData = {}
-        self.utQueryEmbedCache = {}
 
     # Load configuration defaults (some of this will later be superceded by live API data)
     def loadServerConfig(self, configFile):
@@ -836,6 +2872,18 @@ class GameServer:
                         self.postServer = setupapi['postserver']
                     if 'authtoken' in setupapi:
                         self.authtoken = info['setupapi']['authtoken']
+                    if 'timeouts' in setupapi and isinstance(setupapi['timeouts'], dict):
+                        for callType, t in setupapi['timeouts'].items():
+                            try:
+                                self.apiTimeouts[callType] = Timeout(float(t[0]), float(t[1]))
+                            except (TypeError, ValueError, IndexError):
+                                log.warning(f'Invalid setupapi timeout for {callType}: {t}')
+                    if 'setupdeadline' in setupapi:
+                        try:
+                            self.setupDeadline = float(setupapi['setupdeadline'])
+                        except (TypeError, ValueError):
+                            log.warning(f'Invalid setupapi setupdeadline: {setupapi["setupdeadline"]}; using {DEFAULT_SETUP_DEADLINE}')
+                            self.setupDeadline = DEFAULT_SETUP_DEADLINE
                 else:
                     log.warning('setupapi not found in config file.')
                 if 'thumbnailserver' in info:
@@ -856,7 +2904,7 @@ class GameServer:
                             ondemand = False
                         self.updateServerReference(server['serverref'],server['servername'],'',ondemand)
                         if 'serverdefault' in server.keys():
-                            self.gameServerRef = server['serverref']
+                            self.defaultServerRef = server['serverref']
                 else:
                     log.warning('Serverlist not found in config file.')
                 if 'serverrotation' in info and len(info['serverrotation']):
@@ -866,10 +2914,159 @@ class GameServer:
                         if svindex >= 0 and svindex < len(self.allServers):
                             self.gameServerRotation.append(int(x))
             else:
-                log.error(f'GameServer: Config file could not be loaded: {configFile}')
+                log.error(f'ServerRegistry: Config file could not be loaded: {configFile}')
             f.close()
         return True
 
+    def current_serverrefs(self):
+        allServerRefs = []
+        for s in self.allServers:
+            allServerRefs.append(s[0])
+        return allServerRefs
+
+    def removeServerReference(self, serverref: str):
+        if serverref in self.current_serverrefs() and serverref not in [None, '']:
+            self.allServers.pop(self.current_serverrefs().index(serverref))
+            return True
+        return False
+
+    def updateServerReference(self, serverref: str, serverdesc: str, serverurl: str = '', serverondemand: bool = False, serverlaststatus: str = ''):
+        if serverref in self.current_serverrefs() and serverref not in [None, '']:
+            self.allServers.pop(self.current_serverrefs().index(serverref))
+        self.allServers.append((serverref, serverdesc, serverurl,serverondemand,serverlaststatus))
+        return True
+
+    @property
+    def expired(self):
+        return self.refreshTime is None or (datetime.now() - self.refreshTime) > self.ttl
+
+    @property
+    def refreshing(self):
+        return self.refreshTask is not None and not self.refreshTask.done()
+
+    def scheduleRefresh(self, gameServer):
+        """Starts a background refresh through the given GameServer if the TTL has expired and no refresh is running"""
+        if not self.expired or self.refreshing:
+            return self.refreshTask
+        try:
+            self.refreshTask = asyncio.get_running_loop().create_task(self.refresh(gameServer))
+        except RuntimeError:
+            log.debug('ServerRegistry: No running event loop, skipping server list refresh.')
+        return self.refreshTask
+
+    async def refresh(self, gameServer):
+        """Re-validates the server list against the setup API, using the given GameServer's API settings"""
+        log.debug('ServerRegistry: Refreshing server list.')
+        result = await gameServer.validateServers()
+        # Also mark failed refreshes, so an unreachable API is retried after the TTL rather than on every call.
+        self.refreshTime = datetime.now()
+        return result
+
+serverRegistries = {}
+
+def getServerRegistry(configFile=DEFAULT_CONFIG_FILE):
+    """Returns the shared ServerRegistry for a config file, loading it on first use"""
+    if configFile not in serverRegistries:
+        serverRegistries[configFile] = ServerRegistry(configFile)
+    return serverRegistries[configFile]
+
+class RegistryAttribute:
+    """Delegates a GameServer attribute to its shared ServerRegistry"""
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj.registry, self.name)
+
+    def __set__(self, obj, value):
+        setattr(obj.registry, self.name, value)
+
+#########################################################################################
+# CLASS
+#########################################################################################
+class GameServer:
+    """A pug's view onto the shared ServerRegistry, holding the chosen server and its match state"""
+    # Shared across all GameServer instances using the same config file
+    configMaps = RegistryAttribute()
+    postServer = RegistryAttribute()
+    authtoken = RegistryAttribute()
+    thumbnailServer = RegistryAttribute()
+    apiTimeouts = RegistryAttribute()
+    setupDeadline = RegistryAttribute()
+    allServers = RegistryAttribute()
+    gameServerRotation = RegistryAttribute()
+
+    def __init__(self, configFile=DEFAULT_CONFIG_FILE, parent=None, channelId=None):
+        # Initialise the class with hardcoded defaults; shared config comes from the server registry
+        self.parent = parent
+        self.channelId = channelId
+        self.configFile = configFile
+        self.registry = getServerRegistry(configFile)
+
+        # Chosen game server details
+        self.gameServerRef = self.registry.defaultServerRef
+        self.gameServerIP = DEFAULT_GAME_SERVER_IP
+        self.gameServerPort = DEFAULT_GAME_SERVER_PORT
+        self.gameServerName = DEFAULT_GAME_SERVER_NAME
+        self.gameServerState = ''
+        self.gameServerOnDemand = False
+        self.gameServerOnDemandReady = True
+
+        # Setup details and live score
+        self.redPassword = DEFAULT_RED_PASSWORD
+        self.bluePassword = DEFAULT_BLUE_PASSWORD
+        self.redScore = 0
+        self.blueScore = 0
+        self.spectatorPassword = DEFAULT_SPECTATOR_PASSWORD
+        self.numSpectators = DEFAULT_NUM_SPECTATORS
+        self.matchCode = ''
+        self.lastMatchCode = ''
+
+        # We keep a track of the server's match status and also if we have used "endMatch" since the last server setup, which
+        # can be used to override the updating matchInProgress when a match has been ended since the last server setup.
+        # This avoids the need to wait for the last map to complete before the server shows as match finished.
+        self.matchInProgress = False
+        self.endMatchPerformed = False
+        self.lastStatusPoll = 0 # monotonic time the setup API was last polled for this match's status
+
+        # Store the responses from the setup server.
+        self.lastSetupResult = ''
+        self.lastCheckJSON = {}
+        self.lastSetupJSON = {}
+        self.lastEndGameJSON = {}
+
+        self.lastUpdateTime = datetime.now()
+
+        # Stream GameSpy Unreal Query data from the query port of the target server, via utQueryEngine
+        self.utQueryStatsActive = False
+        self.utQueryReporterActive = False
+        self.utQueryConsoleWatermark = self.format_new_watermark
+        self.utQueryData = UTQueryData()
+        self.utQueryEmbedCache = {}
+        self.utScoreboard = Scoreboard()
+
+        # Server validation and status checks go over the network, so run them on the event loop rather than blocking here.
+        # Without a running loop (e.g. offline tooling), the first updateServerStatus() call will populate the server state.
+        self.bootstrapTask = None
+        try:
+            self.bootstrapTask = asyncio.get_running_loop().create_task(self.bootstrapServers())
+        except RuntimeError:
+            log.debug('GameServer(): No running event loop, skipping server bootstrap.')
+
+    async def bootstrapServers(self):
+        """Waits for any due server list refresh in the registry, then fetches the current server status. A pug whose
+        server is already mid-match (e.g. after a bot restart) is locked until that match is over."""
+        refreshTask = self.registry.scheduleRefresh(self)
+        if refreshTask is not None:
+            await asyncio.wait({refreshTask})
+        await self.updateServerStatus()
+        if self.lastSetupResult == 'Match In Progress' and self.parent is not None:
+            log.debug(f'bootstrapServers() - match in progress on {self.gameServerName}, locking {self.parent.mode}')
+            self.parent.pugLocked = True
+        return True
+
     # Update config (currently only maplist is being saved)
     def saveMapConfig(self, configFile, maplist):
         with open(configFile) as f:
@@ -907,44 +3104,63 @@ class GameServer:
             f.close()
         return True
     
-    def utQueryServer(self, queryType):
-        if 'ip' not in self.utQueryData:
-            self.utQueryData['ip'] = self.gameServerIP
-        if 'game_port' not in self.utQueryData:
-            self.utQueryData['game_port'] = self.gameServerPort
-            self.utQueryData['query_port'] = (self.gameServerPort)+1
+    def queryView(self, ip: str, gamePort: int):
+        """Returns a copy of this server that queries the given address, leaving this server's query state alone"""
+        view = copy.copy(self)
+        view.utQueryData = UTQueryData(ip, gamePort)
+        view.utQueryEmbedCache = {}
+        view.utScoreboard = Scoreboard()
+        return view
+
+    @property
+    def utRoundLive(self):
+        server = self.utQueryData.server
+        return self.matchInProgress or (server is not None and server.numPlayers > 0 and (server.remainingTime or 0) > 0)
+
+    def utConsolePollInterval(self, newLines: int):
+        """Seconds until the next console poll, given how many new lines the last one relayed"""
+        if newLines > 0:
+            return UT_POLL_CONSOLE_BUSY
+        if self.utRoundLive:
+            return UT_POLL_CONSOLE_LIVE
+        return UT_POLL_CONSOLE_IDLE
+
+    def utStatsPollInterval(self):
+        """Seconds until the next stats card"""
+        if not self.utRoundLive:
+            return UT_POLL_STATS_IDLE
+        server = self.utQueryData.server
+        if server is not None and server.remainingTime is not None and 0 < server.remainingTime < UT_POLL_STATS_LIVE:
+            # Catch the end of the map rather than waiting out a full interval
+            return server.remainingTime + UT_POLL_CONSOLE_LIVE
+        return UT_POLL_STATS_LIVE
+
+    async def utQueryServer(self, *queryTypes, maxAge: float = None):
+        """Sends one or more queries as a single request and replaces the query results they cover"""
+        queryData = self.utQueryData
+        if queryData.ip is None:
+            queryData.ip = self.gameServerIP
+        if queryData.gamePort is None:
+            queryData.gamePort = self.gameServerPort
+            queryData.queryPort = int(self.gameServerPort)+1
         try:
-            self.udpSock.sendto(str.encode(f'\\{queryType}\\'),(self.utQueryData['ip'], self.utQueryData['query_port']))
-            udpData = []
-            while True:
-                if queryType == 'consolelog': # Larger buffer required for consolelog
-                    udpRcv, _ = self.udpSock.recvfrom(65536)
-                else:
-                    udpRcv, _ = self.udpSock.recvfrom(4096)
-                try:
-                    udpData.extend(udpRcv.decode('utf-8','ignore').split('\\')[1:-2]) 
-                except UnicodeDecodeError as e:
-                    log.error(f'UDP decode error: {e.reason}')
-                    log.debug(f'Attempted sending UDP query {queryType} to {self.utQueryData["ip"]}:{self.utQueryData["query_port"]}.')
-                    return
-                if udpRcv.split(b'\\')[-2] == b'final':
-                    break
-            parts = zip(udpData[::2], udpData[1::2])
-            for part in parts:
-                self.utQueryData[part[0]] = part[1]
-            self.utQueryData['code'] = 200
-            self.utQueryData['lastquery'] = int(time.time())
-            self.utQueryData['attempts'] = 0
-        except socket.timeout:
-            log.error(f'UDP socket timeout when connecting to {self.utQueryData["ip"]}:{self.utQueryData["query_port"]} to perform a query: {queryType}')
-            self.utQueryData['status'] = 'Timeout connecting to server.'
-            self.utQueryData['code'] = 408
-            self.utQueryData['lastquery'] = 0
-            if 'attempts' not in self.utQueryData:
-                self.utQueryData['attempts'] = 0
-            self.utQueryData['attempts'] += 1
-            if self.utQueryData['attempts'] >= 30:
-                self.utQueryData['status'] = 'Failed to connect to server after 30 attempts.'
+            replies = await asyncio.gather(*[utQueryEngine.query(queryData.ip, queryData.queryPort, queryType, maxAge) for queryType in queryTypes])
+            reply = {}
+            for r in replies:
+                reply.update(r)
+            queryData.apply(queryTypes, reply)
+            queryData.code = 200
+            queryData.lastQuery = int(time.time())
+            queryData.attempts = 0
+        except (asyncio.TimeoutError, OSError) as e:
+            # Timeouts and socket errors (e.g. ICMP port unreachable) both count as a failed attempt
+            log.error(f'UDP socket timeout or error ({e!r}) when connecting to {queryData.ip}:{queryData.queryPort} to perform a query: {queryTypes}')
+            queryData.status = 'Timeout connecting to server.'
+            queryData.code = 408
+            queryData.lastQuery = 0
+            queryData.attempts += 1
+            if queryData.attempts >= 30:
+                queryData.status = 'Failed to connect to server after 30 attempts.'
                 self.utQueryReporterActive = False
                 self.utQueryStatsActive = False
         return True
@@ -958,7 +3174,7 @@ class GameServer:
                 'Content-Type': 'application/json; charset=UTF-8',
                 'PugAuth': f'{self.authtoken}',
                 'Accept':'*/*',
-                'Accept-Encoding':'gzip, deflate, br'
+                'Accept-Encoding':'gzip, deflate'
         }
         return fmt
 
@@ -1021,10 +3237,7 @@ class GameServer:
         return fmt
 
     def current_serverrefs(self):
-        allServerRefs = []
-        for s in self.allServers:
-            allServerRefs.append(s[0])
-        return allServerRefs
+        return self.registry.current_serverrefs()
 
     #########################################################################################
     # Formatted strings
@@ -1121,9 +3334,8 @@ class GameServer:
         fmt = f'Server: **{self.format_gameServerURL}**'
         return fmt
     
-    @property
-    def format_game_server_status(self):
-        info = self.getServerStatus(restrict=True, delay=5)
+    async def format_game_server_status(self):
+        info = await self.getServerStatus(restrict=True, delay=5)
         if not info:
             info = self.lastCheckJSON
         msg = ['```']
@@ -1150,57 +3362,55 @@ class GameServer:
     #########################################################################################
     # Functions:
     ######################################################################################### 
-    def makePostRequest(self, server: str, headers, json=None):
-        if json:
-            try:
-                r = requests.post(server, headers=headers, json=json)
-            except requests.exceptions.RequestException:
-                return None
-        else:
-            try:
-                r = requests.post(server, headers=headers)
-            except requests.exceptions.RequestException:
-                return None
-        return r
+    async def makePostRequest(self, server: str, headers, json=None, callType: str = ''):
+        if len(callType) == 0:
+            # Derive the call type from the setup API mode header, grouping remotestart/remotestop etc.
+            callType = headers.get('Mode', 'check')
+            if callType.startswith('remote'):
+                callType = 'remote'
+        timeout = self.apiTimeouts.get(callType, DEFAULT_API_TIMEOUTS['check'])
+        return await httpClient.post(server, headers, json, timeout)
 
     def removeServerReference(self, serverref: str):
-        if serverref in self.current_serverrefs() and serverref not in [None, '']:
-            self.allServers.pop(self.current_serverrefs().index(serverref))
-            return True
-        return False
+        return self.registry.removeServerReference(serverref)
     
     def updateServerReference(self, serverref: str, serverdesc: str, serverurl: str = '', serverondemand: bool = False, serverlaststatus: str = ''):
-        if serverref in self.current_serverrefs() and serverref not in [None, '']:
-            self.allServers.pop(self.current_serverrefs().index(serverref))
-        self.allServers.append((serverref, serverdesc, serverurl,serverondemand,serverlaststatus))
-        return True
+        return self.registry.updateServerReference(serverref, serverdesc, serverurl, serverondemand, serverlaststatus)
     
-    def useServer(self, index: int, autostart: bool = False, byref: str = ''):
-        """Sets the active server"""
+    def selectServer(self, index: int = -1, byref: str = ''):
+        """Sets the active server reference without contacting the API"""
         serverchanged = False
-        log.debug(f'useServer() called for mode {str(self.parent.mode)}, with index: {str(index)}, autostart: {str(autostart)}, byref: {byref}')
         if index >= 0 and index < len(self.allServers):
-            # check if current server needs to be shut down first
-            if self.gameServerOnDemand:
-                self.controlOnDemandServer('stop', self.gameServerRef)
-            # update to new server
             self.gameServerRef = self.allServers[index][0]
             self.gameServerOnDemand = self.allServers[index][3]
-            if autostart and self.gameServerOnDemand:
-                self.controlOnDemandServer('start')
-            else:
-                self.updateServerStatus()
             serverchanged = True
         elif len(byref) > 0:
             for s in self.allServers:
                 if s[0] == byref:
                     self.gameServerRef = s[0]
                     self.gameServerOnDemand = s[3]
-                    self.updateServerStatus()
                     serverchanged = True
         if serverchanged:
             self.saveServerConfig(self.configFile)
-            self.utQueryData = {}
+            self.utQueryData = UTQueryData()
+        return serverchanged
+
+    async def useServer(self, index: int, autostart: bool = False, byref: str = ''):
+        """Sets the active server"""
+        log.debug(f'useServer() called for mode {str(self.parent.mode)}, with index: {str(index)}, autostart: {str(autostart)}, byref: {byref}')
+        if index >= 0 and index < len(self.allServers):
+            # check if current server needs to be shut down first
+            if self.gameServerOnDemand:
+                await self.controlOnDemandServer('stop', self.gameServerRef)
+            # update to new server
+            self.selectServer(index)
+            if autostart and self.gameServerOnDemand:
+                await self.controlOnDemandServer('start')
+            else:
+                await self.updateServerStatus()
+            return True
+        elif len(byref) > 0 and self.selectServer(byref=byref):
+            await self.updateServerStatus()
             return True
         return False
 
@@ -1210,16 +3420,16 @@ class GameServer:
         self.redPassword = RED_PASSWORD_PREFIX + str(random.randint(0, 999))
         self.bluePassword = BLUE_PASSWORD_PREFIX + str(random.randint(0, 999))
 
-    def getServerList(self, restrict: bool = False, delay: int = 0, listall: bool = True):
+    async def getServerList(self, restrict: bool = False, delay: int = 0, listall: bool = True):
         if restrict and (datetime.now() - self.lastUpdateTime).total_seconds() < delay:
             # 5 second delay between requests when restricted.
             return None
         log.debug('Sending API request, fetching server list...')
         if listall:
-            r = self.makePostRequest(self.postServer, self.format_post_header_list)
+            r = await self.makePostRequest(self.postServer, self.format_post_header_list)
         else:
             body = self.format_post_body_serverref()
-            r = self.makePostRequest(self.postServer, self.format_post_header_list, body)
+            r = await self.makePostRequest(self.postServer, self.format_post_header_list, body)
        
         self.lastUpdateTime = datetime.now()
         if(r):            
@@ -1233,9 +3443,9 @@ class GameServer:
         else:
             return None
 
-    def validateServers(self):
+    async def validateServers(self):
         if len(self.allServers):
-            info = self.getServerList()
+            info = await self.getServerList()
             if info and len(info):
                 # firstly, determine if the primary server is online and responding, then drop the local list
                 serverDefaultPresent = False
@@ -1263,24 +3473,33 @@ class GameServer:
             return True
         return False
 
-    def getServerStatus(self, restrict: bool = False, delay: int = 0):
+    async def getServerStatus(self, restrict: bool = False, delay: int = 0):
         if restrict and (datetime.now() - self.lastUpdateTime).total_seconds() < delay:
             # 5 second delay between requests when restricted.
             return None
         body = self.format_post_body_serverref()
         log.debug(f'Posting "Check" to API {self.postServer} - {body}')
-        r = self.makePostRequest(self.postServer, self.format_post_header_check, body)
-        log.debug(f'Received data from API - Status: {r.status_code}; Content-Length: {r.headers["content-length"]}')
+        r = await self.makePostRequest(self.postServer, self.format_post_header_check, body)
         self.lastUpdateTime = datetime.now()
-        if(r):
-            return r.json()
-        else:
+        if r is None:
+            log.debug('No response received from API.')
             return None
+        log.debug(f'Received data from API - Status: {r.status_code}; Content-Length: {r.headers.get("content-length", "?")}')
+        if(r):
+            try:
+                return r.json()
+            except ValueError:
+                log.error(f'Invalid JSON returned from server, URL: {r.url} HTTP response: {r.status_code}; content:{r.content}')
+        return None
 
-    def updateServerStatus(self, ignorematchStarted: bool = False):
+    async def updateServerStatus(self, ignorematchStarted: bool = False):
         log.debug(f'updateServerStatus({ignorematchStarted}) - running getServerStatus for {self.parent.mode}')
-        info = self.getServerStatus()
+        info = await self.getServerStatus()
         log.debug(f'updateServerStatus({ignorematchStarted}) -  info fetched for {self.parent.mode}')
+        return self.applyServerStatus(info, ignorematchStarted)
+
+    def applyServerStatus(self, info, ignorematchStarted: bool = False):
+        """Applies a "check" response to this server; shared by updateServerStatus() and the coalesced status poller"""
         if info and 'serverStatus' in info and 'setupResult' in info:
             log.debug(f'- serverStatus: {info["serverStatus"]}')
             log.debug(f'- setupResult: {info["setupResult"]}')
@@ -1305,19 +3524,20 @@ class GameServer:
         self.lastSetupResult = 'Failed'
         return False
     
-    def controlOnDemandServer(self, state: str = 'start', serverref: str = ''):
+    async def controlOnDemandServer(self, state: str = 'start', serverref: str = ''):
         if len(serverref) == 0:
             serverref = self.gameServerRef
         log.debug(f'Running controlOnDemandServer-{state} for {serverref}...')
         if state not in [None, 'stop','halt','shutdown']:
-            if not self.updateServerStatus(True): # or self.matchInProgress:
+            if not await self.updateServerStatus(True): # or self.matchInProgress:
                 return None
 
         headers = self.format_post_header_control(state)
         body = self.format_post_body_serverref(serverref)
         log.debug(f'Posting "Remote{state}" to API {self.postServer} - {body}')
-        r = self.makePostRequest(self.postServer, headers, body)
-        log.debug(f'Received data from API - Status: {r.status_code}; Content-Length: {r.headers["content-length"]}')
+        r = await self.makePostRequest(self.postServer, headers, body)
+        if r is not None:
+            log.debug(f'Received data from API - Status: {r.status_code}; Content-Length: {r.headers.get("content-length", "?")}')
         if(r):
             log.debug(f'controlOnDemandServer-{state} returned JSON info...')
             info = r.json()
@@ -1326,46 +3546,44 @@ class GameServer:
             log.error(f'controlOnDemandServer-{state} failed.')
         return None
 
-    def stopOnDemandServer(self, index: int):
+    async def stopOnDemandServer(self, index: int):
         log.debug('Running stopOnDemandServer...')
         if index >= 0 and index < len(self.allServers):
             if self.allServers[index][3] is True:
-                self.controlOnDemandServer('stop',self.allServers[index][0])
+                await self.controlOnDemandServer('stop',self.allServers[index][0])
                 log.debug('stopOnDemandServer - Control command issued.')
                 return True
         log.debug('stopOnDemandServer - Invalid server selected.')
         return False
 
-    def setupMatch(self, numPlayers, maps, mode, startmap=''):
+    async def setupMatch(self, numPlayers, maps, mode, startmap='', progress=None):
         if self.matchInProgress:
             return False
 
-        # Start the looped task which checks whether the server is ready
+        # On-demand servers are started first, then checked with backoff until they respond
         if self.gameServerOnDemand:
             self.gameServerOnDemandReady = False
-            # TODO - Unblock thread and move setup and checks to background
-            #      - Lots of re-work required for this
-
-            # log.debug('Starting Server state checker...')
-            # self.updateOnDemandServerState.start(ctx, log, False)
-            # log.debug('Server state checker started.')
         else:
             self.gameServerOnDemandReady = True
 
-        i = 0
+        attempt = 0
         while self.gameServerOnDemandReady is False:
             log.debug('Waiting for gameServerOnDemandReady...')
-            if i < 5:
-                self.controlOnDemandServer('start')
-            else:
-                if self.parent.gameServer.updateServerStatus():
-                    self.gameServerOnDemandReady=True
-                else:
-                    time.sleep(5)
-            i += 1
-            if i > 12:
-               # Stop trying after a minute
-               self.gameServerOnDemandReady=True # fail the setup instead, and allow for manual retry.
+            if attempt < ONDEMAND_START_ATTEMPTS:
+                await self.controlOnDemandServer('start')
+            elif await self.parent.gameServer.updateServerStatus():
+                self.gameServerOnDemandReady=True
+            attempt += 1
+            if self.gameServerOnDemandReady:
+                break
+            if attempt >= ONDEMAND_MAX_ATTEMPTS:
+               # Stop trying, fail the setup instead, and allow for manual retry.
+               self.gameServerOnDemandReady=True
+               break
+            delay = backoffDelay(attempt - 1)
+            if progress is not None and attempt == 1:
+                await progress(f'{self.gameServerName} is starting up, checking again in {delay:.0f}s...')
+            await asyncio.sleep(delay)
 
         if not self.gameServerOnDemandReady:
             return False
@@ -1377,7 +3595,7 @@ class GameServer:
         headers = self.format_post_header_setup
         body = self.format_post_body_setup(numPlayers, maps, mode, startmap)
 
-        r = self.makePostRequest(self.postServer, headers, body)
+        r = await self.makePostRequest(self.postServer, headers, body)
         if(r):
             info = r.json()
             self.lastSetupResult = info['setupResult']
@@ -1397,9 +3615,9 @@ class GameServer:
         self.lastSetupResult = 'Failed'
         return False
 
-    def endMatch(self, viaReset: bool = False):
+    async def endMatch(self, viaReset: bool = False):
         # returns server back to public
-        if not self.updateServerStatus():
+        if not await self.updateServerStatus():
             return False
         # Cache last scores from server status
         log.debug(f'endMatch (viaReset={viaReset}): Ended = {self.endMatchPerformed}. matchCode = {self.matchCode}, redScore = {self.redScore} - blueScore = {self.blueScore}')
@@ -1410,7 +3628,7 @@ class GameServer:
                 log.info('Pug reset; last scores did not append successfully.')
         # Tear down match
         body = self.format_post_body_serverref()
-        r = self.makePostRequest(self.postServer, self.format_post_header_endgame, body)
+        r = await self.makePostRequest(self.postServer, self.format_post_header_endgame, body)
         if(r):
             info = r.json()
             self.lastSetupResult = info['setupResult']
@@ -1432,32 +3650,30 @@ class GameServer:
         self.lastSetupResult = 'Failed'
         return False
 
-    def processMatchFinished(self):
-        if self.lastSetupResult == 'Failed' or not self.updateServerStatus():
+    async def processMatchFinished(self, refresh: bool = True):
+        if self.lastSetupResult == 'Failed' or (refresh and not await self.updateServerStatus()):
             return False
 
         if not self.matchInProgress and self.lastSetupResult == 'Match Finished':
-            return self.endMatch()
+            return await self.endMatch()
         return False
 
     def waitUntilServerStarted(self):
 
         return True
 
-    def checkServerRotation(self):
+    async def checkServerRotation(self):
         # An imprecise science here, as where there is a mismatch between number of rotation items and weeks in a year,
         # the pattern may break when crossing over between week 52 and week 1 at new year.
-        self.validateServers()
-        self.parent.parent.cachedServers = self.allServers
-        self.parent.parent.cachedServersTime = datetime.now()
-        self.updateServerStatus()
+        await self.registry.refresh(self)
+        await self.updateServerStatus()
         if len(self.gameServerRotation) > 0:
             # Extended the input a little, rather than simply week number, it's a combination of yearweek (e.g., 202201 - 202252),
             # which works better with smaller rotation pools
             newServer = int(self.gameServerRotation[int(f'{datetime.now().year}{datetime.now().isocalendar()[1]:02}')%len(self.gameServerRotation)])-1
             if self.gameServerRef != self.allServers[newServer][0]:
                 log.debug(f'checkServerRotation - Updating current server to: {self.allServers[newServer][1]}')
-                self.useServer(newServer)
+                await self.useServer(newServer)
         return True
 
     #########################################################################################
@@ -1466,7 +3682,7 @@ class GameServer:
     @tasks.loop(seconds=15.0, count=8)
     async def updateOnDemandServerState(self, ctx):
         log.debug('Checking on-demand server state...')
-        if self.parent.gameServer.updateServerStatus():
+        if await self.parent.gameServer.updateServerStatus():
             serverOnline=True
         else:
             serverOnline=False
@@ -1498,8 +3714,11 @@ class AssaultPug(PugTeams):
         self.lastPlayedMode = 'stdAS'
         self.matchReportPending = False
         self.desc = self.name + ': ' + self.mode + ' PUG'
-        self.servers = [GameServer(configFile=configFile, parent=self)]
+        self.configFile = configFile
+        self.servers = [] # GameServer views are created on first use, see gameServer
         self.serverIndex = 0
+        self.setupTask = None # In-flight setup attempts, cancelled on reset
+        self.setupJob = None # Background setup job started by processPugStatus(), including the post-setup messages
         self.channelId = channelId
         self.ranked = False
         self.redPower = 0
@@ -1509,18 +3728,14 @@ class AssaultPug(PugTeams):
         log.debug(f'AssaultPug() instance created with ratings file: {self.ratingsFile}, mode: {self.mode}')
         self.ratingsSyncAPI = parent.ratingsSyncAPI if parent else {'matchDataURL':'','ratingsDataURL':'','playerDataURL':'','apiKey':''}
 
-        self.maps = PugMaps(numMaps, pickModeMaps, self.ranked, self.servers[self.serverIndex].configMaps)
+        self.maps = PugMaps(numMaps, pickModeMaps, self.ranked, list(getServerRegistry(configFile).configMaps))
         self.roleRequired = None
         self.lastPug = {}
         self.lastPugStr = 'No last pug info available.' # deprecated
         self.lastPugTimeStarted = None # deprecated
         self.pugLocked = False
         self.pugTempLocked = 0 # 0 = not locked, 1 = temp locked, 2 = long locked (e.g. server/players busy in another match)
-
-        # Bit of a hack to get around the problem of a match being in progress when this is initialised.
-        # Will improve this later.
-        if self.gameServer.lastSetupResult == 'Match In Progress':
-            self.pugLocked = True
+        # A match already in progress on the server locks the pug once its status arrives, see GameServer.bootstrapServers()
 
     #########################################################################################
     # Properties:
@@ -1564,10 +3779,9 @@ class AssaultPug(PugTeams):
 
     @property
     def gameServer(self):
-        if len(self.servers):
-            return self.servers[self.serverIndex]
-        else:
-            return None
+        if not len(self.servers):
+            self.servers.append(GameServer(configFile=self.configFile, parent=self))
+        return self.servers[self.serverIndex]
 
     #########################################################################################
     # Formatted strings:
@@ -1704,7 +3918,11 @@ class AssaultPug(PugTeams):
             return False
         return self.maps.addMap(index)
 
-    def setupPug(self):
+    @property
+    def setupInProgress(self):
+        return self.setupJob is not None and not self.setupJob.done()
+
+    async def setupPug(self, progress=None):
         if not self.pugLocked and self.matchReady:
             # Check if server is already locked by another instance (any mode in any channel)
             serverRef = self.gameServer.gameServerRef
@@ -1713,32 +3931,64 @@ class AssaultPug(PugTeams):
                 log.debug(f'setupPug() - Server {serverRef} is already locked by channel {existing_lock[0]} mode {existing_lock[1]}')
                 return False, 'locked'
             
-            # Try to set up 5 times with a 5s delay between attempts.
-            result = False
             self.pugTempLocked = 1
             startMap = ''
             if self.maps.startMap not in ['',None] and self.maps.maps[-1] != self.maps.startMap:
                 startMap = self.maps.startMap # Only send this if it's not the last map in the list, otherwise it'll take longer to set up
-            for x in range(0, 5):
-                result = self.gameServer.setupMatch(self.maxPlayers, self.maps.maps, self.mode, startMap)
-                log.debug(f'Setup attempt {x+1}/5: Result returned: {result}')
-                if not result:
-                    time.sleep(5)
-                else:
-                    self.pugLocked = True
-                    # Lock the server to prevent other instances from using it with mode-aware tuple
-                    if self.parent:
-                        lock_key = (self.channelId, self.mode)
-                        self.parent.serverLocks[serverRef] = lock_key
-                        log.debug(f'setupPug() - Locked server {serverRef} for channel {self.channelId} mode {self.mode}')
-                    if self.gameServer.matchCode in [None,'']:
-                        # Generate a temporary match code which can be updated later
-                        self.gameServer.matchCode = f'temp-{datetime.now().strftime("%Y%m%d%H%M%S")}'
-                    self.storeLastPug(matchCode=self.gameServer.matchCode)
-                    return True, 'ok'
+
+            # Run the attempts as a task, so that a reset can cancel it, and bound them with an overall deadline.
+            deadline = self.gameServer.setupDeadline
+            task = self.setupTask = asyncio.ensure_future(self.setupPugAttempts(startMap, progress))
+            done, _ = await asyncio.wait({task}, timeout=deadline)
+            if self.setupTask is task:
+                self.setupTask = None
+            if not done:
+                task.cancel()
+                log.warning(f'setupPug() - Setup did not complete within the {deadline}s deadline.')
+                self.pugTempLocked = 0
+                return False, 'timeout'
+            if task.cancelled():
+                log.debug('setupPug() - Setup was cancelled.')
+                return False, 'cancelled'
+            if task.exception() is not None:
+                log.error(f'setupPug() - Setup raised an exception: {task.exception()!r}')
+            elif task.result():
+                self.pugLocked = True
+                # Lock the server to prevent other instances from using it with mode-aware tuple
+                if self.parent:
+                    lock_key = (self.channelId, self.mode)
+                    self.parent.serverLocks[serverRef] = lock_key
+                    log.debug(f'setupPug() - Locked server {serverRef} for channel {self.channelId} mode {self.mode}')
+                if self.gameServer.matchCode in [None,'']:
+                    # Generate a temporary match code which can be updated later
+                    self.gameServer.matchCode = f'temp-{datetime.now().strftime("%Y%m%d%H%M%S")}'
+                self.storeLastPug(matchCode=self.gameServer.matchCode)
+                return True, 'ok'
             self.pugTempLocked = 0
         return False, 'failed'
 
+    async def setupPugAttempts(self, startMap: str = '', progress=None):
+        # Try to set up several times, backing off between attempts.
+        for x in range(0, SETUP_ATTEMPTS):
+            result = await self.gameServer.setupMatch(self.maxPlayers, self.maps.maps, self.mode, startMap, progress)
+            log.debug(f'Setup attempt {x+1}/{SETUP_ATTEMPTS}: Result returned: {result}')
+            if result:
+                return True
+            if x < SETUP_ATTEMPTS - 1:
+                delay = backoffDelay(x)
+                if progress is not None:
+                    await progress(f'Setup attempt {x+1}/{SETUP_ATTEMPTS} failed ({self.gameServer.lastSetupResult}), retrying in {delay:.0f}s...')
+                await asyncio.sleep(delay)
+        return False
+
+    def cancelSetup(self):
+        """Cancels an in-flight setupPug(), e.g. when the pug is reset mid-setup"""
+        if self.setupTask is not None and not self.setupTask.done():
+            log.debug(f'cancelSetup() - Cancelling setup for channel {self.channelId} mode {self.mode}')
+            self.setupTask.cancel()
+            return True
+        return False
+
     def storeLastPug(self, appendstr: str = '', redScore: int = 0, blueScore: int = 0, matchCode: str = '', viaReset: bool = False):
         if self.matchReady:
             fmt = []
@@ -1814,19 +4064,20 @@ class AssaultPug(PugTeams):
             return True
         return False
 
-    def resetPug(self, manualReset = False):
+    async def resetPug(self, manualReset = False):
+        self.cancelSetup()
         self.pugTempLocked = 1
         if manualReset and self.pugLocked and self.ranked and len(self.maps):
             self.maps.adjustRankedMapDesirability()
             self.ratings['maps']['maplist'] = self.maps.mapListWeighting
-            self.savePugRatings(self.ratingsFile)
+            self.savePugRatings(self.ratingsFile, mode=self.mode, ratings=[], games=[])
         self.maps.resetMaps()
         self.fullPugTeamReset(manualReset)
         self.redPower = 0
         self.bluePower = 0
         if self.pugLocked or (self.gameServer and self.gameServer.matchInProgress):
         # Is this a good idea? Might get abused.
-            self.gameServer.endMatch(manualReset)
+            await self.gameServer.endMatch(manualReset)
         self.gameServer.utQueryReporterActive = False
         self.gameServer.utQueryStatsActive = False
         self.pugTempLocked = 0
@@ -1861,7 +4112,7 @@ class AssaultPug(PugTeams):
         self.roleRequired = None
         if rankedMode == False and self.ratingsFile != '':
             log.debug(f'setRankedMode({rankedMode}) - Calling savePugRatings({self.ratingsFile})')
-            self.savePugRatings(self.ratingsFile)
+            self.savePugRatings(self.ratingsFile, mode=self.mode, ratings=[], games=[])
         if skipResets != True:
             log.debug(f'setRankedMode({rankedMode}) - Calling softPugTeamReset()')
             self.softPugTeamReset() # clear any caps / picks
@@ -1901,7 +4152,7 @@ class AssaultPug(PugTeams):
                         'randomorder':''
                     }
                     self.parent.allRatings['rankedgames'].append(newMode)
-                    self.savePugRatings(ratingsFile=self.ratingsFile, ratingsUpdates=self.parent.allRatings)
+                    self.savePugRatings(ratingsFile=self.ratingsFile, ratingsUpdates=self.parent.allRatings, mode=self.mode)
                     self.loadPugRatings(self.ratingsFile)
                 if self.ratings is not None:
                     log.debug(f'setRankedMode({rankedMode}) - self.ratings present.')
@@ -1984,9 +4235,9 @@ class AssaultPug(PugTeams):
             outStr.append(PLASEP)
             return False, ' '.join(outStr)
 
-    def loadPugRatings(self, ratingsFile, returnDataOnly: bool = False):
+    def loadPugRatings(self, ratingsFile, returnDataOnly: bool = False, mode: str = None):
         """Loads the ranked game ratings data from the JSON configuration file"""
-        return self.parent.loadPugRatings(ratingsFile, returnDataOnly)
+        return self.parent.loadPugRatings(ratingsFile, returnDataOnly, mode)
         # Legacy code - now handled by parent
         self.ratings = None # save before load?
         log.debug(f'loadPugRatings({ratingsFile}) started')
@@ -2030,9 +4281,9 @@ class AssaultPug(PugTeams):
                 log.debug(f'loadPugRatings({ratingsFile}) ratingsData is not a valid object')
         return False
         
-    def savePugRatings(self, ratingsFile, ratingsUpdates = None):
+    def savePugRatings(self, ratingsFile, ratingsUpdates = None, mode: str = None, ratings: list = None, games: list = None):
         """Saves the ranked game ratings data to the JSON configuration file"""
-        return self.parent.savePugRatings(ratingsFile, ratingsUpdates)
+        return self.parent.savePugRatings(ratingsFile, ratingsUpdates, mode, ratings, games)
         # Legacy code - now handled by parent
         with open(ratingsFile) as fr:
             try:
@@ -2066,7 +4317,7 @@ class AssaultPug(PugTeams):
                     else:
                         log.warning(f'savePugRatings({ratingsFile}) failed to generate ratingsData. Cached ratings not present and updates not provided.')
                 ratingsData['savedate'] = datetime.now().isoformat()
-                json.dump(ratingsData, fw, indent=4)
+                json.dump(ratingsData, fw, indent=4, default=encodeRatings)
                 fw.close()
         return True
 
@@ -2198,10 +4449,10 @@ class AssaultPug(PugTeams):
             return False
         if hasEnded:
             timeEnded = datetime.now().isoformat()
-        self.savePugRatings(self.ratingsFile) # ensure any recent changes to ratings data are saved before we load it again to update with match results
-        rkData = self.loadPugRatings(self.ratingsFile, True)
+        rkData = self.loadPugRatings(self.ratingsFile, True, mode)
         rkNewMatch = True
         rkUpdated = False
+        rkGame = None
         if 'rankedgames' in rkData:
             for x in rkData['rankedgames']:
                 if 'mode' in x and str(x['mode']).upper() == mode.upper():
@@ -2209,26 +4460,27 @@ class AssaultPug(PugTeams):
                     x['maps']['maplist'] = self.maps.mapListWeighting
                     if 'games' not in x:
                         x['games'] = []
-                    for g in x['games']:
-                        if g['gameref'].upper() == matchCode.upper():
-                            rkNewMatch = False
-                            if self.redPower > 0:
-                                g['rpred'] = self.redPower
-                            if self.bluePower > 0:
-                                g['rpblue'] = self.bluePower
-                            g['scorered'] = redScore
-                            g['scoreblue'] = blueScore
-                            g['completed'] = hasEnded
-                            if (hasEnded):
-                                g['enddate'] = timeEnded
-                            if len(self.red) > 0:
-                                g['teamred'] = self.returnPIDs(self.red)
-                            if len(self.blue) > 0:
-                                g['teamblue'] = self.returnPIDs(self.blue)
-                            g['completed'] = hasEnded
-                            if hasEnded:
-                                rkData = self.applyRankedScoring(rkData, mode, g)
-                            rkUpdated = True
+                    g = self.parent.ratingsRepo.getGame(mode, matchCode)
+                    if g is not None:
+                        rkNewMatch = False
+                        if self.redPower > 0:
+                            g['rpred'] = self.redPower
+                        if self.bluePower > 0:
+                            g['rpblue'] = self.bluePower
+                        g['scorered'] = redScore
+                        g['scoreblue'] = blueScore
+                        g['completed'] = hasEnded
+                        if (hasEnded):
+                            g['enddate'] = timeEnded
+                        if len(self.red) > 0:
+                            g['teamred'] = self.returnPIDs(self.red)
+                        if len(self.blue) > 0:
+                            g['teamblue'] = self.returnPIDs(self.blue)
+                        g['completed'] = hasEnded
+                        if hasEnded:
+                            rkData = self.applyRankedScoring(rkData, mode, g)
+                        rkUpdated = True
+                        rkGame = g
                     if rkNewMatch:
                         if len(redPlayers) == 0:
                             redPlayers = self.red
@@ -2265,8 +4517,9 @@ class AssaultPug(PugTeams):
                         if hasEnded:
                             rkData = self.applyRankedScoring(rkData, mode, m)
                         rkUpdated = True
+                        rkGame = m
         if rkUpdated:
-            if self.savePugRatings(self.ratingsFile, rkData):
+            if self.savePugRatings(self.ratingsFile, rkData, mode, rkGame['teamred'] + rkGame['teamblue'], [rkGame['gameref']]):
                 if (self.ranked):
                     if self.parent.ratingsLock:
                         self.parent.ratingsLock = False # unlock ratings for other instances to access
@@ -2336,11 +4589,7 @@ class AssaultPug(PugTeams):
                     if p['did'] == player or (player == 0 and p['lastgameref'] != match['gameref']):
                         if p['did'] in winners or p['did'] in losers:
                             # Move last game to history
-                            if 'ratinghistory' not in p:
-                                p['ratinghistory'] = []
-                            if p['ratinghistory'] in [None,'']:
-                                p['ratinghistory'] = []
-                            p['ratinghistory'].append({
+                            RatingHistory.of(p).append({
                                 'matchref': p['lastgameref'],
                                 'matchdate': p['lastgamedate'],
                                 'ratingbefore': p['ratingprevious'],
@@ -2356,10 +4605,8 @@ class AssaultPug(PugTeams):
                                 p['ratingvalue'] = p['ratingvalue']+loseRP
                                 if p['did'] in loseCap:
                                     p['ratingvalue'] = p['ratingvalue']+capLoseRP
-                            if 'ratinghistory' in p:
-                                p['ratinghistory'] = sorted(p['ratinghistory'], key=lambda g: datetime.fromisoformat(g['matchdate'])) 
-                                #if len(p['ratinghistory']) > 150:
-                                #    p['ratinghistory'][:] = p['ratinghistory'][-150:]
+                            #if len(p['ratinghistory']) > 150:
+                            #    p['ratinghistory'][:] = p['ratinghistory'][-150:]
                             p['lastgamedate'] = match['startdate']
                             if 'gameref' in match and len(match['gameref']):
                                 p['lastgameref'] = match['gameref']
@@ -2411,17 +4658,23 @@ class PugIsInProgress(commands.CommandError):
 # Main pug cog class.
 #########################################################################################
 class PUG(commands.Cog):
-    def __init__(self, bot, configFile=DEFAULT_CONFIG_FILE):
+    def __init__(self, bot, configFile=DEFAULT_CONFIG_FILE, ratingsRepo=None):
         self.bot = bot
         self.activeChannel = None 
         self.customStaticEmojis = {}
         self.customAnimatedEmojis = {}
+        self.guildEmojis = {} # guildId -> (static, animated) emoji maps, kept current by on_guild_emojis_update
+        self.emojiReplacer = EmojiReplacer()
         self.utReporterChannel = None
-        self.cachedServers = None
-        self.cachedServersTime = 0
+        self.utConsoleRelay = ConsoleRelay()
+        self.utPollScheduler = PollScheduler()
+        self.outbound = OutboundQueue()
+        self.matchEndChecks = {} # AssaultPug -> task checking the setup API after a match-end console event
+        self.finishingPugs = set() # AssaultPugs inside finishMatch(), so the poll loop and a match-end check never both finish one
         self.configLoadTime = 0
         self.configFile = configFile
         self.ratingsFile = DEFAULT_RATING_FILE
+        self.ratingsRepo = ratingsRepo if ratingsRepo is not None else RatingsRepository(ratingsFile=self.ratingsFile) # must be opened before use; see setup()
         self.allRatings = {} # centrally cached ratings data for all modes, keyed by mode name (e.g., 'rASPlus') - used to reduce file I/O and for quick access when switching modes or validating player eligibility
         self.ratingsLock = False # simple lock to prevent multiple simultaneous ratings file accesses, as these can cause conflicts and data loss.
         self.ratingsSyncAPI = {'matchDataURL':'','ratingsDataURL':'','playerDataURL':'','apiKey':''}
@@ -2437,7 +4690,7 @@ class PUG(commands.Cog):
         self.modePugLastActivity = {}  # (channelId, mode) -> datetime (tracks when pug was last updated for default selection)
 
         self.loadPugConfig(configFile)
-        self.cacheGuildEmojis()
+        self.mergeGuildEmojis()
 
         # Used to keep track of if both teams have requested a reset while a match is in progress.
         # We'll only make use of this in the reset() function so it only needs to be put back to
@@ -2455,9 +4708,8 @@ class PUG(commands.Cog):
         # Start the GameSpy query loops
         self.updateUTQueryReporter.start()
         self.updateUTQueryStats.start()
-        
-        # Start the Emoji update loop
-        self.updateGuildEmojis.start()
+        self.flushConsoleRelay.start()
+        self.flushRatings.start()
 
         # Start the looped task for server rotation
         self.updateServerRotation.start()
@@ -2713,13 +4965,32 @@ class PUG(commands.Cog):
         self.validatePugChannel(channel) 
         return channel 
     
-    def cog_unload(self):
+    async def cog_before_invoke(self, ctx):
+        """Reads the ranked modes a command may use before it runs: its mode argument and those of the channel's PUGs"""
+        modes = []
+        for channel in [ctx.channel, self.activeChannel]:
+            if channel is not None:
+                modes.extend(self.pugInstances.get(channel.id, {}))
+        params = list(ctx.command.clean_params) if ctx.command else []
+        args = ctx.args[2:] # after the cog and the context
+        if 'mode' in ctx.kwargs:
+            modes.append(ctx.kwargs['mode'])
+        elif 'mode' in params and params.index('mode') < len(args):
+            modes.append(args[params.index('mode')])
+        await self.ratingsRepo.load([m for m in modes if isinstance(m, str)])
+
+    async def cog_unload(self):
         self.updateGameServer.cancel()
         self.sendMatchReport.cancel()
         self.updateUTQueryReporter.cancel()
         self.updateUTQueryStats.cancel()
-        self.updateGuildEmojis.cancel()
+        self.flushConsoleRelay.cancel()
+        self.flushRatings.cancel()
         self.updateServerRotation.cancel()
+        await self.ratingsRepo.close()
+        self.outbound.close()
+        await httpClient.close()
+        utQueryEngine.close()
 
     def getPlayerInstances(self, player):
         """Get all (channelId, mode) tuples where a player is currently signed up.
@@ -2823,96 +5094,64 @@ class PUG(commands.Cog):
             # Queued players are not tracked as active
             pass
 
-    def loadPugRatings(self, ratingsFile, returnDataOnly: bool = False):
-        """Loads the ranked game ratings data from the JSON configuration file"""
-        self.allRatings = None # save before load?
+    def loadPugRatings(self, ratingsFile, returnDataOnly: bool = False, mode: str = None):
+        """Loads the ranked game ratings data from the ratings repository. The modes a command uses are read before it runs
+        (see cog_before_invoke()). With returnDataOnly, only the given mode is loaded (every mode if None)."""
         log.debug(f'loadPugRatings({ratingsFile}) started')
-        with open(ratingsFile, 'r') as f:
-            log.debug(f'loadPugRatings({ratingsFile}) json.load enter')
-            try:
-                ratingsData = json.load(f)
-            except:
-                ratingsData = None
-            log.debug(f'loadPugRatings({ratingsFile}) json.load finished')
-            if ratingsData:
-                log.debug(f'loadPugRatings({ratingsFile}) ratingsData loaded')
-                if returnDataOnly: # For in-line updates
-                    return ratingsData
-                if 'syncapi' in ratingsData:
-                    self.ratingsSyncAPI = ratingsData['syncapi']
-                if 'rankedgames' in ratingsData:
-                    self.allRatings = ratingsData
-                    # Find the mode and specific ratings data for eligible ranked PUGs
-                    syncedModes = []
-                    for gamedata in self.allRatings['rankedgames']:
-                        log.debug(f'loadPugRatings({ratingsFile}) looking for mode to update: {gamedata["mode"]}')
-                        pug = self.getPugForModeInChannel(channelId=self.activeChannel.id, mode=gamedata['mode'], ignoreMissing=True)
-                        if pug is not None:
-                            pug.ratings = gamedata
-                            log.debug(f'loadPugRatings({ratingsFile}) cached ratings data for {pug.mode}')
-                            syncedModes.append(gamedata['mode'])
-                        else:
-                            log.debug(f'loadPugRatings({ratingsFile}) could not devolve ratings data for {gamedata["mode"]}')
-                    return True
-                else:
-                    # Generate an empty ranked schema with the default mode
-                    rkData = {
-                        'syncapi': self.ratingsSyncAPI,
-                        'rankedgames': [
-                            {
-                                'mode': MODE_RANKED_DEFAULT,
-                                'maps':{},
-                                'eligibility':'',
-                                'registrations':[],
-                                'ratings':[],
-                                'lastsync':''
-                            }
-                        ]
-                    }
-                    self.savePugRatings(ratingsFile, rkData)
-                    log.debug(f'loadPugRatings({ratingsFile}) established new ratings data.')
-                    self.loadPugRatings(ratingsFile)
+        if returnDataOnly: # For in-line updates; this is the live data, so pass it back to savePugRatings() once changed
+            return self.ratingsRepo.get(mode) or False
+        self.ratingsRepo.checkOpen()
+        ratingsData = self.ratingsRepo.data # modes are loaded below, only for the PUGs in this channel
+        if ratingsData:
+            if 'syncapi' in ratingsData:
+                self.ratingsSyncAPI = ratingsData['syncapi']
+            if 'rankedgames' in ratingsData:
+                self.allRatings = ratingsData
+                # Find the mode and specific ratings data for eligible ranked PUGs
+                syncedModes = []
+                for rankedMode in self.ratingsRepo.modeNames():
+                    log.debug(f'loadPugRatings({ratingsFile}) looking for mode to update: {rankedMode}')
+                    pug = self.getPugForModeInChannel(channelId=self.activeChannel.id, mode=rankedMode, ignoreMissing=True)
+                    if pug is not None:
+                        pug.ratings = self.ratingsRepo.getMode(rankedMode)
+                        log.debug(f'loadPugRatings({ratingsFile}) cached ratings data for {pug.mode}')
+                        syncedModes.append(rankedMode)
+                    else:
+                        log.debug(f'loadPugRatings({ratingsFile}) could not devolve ratings data for {rankedMode}')
+                return True
             else:
-                log.debug(f'loadPugRatings({ratingsFile}) ratingsData is not a valid object')
+                # Generate an empty ranked schema with the default mode
+                rkData = {
+                    'syncapi': self.ratingsSyncAPI,
+                    'rankedgames': [
+                        {
+                            'mode': MODE_RANKED_DEFAULT,
+                            'maps':{},
+                            'eligibility':'',
+                            'registrations':[],
+                            'ratings':[],
+                            'lastsync':''
+                        }
+                    ]
+                }
+                self.savePugRatings(ratingsFile, rkData)
+                log.debug(f'loadPugRatings({ratingsFile}) established new ratings data.')
+                return self.loadPugRatings(ratingsFile)
+        else:
+            log.debug(f'loadPugRatings({ratingsFile}) ratingsData is not a valid object')
         return False
         
-    def savePugRatings(self, ratingsFile, ratingsUpdates = None):
-        with open(ratingsFile) as fr:
-            try:
-                ratingsData = json.load(fr)
-            except:
-                ratingsData = None
-        if ratingsData not in [None,''] or ratingsUpdates not in [None,'']:
-            with open(ratingsFile,'w') as fw:
-                # Update the specific ratings data section before dumping it
-                if ratingsUpdates not in [None,'']:
-                    if 'rankedgames' in ratingsUpdates and ratingsUpdates['rankedgames'] is not None:
-                        log.debug(f'savePugRatings({ratingsFile}) updating ratingsData directly from provided ratingsUpdates.')
-                        ratingsData['rankedgames']  = ratingsUpdates['rankedgames'] # pass valid data straight into the file
-                else:
-                    if self.allRatings not in [None,'',{}]:
-                        log.debug(f'savePugRatings({ratingsFile}) updating ratingsData from cached allRatings object...')
-                        for cacheddata in self.allRatings['rankedgames']:
-                            if ratingsData['rankedgames'] is not None:
-                                for gamedata in ratingsData['rankedgames']:
-                                    if str(gamedata['mode']).upper() == str(cacheddata['mode']).upper():
-                                        cacheddata['lastupdated'] = datetime.now().isoformat()
-                                        for key in ['maps','eligibility','registrations','ratings','lastsync','fixedpicklimit','startmapfrompick','capMode','capWindow','capRole','games','scoring','lastupdated','randomorder']:
-                                            if key not in cacheddata:
-                                                if key in ['registrations','ratings','games']:
-                                                    cacheddata[key] = []
-                                                elif key in ['maps','scoring']:
-                                                    cacheddata[key] = {}
-                                                else:
-                                                    cacheddata[key] = ""
-                                            gamedata[key] = cacheddata[key]
-                            else:
-                                ratingsData['rankedgames'].append(cacheddata)
-                    else:
-                        log.warning(f'savePugRatings({ratingsFile}) failed to generate ratingsData. Cached ratings not present and updates not provided.')
-                ratingsData['savedate'] = datetime.now().isoformat()
-                json.dump(ratingsData, fw, indent=4)
-                fw.close()
+    def savePugRatings(self, ratingsFile, ratingsUpdates = None, mode: str = None, ratings: list = None, games: list = None):
+        """Records changes to the ranked game ratings data of one mode (or all modes); flushRatings() writes them to the JSON file.
+        Name the changed player ratings (dids) and games (gamerefs), or pass empty lists if only the mode settings changed;
+        if left as None, all of them are saved."""
+        if ratingsUpdates not in [None,''] and 'rankedgames' in ratingsUpdates and ratingsUpdates['rankedgames'] is not None:
+            log.debug(f'savePugRatings({ratingsFile}) updating ratingsData directly from provided ratingsUpdates.')
+            self.ratingsRepo.replaceModes(ratingsUpdates['rankedgames'])
+        elif self.ratingsRepo.data in [None,'',{}]:
+            log.warning(f'savePugRatings({ratingsFile}) failed to generate ratingsData. Cached ratings not present and updates not provided.')
+            return True
+        self.ratingsRepo.markDirty(mode, ratings, games)
         return True
 
 #########################################################################################
@@ -2920,36 +5159,100 @@ class PUG(commands.Cog):
 #########################################################################################
     @tasks.loop(seconds=60.0)
     async def updateGameServer(self):
-        # Iterate over all active pugs across all channels and modes
-        for channelId, mode, pug in list(self.getAllActivePugs()):
-            if not pug.pugLocked:
-                continue
-            queueCheck = False
+        # Keep the shared server list fresh in the background once its TTL has expired
+        defaultServer = self._defaultPugInfo.gameServer
+        defaultServer.registry.scheduleRefresh(defaultServer)
+        # Iterate over all active pugs across all channels and modes. Pugs whose console is being relayed learn of the
+        # end of the match from it (see checkMatchEnd()), so the API is only polled for them as a slow fallback.
+        now = time.monotonic()
+        lockedPugs = [(channelId, mode, pug) for channelId, mode, pug in self.getAllActivePugs() if pug.pugLocked and pug not in self.matchEndChecks
+                      and (not pug.gameServer.utQueryReporterActive or now - pug.gameServer.lastStatusPoll >= MATCH_STATUS_FALLBACK_INTERVAL)]
+        if not len(lockedPugs):
+            return
+        serverStatus = await self.pollServerStatus([pug for _, _, pug in lockedPugs])
+        for channelId, mode, pug in lockedPugs:
+            if not pug.pugLocked or pug in self.matchEndChecks:
+                continue # finished, or handed to a match-end check, while the status was being fetched
             log.info(f'Updating game server for channel {channelId} mode {mode} [pugLocked=True]..')
-            if not pug.gameServer.updateServerStatus():
+            pug.gameServer.lastStatusPoll = now
+            if not serverStatus.get(pug.gameServer.gameServerRef, False):
                 log.warning('Cannot contact game server.')
-            if len(pug.queuedPlayers):
-                queueCheck = True
-            if pug.gameServer.processMatchFinished():
-                self.savePugConfig(self.configFile)
-                channel = discord.Client.get_channel(self.bot, channelId)
-                if channel is None:
-                    continue
-                msg = f'Match finished. Resetting pug ({mode})'
-                if pug.ranked:
-                    msg = msg + ' and updating player RP.'
-                    await channel.send(msg)
-                else:
-                    msg = msg + '...'
-                    await channel.send(msg)
-                if pug.resetPug():
-                    await channel.send(pug.format_pug())
-                    log.info('Match over.')
-                    if queueCheck and pug.playersFull:
-                        await channel.send(f'Queued players have been added and the pug is full. When ready, start the next pug by sending **!pug {pug.mode}**')
-                    continue
-                await channel.send('Reset failed.')
-                log.error('Reset failed')
+            await self.finishMatch(channelId, mode, pug, refresh=False)
+
+    async def finishMatch(self, channelId, mode, pug, refresh: bool = True):
+        """Ends the match and resets the pug if the setup API reports it finished; returns whether it did"""
+        if not pug.pugLocked or pug in self.finishingPugs:
+            return False
+        self.finishingPugs.add(pug)
+        try:
+            return await self.finishLockedMatch(channelId, mode, pug, refresh)
+        finally:
+            self.finishingPugs.discard(pug)
+
+    async def finishLockedMatch(self, channelId, mode, pug, refresh: bool):
+        queueCheck = len(pug.queuedPlayers) > 0
+        if not await pug.gameServer.processMatchFinished(refresh=refresh):
+            return False
+        self.savePugConfig(self.configFile)
+        channel = discord.Client.get_channel(self.bot, channelId)
+        if channel is None:
+            return True
+        msg = f'Match finished. Resetting pug ({mode})'
+        if pug.ranked:
+            msg = msg + ' and updating player RP.'
+            await channel.send(msg)
+        else:
+            msg = msg + '...'
+            await channel.send(msg)
+        if await pug.resetPug():
+            await channel.send(pug.format_pug())
+            log.info('Match over.')
+            if queueCheck and pug.playersFull:
+                await channel.send(f'Queued players have been added and the pug is full. When ready, start the next pug by sending **!pug {pug.mode}**')
+            return True
+        await channel.send('Reset failed.')
+        log.error('Reset failed')
+        return True
+
+    def checkMatchEnd(self, pug):
+        """Starts checking the setup API for the end of a pug's match, after a console line suggests it may be over"""
+        if not pug.pugLocked or pug in self.matchEndChecks:
+            return
+        task = asyncio.ensure_future(self.runMatchEndCheck(pug))
+        self.matchEndChecks[pug] = task
+        task.add_done_callback(lambda _: self.matchEndChecks.pop(pug, None))
+
+    async def runMatchEndCheck(self, pug):
+        for delay in MATCH_END_CHECK_DELAYS:
+            await asyncio.sleep(delay)
+            if not pug.pugLocked:
+                return
+            log.debug(f'runMatchEndCheck() - checking for the end of the {pug.mode} match in {pug.channelId}')
+            pug.gameServer.lastStatusPoll = time.monotonic()
+            try:
+                if await self.finishMatch(pug.channelId, pug.mode, pug):
+                    return
+            except Exception as e:
+                log.error(f'runMatchEndCheck() - status check failed: {e!r}')
+
+    async def pollServerStatus(self, pugs):
+        """Fetches server status once per distinct server ref, concurrently, and applies each result to every pug using that server.
+        Returns a dict of server ref -> whether the status was updated successfully."""
+        pugsByRef = {}
+        for pug in pugs:
+            pugsByRef.setdefault(pug.gameServer.gameServerRef, []).append(pug)
+        refs = list(pugsByRef)
+        log.debug(f'pollServerStatus() - checking {len(refs)} server(s) for {len(pugs)} pug(s)')
+        results = await asyncio.gather(*[pugsByRef[ref][0].gameServer.getServerStatus() for ref in refs], return_exceptions=True)
+        serverStatus = {}
+        for ref, info in zip(refs, results):
+            if isinstance(info, BaseException):
+                log.error(f'pollServerStatus() - status check for {ref} failed: {info!r}')
+                info = None
+            serverStatus[ref] = False
+            for pug in pugsByRef[ref]:
+                serverStatus[ref] = pug.gameServer.applyServerStatus(info) or serverStatus[ref]
+        return serverStatus
 
     @updateGameServer.before_loop
     async def before_updateGameServer(self):
@@ -2957,36 +5260,70 @@ class PUG(commands.Cog):
         await self.bot.wait_until_ready()
         log.info('Ready.')
 
-    @tasks.loop(seconds=4.0)
+    @tasks.loop(seconds=UT_POLL_TICK)
     async def updateUTQueryReporter(self):
         if self.utReporterChannel is None:
             return
+        self.utPollScheduler.prune(set(pug for _, _, pug in self.getAllActivePugs()))
         for channelId, mode, pug in self.getAllActivePugs():
-            if pug.gameServer.utQueryReporterActive:
+            key = (pug, 'console')
+            if pug.gameServer.utQueryReporterActive and self.utPollScheduler.due(key):
                 channel = discord.Client.get_channel(self.bot, channelId)
                 if channel is None:
                     continue
-                await self.queryServerConsole()
+                if not self.utPollScheduler.acquire():
+                    break
+                newLines = await self.queryServerConsole(pug)
+                self.utPollScheduler.schedule(key, pug.gameServer.utConsolePollInterval(newLines), failed=not pug.gameServer.utQueryData.online)
         return
 
     @updateUTQueryReporter.before_loop
     async def before_updateUTQueryReporter(self):
         await self.bot.wait_until_ready()
 
-    @tasks.loop(seconds=60.0)
+    @tasks.loop(seconds=CONSOLE_RELAY_INTERVAL)
+    async def flushConsoleRelay(self):
+        if self.utReporterChannel is None or not len(self.utConsoleRelay):
+            return
+        await self.utConsoleRelay.flush(self.utReporterChannel)
+        return
+
+    @flushConsoleRelay.before_loop
+    async def before_flushConsoleRelay(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=RATINGS_FLUSH_INTERVAL)
+    async def flushRatings(self):
+        # Changes are saved as they are made; this retries any that failed and compacts the store in the background
+        await self.ratingsRepo.flush()
+        await self.ratingsRepo.compact()
+
+    @tasks.loop(seconds=UT_POLL_TICK)
     async def updateUTQueryStats(self):
         if self.utReporterChannel is None:
             return
         for channelId, mode, pug in self.getAllActivePugs():
+            key = (pug, 'stats')
+            if not self.utPollScheduler.due(key):
+                continue
             channel = discord.Client.get_channel(self.bot, channelId)
             if channel is None:
                 continue
+            interval = pug.gameServer.utStatsPollInterval()
             if pug.gameServer.utQueryStatsActive:
-                if ('laststats' not in pug.gameServer.utQueryData) or ('laststats' in pug.gameServer.utQueryData and int(time.time()) - int(pug.gameServer.utQueryData['laststats']) > 55):
-                    await self.queryServerStats(cacheonly=False, pug=pug)
+                sinceLast = int(time.time()) - pug.gameServer.utQueryData.lastStats
+                if sinceLast < interval:
+                    # A card went out from elsewhere (e.g. after a score line), so count from that one
+                    self.utPollScheduler.schedule(key, interval - sinceLast)
+                    continue
+                if not self.utPollScheduler.acquire():
+                    break
+                await self.queryServerStats(cacheonly=False, pug=pug)
+                self.utPollScheduler.schedule(key, pug.gameServer.utStatsPollInterval(), failed=not pug.gameServer.utQueryData.online)
             elif pug.gameServer.utQueryReporterActive and pug.pugLocked:
                 # Skip one cycle, then re-enable stats
                 pug.gameServer.utQueryStatsActive = True
+                self.utPollScheduler.schedule(key, interval)
         return
 
     @updateUTQueryStats.before_loop
@@ -3015,11 +5352,6 @@ class PUG(commands.Cog):
         for channelId, mode, pug in self.getAllActivePugs():
             pug.matchReportPending = False
 
-    @tasks.loop(minutes=5)
-    async def updateGuildEmojis(self):
-        self.cacheGuildEmojis()
-        return
-    
     @tasks.loop(hours=1)
     async def updateServerRotation(self):
         # Only auto-rotate between 6:00 and 9:59 am on a Monday
@@ -3027,7 +5359,7 @@ class PUG(commands.Cog):
             for channelId, mode, pug in self.getAllActivePugs():
                 if not pug.pugLocked:
                     log.debug(f'updateServerRotation loop - calling checkServerRotation() for {channelId} {mode} pug')
-                    pug.gameServer.checkServerRotation()
+                    await pug.gameServer.checkServerRotation()
         return
 #########################################################################################
 # Utilities.
@@ -3074,7 +5406,7 @@ class PUG(commands.Cog):
                                 if 'maxmaps' in modeData:
                                     pug.maps.setMaxMaps(modeData['maxmaps'])
                                 if 'server' in modeData:
-                                    pug.gameServer.useServer(index=-1,autostart=False,byref=modeData['server'])
+                                    pug.gameServer.selectServer(byref=modeData['server'])
                                 if 'timesaved' in modeData:
                                     try:
                                         time_saved = datetime.fromisoformat(modeData['timesaved'])
@@ -3257,6 +5589,18 @@ class PUG(commands.Cog):
     # Functions:
     #########################################################################################
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Channels can't be resolved until the bot is connected, so pick up pug guild emojis here as well
+        self.mergeGuildEmojis()
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild, before, after):
+        if guild.id not in [g.id for g in self.getPugGuilds()]:
+            return
+        self.cacheGuildEmojis(guild, after)
+        self.mergeGuildEmojis()
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         pug = self.getPugForChannel(self.activeChannel.id)
@@ -3287,7 +5631,7 @@ class PUG(commands.Cog):
             pug = self.getPugForChannel(self.activeChannel.id)
         if pug.gameServer.gameServerState in ('N/A','N/AN/A') and pug.gameServer.gameServerOnDemand is True:
             await ctx.send(f'Starting on-demand server: {pug.gameServer.gameServerName}...')
-            info = pug.gameServer.controlOnDemandServer('start')
+            info = await pug.gameServer.controlOnDemandServer('start')
             if (info):
                 log.info(f'On-demand server start {pug.gameServer.gameServerName} returned: {info["cloudManagementResponse"]}')
                 return True
@@ -3311,39 +5655,22 @@ class PUG(commands.Cog):
         if pug.mapsReady and pug.matchReady:
             if pug.pugTempLocked > 1:
                 if ctx is not None:
-                    await ctx.send(holdMessage)
+                    await self.outbound.post(ctx, holdMessage)
                 return
-            elif pug.pugTempLocked > 0:
+            elif pug.pugTempLocked > 0 or pug.setupInProgress:
                 # Avoid repeating a setup when multiple conditions are true
                 return
             if pug.ranked:
                 msg = '\n'.join([f'[**{pug.mode}**] Ranked mode map selection complete. Setting up match now.',pug.maps.format_current_maplist])
                 pug.pugTempLocked = 1
                 self.ratingsLock = True
-                await ctx.send(msg)
+                await self.outbound.post(ctx, msg)
             if pug.gameServer.gameServerOnDemand and not pug.gameServer.gameServerOnDemandReady:
                 if ctx is not None:
-                    await ctx.send(f'Waiting for {pug.gameServer.gameServerName} to be ready for action...')
-            setupPug = pug.setupPug()
-            if setupPug[0]:
-                await self.sendPasswordsToTeams(self.activeChannel.id, pug.mode)
-                if ctx is not None:
-                    await ctx.send(f'[**{pug.mode}**] {pug.format_match_is_ready}')
-                pug.gameServer.utQueryConsoleWatermark = pug.gameServer.format_new_watermark
-                pug.gameServer.utQueryData = {}
-                pug.gameServer.utQueryReporterActive = True
-                pug.gameServer.utQueryStatsActive = True
-                self.resetRequestRed = False # only need to reset this here because we only care about this when a match is in progress.
-                self.resetRequestBlue = False # only need to reset this here because we only care about this when a match is in progress.
-                self.pushMultiInstancePlayers(self.activeChannel.id, pug.mode) # Move any players from other pugs in the same channel to temp storage while match is in progress
-            else:
-                if setupPug[1].lower() == 'locked':
-                    pug.pugTempLocked = 2 # enforce long temporary lock
-                    if ctx is not None:
-                        await ctx.send(holdMessage)
-                else:
-                    if ctx is not None:
-                        await ctx.send(f'[**{pug.mode}**] **PUG Setup Failed**. Use **!retry** to attempt setting up again with current configuration, or **!reset** to start again from the beginning.')
+                    await self.outbound.post(ctx, f'Waiting for {pug.gameServer.gameServerName} to be ready for action...')
+            # Run the setup in the background so the command (and other channels) are not held up by retries
+            pug.setupJob = asyncio.ensure_future(self.runSetupJob(ctx, pug, self.activeChannel.id))
+            pug.setupJob.add_done_callback(functools.partial(self.setupJobDone, ctx, pug))
             return
 
         if pug.teamsReady:
@@ -3354,27 +5681,28 @@ class PUG(commands.Cog):
                     pug.ratings['maps']['maplist'] = pug.maps.mapListWeighting
                 await self.processPugStatus(ctx, pug) # loop back around
             else:
-                await ctx.send(self.format_pick_next_map(mention=True, pug=pug))
+                await self.outbound.post(ctx, self.format_pick_next_map(mention=True, pug=pug))
             return
         
         if pug.captainsReady:
             # Special case to display captains on the first pick.
             if len(pug.red) == 1 and len(pug.blue) == 1:
-                await ctx.send(pug.red[0].mention + f' is captain for the {pug.mode} **Red Team**')
-                await ctx.send(pug.blue[0].mention + f' is captain for the {pug.mode} **Blue Team**')
+                await self.outbound.post(ctx, '\n'.join([
+                    pug.red[0].mention + f' is captain for the {pug.mode} **Red Team**',
+                    pug.blue[0].mention + f' is captain for the {pug.mode} **Blue Team**']))
             # Need to pick players.
             msg = '\n'.join([
                 pug.format_remaining_players(number=True),
                 pug.format_teams(),
                 self.format_pick_next_player(mention=True, pug=pug)])
-            await ctx.send(msg)
+            await self.outbound.post(ctx, msg)
             # Check server state and fire a start-up command if needed
             await self.checkOnDemandServer(ctx)
             return
         
         if pug.numCaptains == 1:
             # Need second captain.
-            await ctx.send(f'[**{pug.mode}**] Waiting for 2nd captain. Type **!captain** to become a captain. To choose a random captain type **!randomcaptains**')
+            await self.outbound.post(ctx, f'[**{pug.mode}**] Waiting for 2nd captain. Type **!captain** to become a captain. To choose a random captain type **!randomcaptains**')
             return
 
         if pug.playersReady:
@@ -3382,7 +5710,7 @@ class PUG(commands.Cog):
                 # Logic is reversed, fill teams and then nominate random captains
                 costmsg = pug.makeRatedTeams()
                 msg = '\n'.join([f'[**{pug.mode}**] Ranked teams have been established:',pug.format_teams(),costmsg])
-                await ctx.send(msg)
+                await self.outbound.post(ctx, msg)
                 await self.checkOnDemandServer(ctx)
                 await self.processPugStatus(ctx, pug) # loop back around
                 return
@@ -3393,8 +5721,8 @@ class PUG(commands.Cog):
                     # Special case, 1v1: assign captains instantly, so jump straight to map picks.
                     pug.setCaptain(pug.players[0])
                     pug.setCaptain(pug.players[1])
-                    await ctx.send(f'[**{pug.mode}**] Teams have been automatically filled.\n{pug.format_teams(mention=True)}')
-                    await ctx.send(f'{self.format_pick_next_map(mention=False, pug=pug)}')
+                    await self.outbound.post(ctx, f'[**{pug.mode}**] Teams have been automatically filled.\n{pug.format_teams(mention=True)}')
+                    await self.outbound.post(ctx, f'{self.format_pick_next_map(mention=False, pug=pug)}')
                     # Check server state and fire a start-up command if needed
                     await self.checkOnDemandServer(ctx)
                     return
@@ -3402,32 +5730,83 @@ class PUG(commands.Cog):
                 msg.append(pug.format_pug(mention=True))
                 # Need first captain
                 msg.append(f'[**{pug.mode}**] Waiting for captains. Type **!captain** to become a captain. To choose random captains type **!randomcaptains**')
-            await ctx.send('\n'.join(msg))
+            await self.outbound.post(ctx, '\n'.join(msg))
+            return
+
+    async def runSetupJob(self, ctx, pug, channelId):
+        """Background setup job for a pug, posting progress and the outcome to the channel"""
+        holdMessage = f'[**{pug.mode}**] Match is currently on hold while another game is in progress on the selected server or with the selected players.'
+        async def progress(msg):
+            if ctx is not None:
+                await self.outbound.post(ctx, f'[**{pug.mode}**] {msg}')
+
+        setupPug = await pug.setupPug(progress)
+        if setupPug[0]:
+            await self.sendPasswordsToTeams(channelId, pug.mode)
+            if ctx is not None:
+                await self.outbound.post(ctx, f'[**{pug.mode}**] {pug.format_match_is_ready}')
+            pug.gameServer.utQueryConsoleWatermark = pug.gameServer.format_new_watermark
+            pug.gameServer.utQueryData = UTQueryData()
+            pug.gameServer.utScoreboard.reset()
+            self.utPollScheduler.reset(pug)
+            pug.gameServer.utQueryReporterActive = True
+            pug.gameServer.utQueryStatsActive = True
+            self.resetRequestRed = False # only need to reset this here because we only care about this when a match is in progress.
+            self.resetRequestBlue = False # only need to reset this here because we only care about this when a match is in progress.
+            self.pushMultiInstancePlayers(channelId, pug.mode) # Move any players from other pugs in the same channel to temp storage while match is in progress
+        else:
+            if setupPug[1].lower() == 'locked':
+                pug.pugTempLocked = 2 # enforce long temporary lock
+                if ctx is not None:
+                    await self.outbound.post(ctx, holdMessage)
+            elif setupPug[1].lower() == 'cancelled':
+                log.debug(f'runSetupJob() - Setup for {pug.mode} was cancelled by a reset.')
+            else:
+                if ctx is not None:
+                    await self.outbound.post(ctx, f'[**{pug.mode}**] **PUG Setup Failed**. Use **!retry** to attempt setting up again with current configuration, or **!reset** to start again from the beginning.')
+        return setupPug[0]
+
+    def setupJobDone(self, ctx, pug, job):
+        """Reports a setup job that ended with an exception, which would otherwise go unnoticed"""
+        if job.cancelled() or job.exception() is None:
             return
+        log.error(f'runSetupJob() - Setup for {pug.mode} raised {job.exception()!r}', exc_info=job.exception())
+        if ctx is not None: # a done callback cannot await; nothing is sent after this
+            self.outbound.post(ctx, f'[**{pug.mode}**] **PUG Setup Failed**. Use **!retry** to attempt setting up again with current configuration, or **!reset** to start again from the beginning.')
+
+    async def sendPasswordDM(self, semaphore, player, message):
+        """DMs one player their password, returning whether it was delivered in time"""
+        async with semaphore:
+            try:
+                await asyncio.wait_for(player.send(message), DM_TIMEOUT)
+                return True
+            except Exception as e:
+                log.warning(f'sendPasswordDM() - could not DM {player}: {e!r}')
+                return False
 
     async def sendPasswordsToTeams(self, channelId, mode):
         pug = self.getPugForChannel(channelId, mode)
+        channel = None
         if pug.matchReady:
-            msg_redPassword = pug.gameServer.format_red_password
-            msg_redServer = pug.gameServer.format_gameServerURL_red
-            msg_bluePassword = pug.gameServer.format_blue_password
-            msg_blueServer = pug.gameServer.format_gameServerURL_blue
+            msg_red = f'{pug.gameServer.format_red_password}\nJoin the server @ **{pug.gameServer.format_gameServerURL_red}**'
+            msg_blue = f'{pug.gameServer.format_blue_password}\nJoin the server @ **{pug.gameServer.format_gameServerURL_blue}**'
             if pug.channelId is not None:
                 channel = discord.Client.get_channel(self.bot, pug.channelId)
             else:
                 channel = self.activeChannel
-            for player in pug.red:
-                try:
-                    await player.send(f'{msg_redPassword}\nJoin the server @ **{msg_redServer}**')
-                except:
-                    await channel.send(f'Unable to send password to {player.mention} - are DMs enabled? Please ask your teammates for the red team password.')
-            for player in pug.blue:
-                try:
-                    await player.send(f'{msg_bluePassword}\nJoin the server @ **{msg_blueServer}**')
-                except:
-                    await channel.send(f'Unable to send password to {player.mention} - are DMs enabled? Please ask your teammates for the blue team password.')
+            # Send every DM at once (a few at a time), so the whole lobby has its password after about one round trip
+            semaphore = asyncio.Semaphore(DM_CONCURRENCY)
+            recipients = [(player, 'red', msg_red) for player in pug.red] + [(player, 'blue', msg_blue) for player in pug.blue]
+            results = await asyncio.gather(*[self.sendPasswordDM(semaphore, player, message) for player, _, message in recipients])
+            failed = {}
+            for (player, team, _), delivered in zip(recipients, results):
+                if not delivered:
+                    failed.setdefault(team, []).append(player.mention)
+            if failed and channel:
+                teams = ' and '.join(f'{", ".join(mentions)} ({team} team)' for team, mentions in failed.items())
+                await self.outbound.post(channel, f'Unable to send passwords to {teams} - are DMs enabled? Please ask your teammates for your team password.')
         if channel:
-            await channel.send('Check private messages for server passwords.')
+            await self.outbound.post(channel, 'Check private messages for server passwords.')
         return True
 
     async def isPugInProgress(self, ctx, warn: bool=False):
@@ -3439,44 +5818,49 @@ class PUG(commands.Cog):
             raise PugIsInProgress('Pug In Progress')
         return not pug.pugLocked
     
-    async def queryServerConsole(self):
+    async def queryServerConsole(self, pug=None):
+        """Relays new console lines for a pug, returning how many were queued"""
+        if pug is None:
+            pug = self.getPugForChannel(self.activeChannel.id)
+        newLines = 0
         # Fetch watermark from previous messages
-        pug = self.getPugForChannel(self.activeChannel.id)
         consoleWatermark = pug.gameServer.utQueryConsoleWatermark
         reportToChannel = self.utReporterChannel
         # Fetch console log
-        if pug.gameServer.utQueryServer('consolelog') and reportToChannel is not None:
-            if 'code' in pug.gameServer.utQueryData and pug.gameServer.utQueryData['code'] == 200:
-                if 'consolelog' in pug.gameServer.utQueryData:
+        # The console log is a live feed, so always ask the server rather than reuse a cached reply
+        if await pug.gameServer.utQueryServer('consolelog', maxAge=0) and reportToChannel is not None:
+            if pug.gameServer.utQueryData.online:
+                if pug.gameServer.utQueryData.consoleLog is not None:
+                    queuedLines = len(self.utConsoleRelay)
                     bReportScoreLine = False
+                    bMatchEndLine = False
                     # Attempt to serialize to JSON, otherwise if server doesn't support this, use simple string manipulation
                     try:
-                        utconsole = json.loads(pug.gameServer.utQueryData['consolelog'])
+                        utconsole = json.loads(pug.gameServer.utQueryData.consoleLog)
                     except:
                         utconsole = {}
-                        utconsole['messages'] = str(pug.gameServer.utQueryData['consolelog']).split('|')
+                        utconsole['messages'] = str(pug.gameServer.utQueryData.consoleLog).split('|')
 
                     for m in utconsole['messages']:
                         try:
                             # Message format: {"stamp":"20220101133700666", "type":"Say", "gametime":"120", "displaytime":"02:00", "message": ":robot::guitar:", "teamindex":"0", "team":"Red", "player":"Sizzl"}
                             if 'message' in m and 'stamp' in m and int(m['stamp']) > pug.gameServer.utQueryConsoleWatermark:
                                 if 'type' in m and m['type'] == 'Say':
-                                    for em in self.customStaticEmojis:
-                                        m['message']  = re.compile(em).sub(f'<{em}{self.customStaticEmojis[em]}>', m['message'])
-                                    for em in self.customAnimatedEmojis:
-                                        m['message']  = re.compile(em).sub(f'<a{em}{self.customAnimatedEmojis[em]}>', m['message'])
+                                    m['message'] = self.emojiReplacer.sub(m['message'])
                                     if 'team' in m:
                                         if m['team'] == 'Spectator':
-                                            await reportToChannel.send(f'[{m["displaytime"]}] {m["player"].strip()} (*{m["team"]}*): {m["message"].strip()}')
+                                            self.utConsoleRelay.add(f'[{m["displaytime"]}] {m["player"].strip()} (*{m["team"]}*): {m["message"].strip()}', int(m['stamp']))
                                         else:
-                                            await reportToChannel.send(f'[{m["displaytime"]}] {m["player"].strip()} (**{m["team"]}**): {m["message"].strip()}')
+                                            self.utConsoleRelay.add(f'[{m["displaytime"]}] {m["player"].strip()} (**{m["team"]}**): {m["message"].strip()}', int(m['stamp']))
                                     else:
-                                        await reportToChannel.send(f'[{m["displaytime"]}] {m["player"].strip()}: {m["message"].strip()}')
+                                        self.utConsoleRelay.add(f'[{m["displaytime"]}] {m["player"].strip()}: {m["message"].strip()}', int(m['stamp']))
                                 else:
-                                    if re.search('1\sminutes\suntil\sgame\sstart|conquered\sthe\sbase|defended\sthe\sbase',m['message'],re.IGNORECASE) is not None:
+                                    if SCORE_LINE_PATTERN.search(m['message']) is not None:
                                         bReportScoreLine = True
+                                    if MATCH_END_PATTERN.search(m['message']) is not None:
+                                        bMatchEndLine = True
                                     if len(m['message'].strip()) > 0:
-                                        await reportToChannel.send(f'[{m["displaytime"]}] {m["message"].strip()}')
+                                        self.utConsoleRelay.add(f'[{m["displaytime"]}] {m["message"].strip()}', int(m['stamp']))
                                 consoleWatermark = int(m['stamp'])
                         except:
                             try:
@@ -3486,17 +5870,23 @@ class PUG(commands.Cog):
                             except:
                                 stamp = 0
                             if stamp > pug.gameServer.utQueryConsoleWatermark:
-                                await reportToChannel.send(f'{m[-(len(m)-18):]}')
-                                if re.search('1\sminutes\suntil\sgame\sstart|conquered\sthe\sbase|defended\sthe\sbase',m,re.IGNORECASE) is not None:
+                                self.utConsoleRelay.add(f'{m[-(len(m)-18):]}', stamp)
+                                if SCORE_LINE_PATTERN.search(m) is not None:
                                     bReportScoreLine = True
+                                if MATCH_END_PATTERN.search(m) is not None:
+                                    bMatchEndLine = True
                             if stamp > 0:
                                 consoleWatermark = stamp
                             else:
                                 consoleWatermark = pug.gameServer.format_new_watermark
                     pug.gameServer.utQueryConsoleWatermark = consoleWatermark
+                    newLines = len(self.utConsoleRelay) - queuedLines
+                    if bMatchEndLine:
+                        self.checkMatchEnd(pug)
 
                     if pug.gameServer.utQueryStatsActive is False:
-                        # Picking up a deferred stats request (from bReportScoreLine)
+                        # Picking up a deferred stats request (from bReportScoreLine); send any buffered lines first so the card follows them
+                        await self.utConsoleRelay.flush(reportToChannel)
                         await self.queryServerStats(cacheonly=False, pug=pug)
                         # Reset the requirement for scoreline and re-enable the infrequent stats embed
                         bReportScoreLine = False
@@ -3505,27 +5895,31 @@ class PUG(commands.Cog):
                     if bReportScoreLine:
                         # Defer a scoreline report to the next cycle of this function by disabling the infrequent stats embed
                         pug.gameServer.utQueryStatsActive = False
-            elif 'code' in pug.gameServer.utQueryData and pug.gameServer.utQueryData['code'] == 408 and pug.pugLocked == False:
+            elif pug.gameServer.utQueryData.code == 408 and pug.pugLocked == False:
                 pug.gameServer.utQueryStatsActive = False
                 pug.gameServer.utQueryReporterActive = False
-        return True
+        return newLines
 
-    async def queryServerStats(self, cacheonly: bool=False, pug=None):
+    async def queryServerStats(self, cacheonly: bool=False, pug=None, gameServer=None):
         if pug is None:
             pug = self.getPugForChannel(self.activeChannel.id)
+        if gameServer is None:
+            gameServer = pug.gameServer
         spacer = "\u2800"*3
-        embedInfo = discord.Embed(color=discord.Color.greyple(),title=pug.gameServer.format_current_serveralias,description='Waiting for server info...')
-        # Send "info" to get basic server details and confirm online
-        if pug.gameServer.utQueryServer('info'):
-            if 'code' in pug.gameServer.utQueryData and pug.gameServer.utQueryData['code'] == 200:
+        embedInfo = discord.Embed(color=discord.Color.greyple(),title=gameServer.format_current_serveralias,description='Waiting for server info...')
+        # Send all queries as one request so the card costs a single round trip; servers not running UTA
+        # simply leave out the objectives and teams, and each query replaces the results it covers
+        if await gameServer.utQueryServer('info', UT_QUERY_STATUS, 'objectives', 'teams'):
+            queryData = gameServer.utQueryData
+            if queryData.online:
                 if cacheonly is False:
                     # Rate-limit reporter-channel stats cards to one a minute, even after an on-demand stats call
-                    pug.gameServer.utQueryData['laststats'] = int(time.time())
+                    queryData.lastStats = int(time.time())
 
-                # Send multi-query request for lots of info
-                if pug.gameServer.utQueryServer('status\\\\level_property\\timedilation\\\\game_property\\teamscore\\\\game_property\\teamnamered\\\\game_property\\teamnameblue\\\\player_property\\Health\\\\game_property\\elapsedtime\\\\game_property\\remainingtime\\\\game_property\\bmatchmode\\\\game_property\\friendlyfirescale\\\\game_property\\currentdefender\\\\game_property\\bdefenseset\\\\game_property\\matchcode\\\\game_property\\fraglimit\\\\game_property\\timelimit\\\\rules'):
-                    queryData = pug.gameServer.utQueryData
-                    log.debug(queryData)
+                # Multi-query reply for lots of info
+                if queryData.server is not None:
+                    server = queryData.server
+                    log.debug(f'{queryData.address}: {server.hostname} on {server.mapName}, {len(queryData.players)} players, {len(queryData.objectives)} objectives')
 
                     # Build embed data
                     summary = {
@@ -3543,111 +5937,90 @@ class PUG(commands.Cog):
                     summary['PlayerList255'] = '*(No Spectators)*'
                     summary['PlayerList255_data'] = ''
                     # Pick out generic UT info
-                    if 'hostname' in queryData:
-                        if 'mutators' in queryData and re.search('Lag\sCompensator',str(queryData['mutators']),re.IGNORECASE) is not None:
-                            summary['Title'] = summary['Hostname'] = queryData['hostname'].replace('| StdAS |','| lcAS |')
+                    if server.hostname:
+                        if re.search('Lag\sCompensator',server.mutators,re.IGNORECASE) is not None:
+                            summary['Title'] = summary['Hostname'] = server.hostname.replace('| StdAS |','| lcAS |')
                         else:
-                            summary['Title'] = summary['Hostname'] = queryData['hostname'].replace('| iAS | zp|','| zp-iAS |')
-                    if 'mapname' in queryData:
-                        embedInfo.set_thumbnail(url=f'{pug.gameServer.thumbnailServer}{str(queryData["mapname"]).lower()}.jpg')
-                        summary['Map'] = queryData['mapname']
-                    if 'remainingtime' in queryData:
-                        summary['RemainingTime'] = f'{str(time.strftime("%M:%S",time.gmtime(int(queryData["remainingtime"]))))}'
-                    elif 'elapsedtime' in queryData:
-                        summary['ElapsedTime'] = f'{str(time.strftime("%M:%S",time.gmtime(int(queryData["elapsedtime"]))))}'
-                    elif 'timelimit' in queryData and int(queryData['timelimit']) > 0:
-                        summary['TimeLimit'] = f'{int(queryData["timelimit"])}:00'
-                    if 'maptitle' in queryData:
-                        summary['Map'] = queryData['maptitle']
-                    if 'numplayers' in queryData and 'maxplayers' in queryData:
-                        summary['PlayerCount'] = f'{queryData["numplayers"]}/{queryData["maxplayers"]}'
-                        if 'maxteams' in queryData and int(queryData['numplayers']) > 0:
-                            for x in range(int(queryData['numplayers'])):
-                                if f'player_{x}' in queryData:
-                                    player = {}
-                                    player['Name'] = queryData[f'player_{x}'].replace('`','').strip()
-                                    if len(player['Name']) > 14:
-                                        player['Name'] = f'{player["Name"][:12]}...'.strip()
-                                    player['Frags'] = '0'
-                                    if f'frags_{x}' in queryData:
-                                        player['Frags'] = queryData[f'frags_{x}'].strip()                                                                                        
-                                    player['Ping'] = '0'
-                                    if f'ping_{x}' in queryData:
-                                        player['Ping'] = queryData[f'ping_{x}'].strip()
-                                        if len(str(player['Ping'])) > 3:
-                                            player['Ping'] = '---'
-                                    if f'team_{x}' in queryData:
-                                        player['TeamId'] = queryData[f'team_{x}']
-                                    team_id = player['TeamId']
-                                    player_list_key = f'PlayerList{team_id}_data'
-                                    if player['TeamId'] == '255':
-                                        summary[player_list_key] = f'{summary[player_list_key]}\n{player["Name"].ljust(15)}{"".rjust(5)}{player["Ping"].rjust(4)}'
-                                    else:
-                                        summary[player_list_key] = f'{summary[player_list_key]}\n{player["Name"].ljust(15)}{player["Frags"].rjust(5)}{player["Ping"].rjust(4)}'
-
-                                    for x in range(int(queryData['maxteams'])):
-                                        key = f'PlayerList{x}'
-                                        data_key = f'PlayerList{x}_data'
-                                        if summary[data_key] not in ['',None]:
-                                            summary[key] = f'```Player Name{spacer}\t Score Ping'
-                                            summary[key] = f'{summary[key]}{summary[data_key]}\n```'
-                            
-                            if summary['PlayerList255_data'] not in ['',None]:
-                                summary['PlayerList255'] = f'```Name       {spacer}\t       Ping'
-                                summary['PlayerList255'] = f'{summary["PlayerList255"]}{summary["PlayerList255_data"]}\n```'
+                            summary['Title'] = summary['Hostname'] = server.hostname.replace('| iAS | zp|','| zp-iAS |')
+                    if server.mapName:
+                        embedInfo.set_thumbnail(url=f'{gameServer.thumbnailServer}{server.mapName.lower()}.jpg')
+                        summary['Map'] = server.mapName
+                    if server.remainingTime is not None:
+                        summary['RemainingTime'] = f'{str(time.strftime("%M:%S",time.gmtime(server.remainingTime)))}'
+                    elif server.elapsedTime is not None:
+                        summary['ElapsedTime'] = f'{str(time.strftime("%M:%S",time.gmtime(server.elapsedTime)))}'
+                    elif server.timeLimit > 0:
+                        summary['TimeLimit'] = f'{server.timeLimit}:00'
+                    if server.mapTitle:
+                        summary['Map'] = server.mapTitle
+                    summary['PlayerCount'] = f'{server.numPlayers}/{server.maxPlayers}'
+                    if server.maxTeams is not None and server.numPlayers > 0:
+                        for player in queryData.players:
+                            name = player.name
+                            if len(name) > 14:
+                                name = f'{name[:12]}...'.strip()
+                            ping = player.ping
+                            if len(ping) > 3:
+                                ping = '---'
+                            player_list_key = f'PlayerList{player.team}_data'
+                            if player_list_key not in summary:
+                                continue
+                            if player.team == 255:
+                                summary[player_list_key] = f'{summary[player_list_key]}\n{name.ljust(15)}{"".rjust(5)}{ping.rjust(4)}'
+                            else:
+                                summary[player_list_key] = f'{summary[player_list_key]}\n{name.ljust(15)}{player.frags.rjust(5)}{ping.rjust(4)}'
+
+                        for x in range(min(server.maxTeams, 4)):
+                            key = f'PlayerList{x}'
+                            data_key = f'PlayerList{x}_data'
+                            if summary[data_key] not in ['',None]:
+                                summary[key] = f'```Player Name{spacer}\t Score Ping'
+                                summary[key] = f'{summary[key]}{summary[data_key]}\n```'
+
+                        if summary['PlayerList255_data'] not in ['',None]:
+                            summary['PlayerList255'] = f'```Name       {spacer}\t       Ping'
+                            summary['PlayerList255'] = f'{summary["PlayerList255"]}{summary["PlayerList255_data"]}\n```'
 
                     # Set basic embed info
                     embedInfo.color = summary['Colour']
                     embedInfo.title = summary['Title']
-                    embedInfo.description = f'```unreal://{queryData["ip"]}:{queryData["game_port"]}```'
+                    embedInfo.description = f'```{queryData.address}```'
 
-                    if 'password' in queryData and queryData['password'] == 'True' and pug.gameServer.format_gameServerURL==f'unreal://{queryData["ip"]}:{queryData["game_port"]}':
-                        embedInfo.set_footer(text=f'Spectate @ {pug.gameServer.format_gameServerURL}/?password={pug.gameServer.spectatorPassword}')
+                    if server.password and gameServer.format_gameServerURL == queryData.address:
+                        embedInfo.set_footer(text=f'Spectate @ {gameServer.format_gameServerURL}/?password={gameServer.spectatorPassword}')
 
                     # Pick out info for UTA-only games
-                    if 'bmatchmode' in queryData and 'gametype' in queryData and queryData['gametype'] == 'Assault':
-                        # Send individual requests for objectives and UTA-enhanced team info, refresh local variable
-                        pug.gameServer.utQueryServer('objectives')
-                        pug.gameServer.utQueryServer('teams')
-                        queryData = pug.gameServer.utQueryData
-    
-                        if 'AdminName' in queryData and queryData['AdminName'] not in ['OPEN - PUBLIC','LOCKED - PRIVATE']:
+                    if server.isUTAssault:
+                        if server.adminName is not None and not server.isPublic:
                             # Match mode is active
-                            if 'score_0' in queryData and 'score_1' in queryData:
-                                if queryData['score_0'] > queryData['score_1']:
+                            if len(queryData.teams) >= 2:
+                                red, blue = queryData.teams[0].score, queryData.teams[1].score
+                                if red > blue:
                                     summary['Colour'] = discord.Color.red()
-                                elif queryData['score_0'] < queryData['score_1']:
+                                elif red < blue:
                                     summary['Colour'] = discord.Color.blurple()
-                                if 'teamnamered' in queryData and 'teamnameblue' in queryData:
-                                    summary['Title'] = f'{pug.desc} | {queryData["teamnamered"]} {queryData["score_0"]} - {queryData["score_1"]} {queryData["teamnameblue"]}'
+                                if server.teamNameRed is not None and server.teamNameBlue is not None:
+                                    summary['Title'] = f'{pug.desc} | {server.teamNameRed} {red} - {blue} {server.teamNameBlue}'
                                 else:
-                                    summary['Title'] = f'{pug.desc} | RED {queryData["score_0"]} - {queryData["score_1"]} BLUE'
-                            summary['Hostname'] = f'```unreal://{queryData["ip"]}:{queryData["game_port"]}```'
-                        elif 'AdminName' in queryData and queryData['AdminName'] in ['OPEN - PUBLIC','LOCKED - PRIVATE']:
-                            summary['Hostname'] = f'```unreal://{queryData["ip"]}:{queryData["game_port"]}```'
+                                    summary['Title'] = f'{pug.desc} | RED {red} - {blue} BLUE'
+                            summary['Hostname'] = f'```{queryData.address}```'
+                        elif server.adminName is not None:
+                            summary['Hostname'] = f'```{queryData.address}```'
                         # Build out round info
-                        if 'bdefenseset' in queryData and 'currentdefender' in queryData:
-                            if queryData['bdefenseset'] in ['true','True','1']:
-                                summary['RoundStatus'] = '2/2'
-                            else:
-                                summary['RoundStatus'] = '1/2'
-                            if queryData['currentdefender'] == '1':
-                                if 'teamnamered' in queryData and queryData['AdminName'] not in ['OPEN - PUBLIC','LOCKED - PRIVATE']:
-                                    summary['RoundStatus'] = f'{summary["Hostname"]}\tRound {summary["RoundStatus"]}; {queryData["teamnamered"]} attacking'
+                        if server.defenseSet is not None and server.currentDefender is not None:
+                            summary['RoundStatus'] = '2/2' if server.defenseSet else '1/2'
+                            if server.currentDefender == '1':
+                                if server.teamNameRed is not None and not server.isPublic:
+                                    summary['RoundStatus'] = f'{summary["Hostname"]}\tRound {summary["RoundStatus"]}; {server.teamNameRed} attacking'
                                 else:
                                     summary['RoundStatus'] = f'{summary["Hostname"]}\tRound {summary["RoundStatus"]}; Red Team attacking'
                             else:
-                                if 'teamnameblue' in queryData and queryData['AdminName'] not in ['OPEN - PUBLIC','LOCKED - PRIVATE']:
-                                    summary['RoundStatus'] = f'{summary["Hostname"]}\tRound {summary["RoundStatus"]}; {queryData["teamnameblue"]} attacking'
+                                if server.teamNameBlue is not None and not server.isPublic:
+                                    summary['RoundStatus'] = f'{summary["Hostname"]}\tRound {summary["RoundStatus"]}; {server.teamNameBlue} attacking'
                                 else:
                                     summary['RoundStatus'] = f'{summary["Hostname"]}\tRound {summary["RoundStatus"]}; Blue Team attacking'
-                        if 'fortcount' in queryData:
-                            summary['Objectives'] = ''
-                            for x in range(int(queryData['fortcount'])):
-                                if x == 0:
-                                    summary['Objectives'] = f' \t {str(queryData[f"fort_{x}"])} - {str(queryData[f"fortstatus_{x}"])}'
-                                else:
-                                    summary['Objectives'] = f'{summary["Objectives"]}\n \t {str(queryData[f"fort_{x}"])} - {str(queryData[f"fortstatus_{x}"])}'
+                        if queryData.objectives:
+                            summary['Objectives'] = '\n'.join(f' \t {objective.name} - {objective.status}' for objective in queryData.objectives)
                         # Build out embed card with UTA enhanced information
                         embedInfo.color = summary['Colour']
                         embedInfo.title = summary['Title']
@@ -3659,7 +6032,6 @@ class PUG(commands.Cog):
                         embedInfo.add_field(name='Objectives',value=summary['Objectives'],inline=False)
                     else:
                         # No UTA enhanced information available, report basic statistics
-                        queryData = pug.gameServer.utQueryData
                         embedInfo.add_field(name='Map',value=summary['Map'],inline=True)
                         embedInfo.add_field(name='Players',value=summary['PlayerCount'],inline=True)
                         if 'RemainingTime' in summary:
@@ -3668,13 +6040,13 @@ class PUG(commands.Cog):
                             embedInfo.add_field(name='Time Elapsed',value=summary['ElapsedTime'],inline=True)
                         elif 'TimeLimit' in summary:
                             embedInfo.add_field(name='Time Limit',value=summary['TimeLimit'],inline=True)
-                        elif 'goalteamscore' in queryData and int(queryData['goalteamscore']) > 0:
-                            embedInfo.add_field(name='Req. Team Score',value=queryData['goalteamscore'],inline=True)
-                        elif 'fraglimit' in queryData and int(queryData['fraglimit']) > 0:
-                            embedInfo.add_field(name='Frag Limit',value=queryData['fraglimit'],inline=True)
-                        elif 'gametype' in queryData:
-                            embedInfo.add_field(name='Mode',value=queryData['gametype'],inline=True)
-                    if 'numplayers' in queryData and int(queryData['numplayers']) > 0:
+                        elif server.goalTeamScore > 0:
+                            embedInfo.add_field(name='Req. Team Score',value=server.goalTeamScore,inline=True)
+                        elif server.fragLimit > 0:
+                            embedInfo.add_field(name='Frag Limit',value=server.fragLimit,inline=True)
+                        elif server.gameType:
+                            embedInfo.add_field(name='Mode',value=server.gameType,inline=True)
+                    if server.numPlayers > 0:
                         embedInfo.add_field(name='Red Team',value=summary['PlayerList0'],inline=False)
                         embedInfo.add_field(name='Blue Team',value=summary['PlayerList1'],inline=False)
 
@@ -3682,27 +6054,54 @@ class PUG(commands.Cog):
                         embedInfo.add_field(name='Spectators',value=summary['PlayerList255'],inline=False)
 
                     if cacheonly is False:
-                        await self.utReporterChannel.send(embed=embedInfo)
+                        await gameServer.utScoreboard.update(self.utReporterChannel, embedInfo)
                 # Store the embed data for other functions to use
-                pug.gameServer.utQueryEmbedCache = embedInfo.to_dict()
+                gameServer.utQueryEmbedCache = embedInfo.to_dict()
 
-        if ('code' not in pug.gameServer.utQueryData) or ('code' in pug.gameServer.utQueryData and pug.gameServer.utQueryData['code'] > 400):
+        if gameServer.utQueryData.code is None or gameServer.utQueryData.code > 400:
             # Server offline
             embedInfo.color = discord.Color.darker_gray()
-            if pug.gameServer.gameServerOnDemand is True:
-                embedInfo.description = f'```{pug.gameServer.format_gameServerURL}```\nOn-demand server is currently offline. Start a !pug to use this server.'
-                pug.gameServer.utQueryEmbedCache = embedInfo.to_dict()
+            if gameServer.gameServerOnDemand is True:
+                embedInfo.description = f'```{gameServer.format_gameServerURL}```\nOn-demand server is currently offline. Start a !pug to use this server.'
+                gameServer.utQueryEmbedCache = embedInfo.to_dict()
             else:
-                pug.gameServer.utQueryEmbedCache = {} # fall back to old method
+                gameServer.utQueryEmbedCache = {} # fall back to old method
         return True
 
-    def cacheGuildEmojis(self):
-        if self.activeChannel is not None:
-            for x in self.activeChannel.guild.emojis:
-                if x.animated:
-                    self.customAnimatedEmojis[f':{x.name}:'] = x.id
-                else:
-                    self.customStaticEmojis[f':{x.name}:'] = x.id
+    def getPugGuilds(self):
+        """Returns the guilds hosting pug channels, with the active channel's guild last"""
+        guilds = {}
+        for channelId in self.pugInstances:
+            channel = discord.Client.get_channel(self.bot, channelId)
+            if channel is not None and channel.guild is not None:
+                guilds[channel.guild.id] = channel.guild
+        if self.activeChannel is not None and self.activeChannel.guild is not None:
+            guilds.pop(self.activeChannel.guild.id, None)
+            guilds[self.activeChannel.guild.id] = self.activeChannel.guild
+        return list(guilds.values())
+
+    def cacheGuildEmojis(self, guild, emojis=None):
+        """Stores one guild's emoji maps; emojis defaults to the guild's current list"""
+        if emojis is None:
+            emojis = guild.emojis
+        self.guildEmojis[guild.id] = ({f':{x.name}:': x.id for x in emojis if not x.animated},
+                                      {f':{x.name}:': x.id for x in emojis if x.animated})
+
+    def mergeGuildEmojis(self):
+        """Combines the emoji maps of every pug guild, rebuilding the relay's emoji replacer only if the set changed"""
+        staticEmojis = {}
+        animatedEmojis = {}
+        # Later guilds override earlier ones, so the active channel's guild at the time of the rebuild wins a name clash
+        for guild in self.getPugGuilds():
+            if guild.id not in self.guildEmojis:
+                self.cacheGuildEmojis(guild)
+            staticEmojis.update(self.guildEmojis[guild.id][0])
+            animatedEmojis.update(self.guildEmojis[guild.id][1])
+        if staticEmojis != self.customStaticEmojis or animatedEmojis != self.customAnimatedEmojis:
+            self.customStaticEmojis = staticEmojis
+            self.customAnimatedEmojis = animatedEmojis
+            self.emojiReplacer = EmojiReplacer(staticEmojis, animatedEmojis)
+            log.debug(f'mergeGuildEmojis() - relaying {len(staticEmojis)} static and {len(animatedEmojis)} animated emojis')
 
     def getPlayerPreferences(self, player: int):
         """Gets the preferences for a given player
@@ -3774,24 +6173,16 @@ class PUG(commands.Cog):
             self.savePugConfig(self.configFile)
         return True
 
-    def ratingsMatchInfo(self, mode, matchCode: str = ''):
-        matchInfo = {}
-        if self.ratingsLock != True:
-            self.savePugRatings(self.ratingsFile)
-        rkData = self.loadPugRatings(self.ratingsFile, True)
-        if 'rankedgames' in rkData:
-            for x in rkData['rankedgames']:
-                if 'mode' in x and str(x['mode']).upper() == mode.upper():
-                    if 'games' in x:
-                        if matchCode == 'last':
-                            matchInfo = sorted(x['games'], key=lambda g: datetime.fromisoformat(g['startdate']), reverse=True)[0]
-                        else:
-                            for g in x['games']:
-                                if g['gameref'].upper() == matchCode.upper():
-                                    matchInfo = g
-        return matchInfo
+    async def ratingsMatchInfo(self, mode, matchCode: str = ''):
+        await self.ratingsRepo.load([mode])
+        if matchCode == 'last':
+            games = self.ratingsRepo.recentGames(mode)
+            matchInfo = games[0] if len(games) else None
+        else:
+            matchInfo = await self.ratingsRepo.findGame(mode, matchCode)
+        return matchInfo if matchInfo is not None else {}
     
-    def ratingsMatchReport(self, mode, teamRed: list = [], teamBlue: list = [], matchref: str = '', playerid: int = 0):
+    async def ratingsMatchReport(self, mode, teamRed: list = [], teamBlue: list = [], matchref: str = '', playerid: int = 0):
         pug = self.getPugForModeInChannel(channelId=self.activeChannel.id, mode=mode, ignoreMissing=True)
         if pug is None:
             pug = self.getPugForChannel(channelId=self.activeChannel.id)
@@ -3804,7 +6195,7 @@ class PUG(commands.Cog):
                 matchref = pug.gameServer.lastMatchCode
         if len(matchref) > 0:
             embedInfo.description = f'Match reference: `{matchref}`'
-            matchInfo = self.ratingsMatchInfo(mode,matchref)
+            matchInfo = await self.ratingsMatchInfo(mode,matchref)
             if matchInfo == {}:
                 embedInfo.title = 'Match not found'
                 return embedInfo
@@ -3836,7 +6227,7 @@ class PUG(commands.Cog):
                 embedInfo.title = embedInfo.title+GRAPHUP
             else:
                 embedInfo.title = embedInfo.title
-            report = self.ratingsPlayerReport(mode=mode,players=teamRed,matchref=matchref)
+            report = await self.ratingsPlayerReport(mode=mode,players=teamRed,matchref=matchref)
             if 'cap_name' in report and report['cap_name'] not in [None,'']:
                 embedInfo.add_field(name='Captain',value=f'{report["cap_name"]}',inline=True)
                 embedInfo.add_field(name='Power',value=f'{report["cap_rp"]}',inline=True)
@@ -3857,7 +6248,7 @@ class PUG(commands.Cog):
                 embedInfo.title = embedInfo.title+GRAPHUP
             else:
                 embedInfo.title = embedInfo.title
-            report = self.ratingsPlayerReport(mode=mode,players=teamBlue,matchref=matchref)
+            report = await self.ratingsPlayerReport(mode=mode,players=teamBlue,matchref=matchref)
             if 'cap_name' in report and report['cap_name'] not in [None,'']:
                 embedInfo.add_field(name='Captain',value=f'{report["cap_name"]}',inline=True)
                 embedInfo.add_field(name='Power',value=f'{report["cap_rp"]}',inline=True)
@@ -3872,7 +6263,7 @@ class PUG(commands.Cog):
                 cards.append(embedInfo)
         if playerid > 0:
             embedInfo = discord.Embed(color=discord.Color.greyple(),title='Player rating history',description='Data not found')
-            report = self.ratingsPlayerReport(mode=mode,playerid=playerid)
+            report = await self.ratingsPlayerReport(mode=mode,playerid=playerid)
             if 'player_name' in report and report['player_name'] not in [None,'']:
                 embedInfo.description = f'Ratings history for {report["player_name"]}'
                 embedInfo.add_field(name='Last game',value=f'{report["player_last"]}',inline=False)
@@ -3882,7 +6273,7 @@ class PUG(commands.Cog):
                 cards.append(embedInfo)
         return cards
     
-    def ratingsPlayerReport(self, mode, players: list = [], matchref: str = '', playerid: int = 0):
+    async def ratingsPlayerReport(self, mode, players: list = [], matchref: str = '', playerid: int = 0):
         def updn(score1,score2):
             if score1 > score2:
                 status = UP
@@ -3914,7 +6305,7 @@ class PUG(commands.Cog):
                     else:
                         pSummary = f'Admin set rating on {g_startdate}: RP before: **{player["ratingprevious"]}** {updn(player["ratingvalue"],player["ratingprevious"])} RP after: **{player["ratingvalue"]}**\n'
                 else:
-                    matchInfo = self.ratingsMatchInfo(mode, player['lastgameref'])
+                    matchInfo = await self.ratingsMatchInfo(mode, player['lastgameref'])
                     if matchInfo != {}:
                         if playerid in matchInfo['teamred']:
                             pteam = 'Red'
@@ -3934,7 +6325,7 @@ class PUG(commands.Cog):
             report['player_last'] = pSummary
             pSummary = ''
             if 'ratinghistory' in player:
-                history = sorted(player['ratinghistory'], key=lambda g: datetime.fromisoformat(g['matchdate']), reverse=True)
+                history = RatingHistory.of(player).newestFirst()
                 i = 0
                 for h in history:
                     if i < 5:
@@ -3945,7 +6336,7 @@ class PUG(commands.Cog):
                             else:
                                 pSummary = f'{pSummary}Admin set rating on {g_startdate}\n> RP before: **{h["ratingbefore"]}** {updn(h["ratingafter"],h["ratingbefore"])} RP after: **{h["ratingafter"]}**\n'
                         else:
-                            matchInfo = self.ratingsMatchInfo(mode, h['matchref'])
+                            matchInfo = await self.ratingsMatchInfo(mode, h['matchref'])
                             if matchInfo != {}:
                                 if playerid in matchInfo['teamred']:
                                     pteam = 'Red'
@@ -3977,22 +6368,14 @@ class PUG(commands.Cog):
                             report['players_sum'] = report['players_sum']+pSummary
         return report
     
-    def ratingsPlayerDataHandler(self, action, mode, player, rating: int = 0, toggle: bool = False, additionalid: int = 0):
-        log.debug('ratingsPlayerDataHandler() reloading data from JSON file')
+    def ratingsPlayerDataHandler(self, action, mode, player, rating: int = 0, toggle: bool = False, additionalid: int = 0, games: list = None):
+        rkData = self.loadPugRatings(self.ratingsFile, True, mode)
+        if action == 'rkget': # Served straight from the repository indexes
+            if type(player) is str:
+                return self.ratingsRepo.getRatingByName(mode, player)
+            pid = player if type(player) is int else player.id
+            return self.ratingsRepo.getRating(mode, pid) if self.ratingsRepo.isRegistered(mode, pid) else None
         pug = self.getPugForModeInChannel(channelId=self.activeChannel.id, mode=mode, ignoreMissing=True)
-        if self.ratingsLock != True:
-            self.savePugRatings(self.ratingsFile)
-        rkData = self.loadPugRatings(self.ratingsFile, True)
-        rkReload = False
-        if 'rankedgames' in rkData:
-            for x in rkData['rankedgames']:
-                if 'mode' not in x:
-                    rkReload = True
-                elif pug is not None and 'mode' in x and pug.ranked and pug.mode.upper() == mode.upper() and pug.ratings not in [None,'']:
-                    x = pug.ratings # stamp cached ratings back
-        if rkReload:
-            self.savePugRatings(self.ratingsFile)
-            rkData = self.loadPugRatings(self.ratingsFile, True)
         if type(player) is int:
             pid = player
             pdn = ''
@@ -4008,115 +6391,109 @@ class PUG(commands.Cog):
             for x in rkData['rankedgames']:
                 if 'mode' in x and str(x['mode']).upper() == mode.upper():
                     mode = x['mode'] # update formatting
-                    if action == 'rkget' or action == 'rkrecalc':
+                    if action == 'rkrecalc':
                         msg = f'Error - Player not registered for ranked games in {mode}'
                         if pid in x['registrations'] or pid < 0:
                             for r in x['ratings']:
                                 if r['did'] == pid or (pid < 0 and 'dlastnick' in r and str(r['dlastnick']).lower() == pdn.lower()):
-                                    if action == 'rkget':
-                                        return r
-                                    elif action == 'rkrecalc':
-                                        if pid < 0: 
-                                            pid = r['did']
-                                        admsets = []
-                                        log.debug(f'ratingsPlayerDataHandler(rkrecalc) - Recalculating rank for {r["dlastnick"]}')
-                                        if rating == 0:
-                                            # Find seed rating
-                                            if r['ratingprevious'] == 0:
-                                                rating = r['ratingvalue']
-                                                rating_date = r['ratingdate']
-                                        else:
-                                            rating_date = (datetime.fromisoformat(r['ratingdate']) - timedelta(minutes=5)).isoformat()
-                                        if 'ratinghistory' in r:
-                                            history = sorted(r['ratinghistory'], key=lambda g: datetime.fromisoformat(g['matchdate']))
-                                        if len(history):
-                                            for h in history:
-                                                if h['matchref'] == 'admin-set':
-                                                    if rating == 0:
-                                                        rating = h['ratingafter']
-                                                        rating_date = h['matchdate']
-                                                    admsets.append(h)
-                                        if len(r['lastgameref']) == 0 or r['lastgameref'] == 'admin-set':
-                                            admsets.append({
-                                                'matchref': r['lastgameref'],
-                                                'matchdate': r['ratingdate'],
-                                                'ratingbefore': r['ratingprevious'],
-                                                'ratingafter': r['ratingvalue']
-                                            })
-                                        if rating == 0:
-                                            return f'Initial seed rating could not be found for {r["dlastnick"]}, please provide a seed rating.'
-                                        log.debug(f'ratingsPlayerDataHandler({mode}) - Seed rating for {r["dlastnick"]} = {rating}')
-                                        r['ratinghistory'] = admsets # Reset player rating history to admin-set only
-                                        msg = ''
-                                        r['ratingdate'] = rating_date
-                                        r['ratingvalue'] = rating
-                                        r['ratingprevious'] = 0
-                                        matches = sorted(x['games'], key=lambda g: datetime.fromisoformat(g['startdate']))
-                                        g_last = None
-                                        for m in matches:
-                                            if pid in m['teamred'] or pid in m['teamblue']:
-                                                if len(msg) == 0:
-                                                    g_date = datetime.fromisoformat(rating_date).strftime('%d/%b/%Y @ %H:%M')
-                                                    msg = f'RP recalculated for {r["dlastnick"]}:\n> Seed rating on {g_date}: **{rating}**\n'
-                                                if m['completed']:
-                                                    # Determine whether rating has been adjusted before sending to recalc
-                                                    for aset in admsets:
-                                                        if len(r['lastgamedate']) == 0:
-                                                            r['lastgamedate'] = r['ratingdate']
-                                                        if datetime.fromisoformat(aset['matchdate']) > datetime.fromisoformat(r['lastgamedate']) and datetime.fromisoformat(m['startdate']) > datetime.fromisoformat(aset['matchdate']):
-                                                            log.debug(f'ratingsPlayerDataHandler({mode}) - admin adjusted rating present between matches (last game: {r["lastgamedate"]}; update date: {aset["matchdate"]}; next match started: {m["startdate"]}). Adjusting seed for {r["dlastnick"]} to {aset["ratingafter"]} without adjusting history')
-                                                            r['ratingdate'] = aset['matchdate']
-                                                            r['ratingprevious'] = r['ratingvalue']
-                                                            r['ratingvalue'] = aset['ratingafter']
-                                                            g_date = datetime.fromisoformat(aset['matchdate']).strftime('%d/%b/%Y %H:%M')
-                                                            msg = f'{msg}> Admin updated @ {g_date}: RP before: **{r["ratingprevious"]}**; RP after: **{r["ratingvalue"]}**\n'
-                                                    if pid in m['teamred']:
-                                                        pteam = 'Red'
-                                                    else:
-                                                        pteam = 'Blue'
-                                                    if m['capred']['id'] == pid or m['capblue']['id'] == pid:
-                                                        pteam = pteam+', captain'
-                                                    g_last = datetime.fromisoformat(m['startdate'])
-                                                    g_date = g_last.strftime('%d/%b/%Y %H:%M')
-                                                    log.debug(f'ratingsPlayerDataHandler({mode}) - {r["dlastnick"]} present in match {m["gameref"]} - calculating RP')
-                                                    if pug is not None:
-                                                        rk = pug.applyRankedScoring(x, mode=mode, match=m, player=pid)
-                                                        if 'lastgameref' in rk and 'ratingprevious' in rk:
-                                                            log.debug(f'ratingsPlayerDataHandler({mode}) - Updated player data from applyRankedScoring() for match: {m["gameref"]} = {rk["lastgameref"]}; RP before: {rk["ratingprevious"]}, RP after: {rk["ratingvalue"]}')
-                                                        else:
-                                                            log.debug(f'ratingsPlayerDataHandler({mode}) - Updated player data from applyRankedScoring() for match: {m["gameref"]} = (unknown). rk = {str(rk)}')
-                                                        if 'did' in rk and rk['did'] == pid:
-                                                            r = rk
-                                                        msg = f'{msg}> Match: `{r["lastgameref"]}` @ {g_date} (team {pteam}); Score: Red {m["scorered"]} - {m["scoreblue"]} Blue. RP before: **{r["ratingprevious"]}**; RP after: **{r["ratingvalue"]}**\n'
+                                    if pid < 0: 
+                                        pid = r['did']
+                                    admsets = []
+                                    log.debug(f'ratingsPlayerDataHandler(rkrecalc) - Recalculating rank for {r["dlastnick"]}')
+                                    if rating == 0:
+                                        # Find seed rating
+                                        if r['ratingprevious'] == 0:
+                                            rating = r['ratingvalue']
+                                            rating_date = r['ratingdate']
+                                    else:
+                                        rating_date = (datetime.fromisoformat(r['ratingdate']) - timedelta(minutes=5)).isoformat()
+                                    history = RatingHistory.of(r)
+                                    if len(history):
+                                        for h in history:
+                                            if h['matchref'] == 'admin-set':
+                                                if rating == 0:
+                                                    rating = h['ratingafter']
+                                                    rating_date = h['matchdate']
+                                                admsets.append(h)
+                                    if len(r['lastgameref']) == 0 or r['lastgameref'] == 'admin-set':
+                                        admsets.append({
+                                            'matchref': r['lastgameref'],
+                                            'matchdate': r['ratingdate'],
+                                            'ratingbefore': r['ratingprevious'],
+                                            'ratingafter': r['ratingvalue']
+                                        })
+                                    if rating == 0:
+                                        return f'Initial seed rating could not be found for {r["dlastnick"]}, please provide a seed rating.'
+                                    log.debug(f'ratingsPlayerDataHandler({mode}) - Seed rating for {r["dlastnick"]} = {rating}')
+                                    r['ratinghistory'] = RatingHistory(admsets) # Reset player rating history to admin-set only
+                                    msg = ''
+                                    r['ratingdate'] = rating_date
+                                    r['ratingvalue'] = rating
+                                    r['ratingprevious'] = 0
+                                    matches = games if games is not None else list(reversed(self.ratingsRepo.recentGames(mode))) # every game, from allGames()
+                                    g_last = None
+                                    for m in matches:
+                                        if pid in m['teamred'] or pid in m['teamblue']:
+                                            if len(msg) == 0:
+                                                g_date = datetime.fromisoformat(rating_date).strftime('%d/%b/%Y @ %H:%M')
+                                                msg = f'RP recalculated for {r["dlastnick"]}:\n> Seed rating on {g_date}: **{rating}**\n'
+                                            if m['completed']:
+                                                # Determine whether rating has been adjusted before sending to recalc
+                                                for aset in admsets:
+                                                    if len(r['lastgamedate']) == 0:
+                                                        r['lastgamedate'] = r['ratingdate']
+                                                    if datetime.fromisoformat(aset['matchdate']) > datetime.fromisoformat(r['lastgamedate']) and datetime.fromisoformat(m['startdate']) > datetime.fromisoformat(aset['matchdate']):
+                                                        log.debug(f'ratingsPlayerDataHandler({mode}) - admin adjusted rating present between matches (last game: {r["lastgamedate"]}; update date: {aset["matchdate"]}; next match started: {m["startdate"]}). Adjusting seed for {r["dlastnick"]} to {aset["ratingafter"]} without adjusting history')
+                                                        r['ratingdate'] = aset['matchdate']
+                                                        r['ratingprevious'] = r['ratingvalue']
+                                                        r['ratingvalue'] = aset['ratingafter']
+                                                        g_date = datetime.fromisoformat(aset['matchdate']).strftime('%d/%b/%Y %H:%M')
+                                                        msg = f'{msg}> Admin updated @ {g_date}: RP before: **{r["ratingprevious"]}**; RP after: **{r["ratingvalue"]}**\n'
+                                                if pid in m['teamred']:
+                                                    pteam = 'Red'
+                                                else:
+                                                    pteam = 'Blue'
+                                                if m['capred']['id'] == pid or m['capblue']['id'] == pid:
+                                                    pteam = pteam+', captain'
+                                                g_last = datetime.fromisoformat(m['startdate'])
+                                                g_date = g_last.strftime('%d/%b/%Y %H:%M')
+                                                log.debug(f'ratingsPlayerDataHandler({mode}) - {r["dlastnick"]} present in match {m["gameref"]} - calculating RP')
+                                                if pug is not None:
+                                                    rk = pug.applyRankedScoring(x, mode=mode, match=m, player=pid)
+                                                    if 'lastgameref' in rk and 'ratingprevious' in rk:
+                                                        log.debug(f'ratingsPlayerDataHandler({mode}) - Updated player data from applyRankedScoring() for match: {m["gameref"]} = {rk["lastgameref"]}; RP before: {rk["ratingprevious"]}, RP after: {rk["ratingvalue"]}')
                                                     else:
-                                                        msg = f'{msg}> Failed to apply ranked update for match `{m["gameref"]}`. PUG could not be found.'
+                                                        log.debug(f'ratingsPlayerDataHandler({mode}) - Updated player data from applyRankedScoring() for match: {m["gameref"]} = (unknown). rk = {str(rk)}')
+                                                    if 'did' in rk and rk['did'] == pid:
+                                                        r = rk
+                                                    msg = f'{msg}> Match: `{r["lastgameref"]}` @ {g_date} (team {pteam}); Score: Red {m["scorered"]} - {m["scoreblue"]} Blue. RP before: **{r["ratingprevious"]}**; RP after: **{r["ratingvalue"]}**\n'
                                                 else:
-                                                    log.debug(f'ratingsPlayerDataHandler({mode}) - {r["dlastnick"]} present in voided/incomplete match {m["gameref"]} - ignoring RP. Last completed game: {r["lastgameref"]} on {r["lastgamedate"]}')
-                                        if len(r['ratinghistory']):
-                                            r['ratinghistory'] = sorted(r['ratinghistory'], key=lambda g: datetime.fromisoformat(g['matchdate'])) 
-                                            r['ratinghistory'] = r['ratinghistory'][:-1]
-                                        for aset in admsets:
-                                            if g_last != None:
-                                                if g_last < datetime.fromisoformat(aset['matchdate']) and (len(aset['matchref']) == 0 or aset['matchref'] == 'admin-set'):
-                                                    r['ratinghistory'].append({
-                                                        'matchref': r['lastgameref'],
-                                                        'matchdate': r['lastgamedate'],
-                                                        'ratingbefore': r['ratingprevious'],
-                                                        'ratingafter': r['ratingvalue']
-                                                    })
-                                                    r['lastgameref'] = aset['matchref']
-                                                    r['lastgamedate'] = aset['matchdate']
-                                                    r['ratingprevious'] = r['ratingvalue']
-                                                    r['ratingvalue'] = aset['ratingafter']
-                                                    msg = f'{msg}> Admin updated @ {g_date}: RP before: **{r["ratingprevious"]}**; RP after: **{r["ratingvalue"]}**\n'
-                                                    g_last = datetime.fromisoformat(aset['matchdate'])
-                                        if len(r['ratinghistory']):
-                                            r['ratinghistory'] = sorted(r['ratinghistory'], key=lambda g: datetime.fromisoformat(g['matchdate']))
-                                            last = r['ratinghistory'][-1]
-                                            if last['matchref'] == r['lastgameref'] and last['matchdate'] == r['lastgamedate']:
-                                                r['ratinghistory'] = r['ratinghistory'][:-1]
-                                        if len(msg) == 0:
-                                            msg = self.ratingsPlayerDataHandler('rkset',mode,player,rating)
+                                                    msg = f'{msg}> Failed to apply ranked update for match `{m["gameref"]}`. PUG could not be found.'
+                                            else:
+                                                log.debug(f'ratingsPlayerDataHandler({mode}) - {r["dlastnick"]} present in voided/incomplete match {m["gameref"]} - ignoring RP. Last completed game: {r["lastgameref"]} on {r["lastgamedate"]}')
+                                    if len(r['ratinghistory']):
+                                        r['ratinghistory'].pop()
+                                    for aset in admsets:
+                                        if g_last != None:
+                                            if g_last < datetime.fromisoformat(aset['matchdate']) and (len(aset['matchref']) == 0 or aset['matchref'] == 'admin-set'):
+                                                r['ratinghistory'].append({
+                                                    'matchref': r['lastgameref'],
+                                                    'matchdate': r['lastgamedate'],
+                                                    'ratingbefore': r['ratingprevious'],
+                                                    'ratingafter': r['ratingvalue']
+                                                })
+                                                r['lastgameref'] = aset['matchref']
+                                                r['lastgamedate'] = aset['matchdate']
+                                                r['ratingprevious'] = r['ratingvalue']
+                                                r['ratingvalue'] = aset['ratingafter']
+                                                msg = f'{msg}> Admin updated @ {g_date}: RP before: **{r["ratingprevious"]}**; RP after: **{r["ratingvalue"]}**\n'
+                                                g_last = datetime.fromisoformat(aset['matchdate'])
+                                    if len(r['ratinghistory']):
+                                        last = r['ratinghistory'][-1]
+                                        if last['matchref'] == r['lastgameref'] and last['matchdate'] == r['lastgamedate']:
+                                            r['ratinghistory'].pop()
+                                    if len(msg) == 0:
+                                        msg = self.ratingsPlayerDataHandler('rkset',mode,player,rating)
                     elif action == 'rkset':
                         if pid > -1 and pid not in x['registrations']:
                             x['registrations'].append(pid) # register player as eligible
@@ -4130,16 +6507,11 @@ class PUG(commands.Cog):
                                 if (additionalid > 0 or 'externalpid' not in r):
                                     r['externalpid'] = additionalid
                                 r['ratingdate'] = datetime.now().isoformat()
-                                if 'ratinghistory' in r:
-                                    if r['ratinghistory'] in [None,'']:
-                                        r['ratinghistory'] = []
-                                else:
-                                    r['ratinghistory'] = []
                                 if len(r['lastgameref']) == 0:
                                     r['lastgameref'] = 'admin-set'
                                 if len(r['lastgamedate']) == 0:
                                     r['lastgamedate'] = r['ratingdate']
-                                r['ratinghistory'].append({
+                                RatingHistory.of(r).append({
                                     'matchref': r['lastgameref'],
                                     'matchdate': r['lastgamedate'],
                                     'ratingbefore': r['ratingprevious'],
@@ -4161,7 +6533,7 @@ class PUG(commands.Cog):
                                 'ratingdate': datetime.now().isoformat(),
                                 'ratingprevious': 0,
                                 'ratingvalue': rating,
-                                'ratinghistory': [],
+                                'ratinghistory': RatingHistory(),
                                 'lastgamedate': datetime.now().isoformat(),
                                 'lastgameref': 'admin-set'
                             })
@@ -4184,18 +6556,16 @@ class PUG(commands.Cog):
                             msg = f'Player ID could not be established for {pdn}'
                     else:
                         msg = 'Unsupported action called.'
-        if self.savePugRatings(self.pugInfo.ratingsFile, rkData):
+        if self.savePugRatings(self.pugInfo.ratingsFile, rkData, mode, [pid], []):
             log.debug(f'ratingsPlayerDataHandler({mode}) - saved updated ratings')
             if (pug is not None and pug.ranked): # reload data for current ranked mode
                 pug.setRankedMode(pug.ranked, True)
                 log.debug(f'ratingsPlayerDataHandler({mode}) - loaded ratings back into memory')
         else:
                 msg = 'Error - rank data could not be saved; check bot logs.'
-        if action == 'rkget':
-            msg = None
         return msg
 
-    def ratingsSync(self, endpoint: str = '', body: str = '', authkey: str = '', restrict: bool = False, delay: int = 0):
+    async def ratingsSync(self, endpoint: str = '', body: str = '', authkey: str = '', restrict: bool = False, delay: int = 0):
         if restrict and (datetime.now() - self.lastAPISyncTime).total_seconds() < delay: # 5 second delay between requests when restricted.
             log.debug(f'API request throttled. Last API sync: {self.lastAPISyncTime.strftime("%d/%m/%Y %H:%M:%S")}')
             return None
@@ -4206,10 +6576,10 @@ class PUG(commands.Cog):
         }
         if len(body):
             log.debug('Sending API request, fetching sync API data...')
-            r = self.pugInfo.gameServer.makePostRequest(endpoint, headers)
+            r = await self.pugInfo.gameServer.makePostRequest(endpoint, headers, callType='sync')
         else:
             log.debug('Sending API request, sending sync API data...')
-            r = self.pugInfo.gameServer.makePostRequest(endpoint, headers, body)
+            r = await self.pugInfo.gameServer.makePostRequest(endpoint, headers, body, callType='sync')
         self.lastAPISyncTime = datetime.now()
         if(r):
             try:
@@ -4338,7 +6708,7 @@ class PUG(commands.Cog):
         if targetPug == None:
             await ctx.send('No active pug found for the specified mode in this channel.')
             return
-        if targetPug.pugLocked != True and targetPug.gameServer.useServer(svindex,targetPug.captainsReady): # auto start eligible servers when caps are ready
+        if targetPug.pugLocked != True and await targetPug.gameServer.useServer(svindex,targetPug.captainsReady): # auto start eligible servers when caps are ready
             await ctx.send(f'Server was activated by an admin for {mode} - {targetPug.gameServer.format_current_serveralias}.')
             targetPug.gameServer.utQueryConsoleWatermark = targetPug.gameServer.format_new_watermark
             if targetPug.gameServer.gameServerState in ('N/A','N/AN/A'):
@@ -4375,11 +6745,11 @@ class PUG(commands.Cog):
         """Starts up an on-demand server. Admin only"""
         previousRef = self.pugInfo.gameServer.gameServerRef
         svindex = idx - 1 # offset as users see them 1-based index.
-        if self.pugInfo.gameServer.useServer(svindex, True):
+        if await self.pugInfo.gameServer.useServer(svindex, True):
             await ctx.send(f'**{self.pugInfo.gameServer.gameServerName}** is starting up (allow up to 60s).')
         else:
             await ctx.send(f'Selected server **{idx}** could not be activated.')
-        self.pugInfo.gameServer.useServer(-1, True,previousRef) # return to active server
+        await self.pugInfo.gameServer.useServer(-1, True,previousRef) # return to active server
         return True
 
     @commands.hybrid_command(aliases=['stopserver'])
@@ -4389,7 +6759,7 @@ class PUG(commands.Cog):
     async def adminstopserver(self, ctx, idx: int):
         """Queues up an on-demand server to shut down. Admin only"""
         svindex = idx - 1 # offset as users see them 1-based index.
-        if self.pugInfo.gameServer.stopOnDemandServer(svindex):
+        if await self.pugInfo.gameServer.stopOnDemandServer(svindex):
             if len(self.pugInfo.gameServer.allServers[svindex][1]) > 0:
                 await ctx.send(f'**{self.pugInfo.gameServer.allServers[svindex][1]}** is queued for shut-down.')
         else:
@@ -4400,7 +6770,7 @@ class PUG(commands.Cog):
     @commands.check(isPugInProgress_Warn)
     async def adminrefreshservers(self, ctx):
         """Refreshes the server list within the available pool. Admin only"""
-        if self.pugInfo.gameServer.validateServers():
+        if await self.pugInfo.gameServer.validateServers():
             if len(self.pugInfo.gameServer.gameServerRotation) > 0:
                 await ctx.send('Server list refreshed. Check whether the server rotation is still valid.')
             else:
@@ -4445,7 +6815,7 @@ class PUG(commands.Cog):
         """Checks current server and rotates accordingly."""
         tempRotation = self.pugInfo.gameServer.gameServerRef
         if len(self.pugInfo.gameServer.gameServerRotation) > 0:
-            self.pugInfo.gameServer.checkServerRotation()
+            await self.pugInfo.gameServer.checkServerRotation()
             if self.pugInfo.gameServer.gameServerRef != tempRotation:
                 await ctx.send(f'Server rotation changed server to: {self.pugInfo.gameServer.format_current_serveralias}.')
             else:
@@ -4460,18 +6830,19 @@ class PUG(commands.Cog):
         if len(self.pugInfo.gameServer.gameServerRotation) > 0:
             thisWeek = int(self.pugInfo.gameServer.gameServerRotation[int('{:0}{:0>2}'.format(datetime.now().year,datetime.now().isocalendar()[1]))%len(self.pugInfo.gameServer.gameServerRotation)])
             nextWeek = int(self.pugInfo.gameServer.gameServerRotation[int('{:0}{:0>2}'.format((datetime.now()+timedelta(weeks=1)).year,(datetime.now()+timedelta(weeks=1)).isocalendar()[1]))%len(self.pugInfo.gameServer.gameServerRotation)])
-            await ctx.send('Server rotation:')
+            msg = ['Server rotation:']
             for x in self.pugInfo.gameServer.gameServerRotation:
                 svindex = int(x)-1
                 if svindex >= 0 and svindex < len(self.pugInfo.gameServer.allServers):
                     if (thisWeek == int(x)):
-                        await ctx.send(f' - {self.pugInfo.gameServer.allServers[svindex][1]} :arrow_forward: This week')
+                        msg.append(f' - {self.pugInfo.gameServer.allServers[svindex][1]} :arrow_forward: This week')
                         thisWeek = -1
                     elif (nextWeek == int(x)):
-                        await ctx.send(f' - {self.pugInfo.gameServer.allServers[svindex][1]} :fast_forward: Next week')
+                        msg.append(f' - {self.pugInfo.gameServer.allServers[svindex][1]} :fast_forward: Next week')
                         nextWeek = -1
                     else:
-                        await ctx.send(f' - {self.pugInfo.gameServer.allServers[svindex][1]}')
+                        msg.append(f' - {self.pugInfo.gameServer.allServers[svindex][1]}')
+            await self.outbound.post(ctx, '\n'.join(msg))
         else:
             await ctx.send('Server rotation is not configured.')
 
@@ -4575,6 +6946,7 @@ class PUG(commands.Cog):
             await ctx.send('Please try again after the match has concluded.')
         else:
             self.pugInfo.savePugRatings(self.pugInfo.ratingsFile)
+            await self.ratingsRepo.flush()
             await ctx.send('Rank configuration saved.')
         return True
 
@@ -4628,14 +7000,13 @@ class PUG(commands.Cog):
             return True
         if pug.ranked and pug.mode.upper() == mode.upper():
             mode = pug.mode
-        matchInfo = self.ratingsMatchInfo(mode,item)
+        matchInfo = await self.ratingsMatchInfo(mode,item)
         if matchInfo == {} and direction == 'outbound':
             await ctx.send('The provided valid match reference could not be found for outbound sync.')
         elif matchInfo != {} and direction == 'outbound':
             started = datetime.fromisoformat(matchInfo['startdate'])
             await ctx.send(f'Synchronising match `{matchInfo["gameref"]}` played on {started.strftime("%d/%m/%Y")} at {started.strftime("%H:%M:%S")}...')
-            self.savePugRatings(pug.ratingsFile)
-            rk = pug.loadPugRatings(pug.ratingsFile, True)
+            rk = pug.loadPugRatings(pug.ratingsFile, True, mode)
             if 'rankedgames' in rk:
                 for x in rk['rankedgames']:
                     if 'games' in x and 'mode' in x and x['mode'].upper() == mode.upper():
@@ -4650,11 +7021,11 @@ class PUG(commands.Cog):
                 # await ctx.send('{0} {1} data from {2}...'.format('Fetching',item,'Sync API'))
                 await ctx.send(f'Synchronisation of {item} data for `{mode}` has not yet been implemented.')
             else:
-                rkData = pug.loadPugRatings(pug.ratingsFile, True)
+                rkData = pug.loadPugRatings(pug.ratingsFile, True, mode)
                 endpoint = f'{rkData["syncapi"]["matchDataURL"]}?&matchcode={item}'
                 log.debug(f'rksync() - Fetching provided match from API: {endpoint}')
                 await ctx.send(f'Fetching match `{item}` from {pug.ratingsSyncAPI["matchDataURL"]}...')
-                syData = self.ratingsSync(endpoint, body='', restrict=True, delay=5)
+                syData = await self.ratingsSync(endpoint, body='', restrict=True, delay=5)
                 if syData not in [{},None,''] and 'match_summary' in syData:
                     log.debug('rksync() - Match data fetched and valid.')
                     g_start = datetime.strptime(str(syData['time_start']),'%Y%m%d%H%M%S').isoformat()
@@ -4703,6 +7074,7 @@ class PUG(commands.Cog):
                         return True
                     else:
                         log.debug(f'rksync() - Preparing to store match data for {item}.')
+                        await self.ratingsRepo.restoreGame(mode, item) # an older match is updated in place
                         if pug.storeRankedPug(mode=mode, matchCode=item, redScore=syData['score_red'], blueScore=syData['score_blue'], timeStarted=g_start, hasEnded=False, redPlayers=g_red, bluePlayers=g_blue, maps=g_maps, redPower=g_red_rp, bluePower=g_blue_rp, timeEnded=g_end):
                             log.debug('rksync() - Stored match successfully.')
                             pug.setRankedMode(MODE_CONFIG[pug.mode].isRanked, False)
@@ -4730,16 +7102,11 @@ class PUG(commands.Cog):
         else:
             if pid > 0:
                 await ctx.send(f'Recalculating RP (override ID={pid})...')
-                msg = self.ratingsPlayerDataHandler('rkrecalc',mode,pid,seed)
+                msg = self.ratingsPlayerDataHandler('rkrecalc',mode,pid,seed,games=await self.ratingsRepo.allGames(mode))
             else:
                 await ctx.send('Recalculating RP...')
-                msg = self.ratingsPlayerDataHandler('rkrecalc',mode,player,seed)
-            if len(msg) > 2000:
-                for m in msg.split('\n'):
-                    if len(m):
-                        await ctx.send(m)
-            else:
-                await ctx.send(msg)
+                msg = self.ratingsPlayerDataHandler('rkrecalc',mode,player,seed,games=await self.ratingsRepo.allGames(mode))
+            await self.outbound.post(ctx, msg)
         return True
 
     @commands.hybrid_command(aliases=['rkgamesim','rksim'])
@@ -4821,9 +7188,7 @@ class PUG(commands.Cog):
             await ctx.send(f'Maps could not be cleared - a ranked match is already underway at {pug.gameServer.format_gameServerURL}')
             await ctx.send('Please try again after the match has concluded.')
         else:
-            # Save then load the current ratings data before manipulating and saving again
-            pug.savePugRatings(pug.ratingsFile)
-            rkData = pug.loadPugRatings(pug.ratingsFile, True)
+            rkData = pug.loadPugRatings(pug.ratingsFile, True, mode)
             rkUpdate = False
             if 'rankedgames' in rkData:
                 log.debug(f'rkclearmaps({mode}) - ranked games present.')
@@ -4837,7 +7202,7 @@ class PUG(commands.Cog):
                             x['fixedpicklimit'] = 0
                             x['startmapfrompick'] = 0
                         rkUpdate = True
-            if rkUpdate and pug.savePugRatings(pug.ratingsFile, rkData):
+            if rkUpdate and pug.savePugRatings(pug.ratingsFile, rkData, mode, [], []):
                 await ctx.send(f'Map list, pick limit and start map settings cleared for ranked game mode {mode}')
                 if (pug.ranked): # reload data for current ranked mode
                     pug.setRankedMode(pug.ranked, True)
@@ -4863,8 +7228,7 @@ class PUG(commands.Cog):
             await ctx.send(f'A ranked match is already underway at {pug.gameServer.format_gameServerURL}')
             await ctx.send('Maps cannot be added while a match is in progress.')
         else:
-            pug.savePugRatings(pug.ratingsFile)
-            rkData = pug.loadPugRatings(pug.ratingsFile, True)
+            rkData = pug.loadPugRatings(pug.ratingsFile, True, mode)
             rkUpdate = False
             if 'rankedgames' in rkData:
                 log.debug(f'rkaddmaps({mode},{maps}) - ranked games present.')
@@ -4906,7 +7270,7 @@ class PUG(commands.Cog):
                             else:
                                 x['maps']['startmapfrompick'] = o
                         rkUpdate = True
-            if rkUpdate and pug.savePugRatings(pug.ratingsFile, rkData):
+            if rkUpdate and pug.savePugRatings(pug.ratingsFile, rkData, mode, [], []):
                 await ctx.send(f'Map list updated for ranked game mode {mode}')
                 if (pug.ranked): # reload data for current ranked mode
                     pug.setRankedMode(pug.ranked, True)
@@ -4931,8 +7295,7 @@ class PUG(commands.Cog):
             await ctx.send(f'A ranked match is already underway at {pug.gameServer.format_gameServerURL} [{pug.pugLocked},{pug.ranked}]')
             await ctx.send('Map limits cannot be modified while a match is in progress.')
         else:
-            pug.savePugRatings(pug.ratingsFile)
-            rkData = pug.loadPugRatings(pug.ratingsFile, True)
+            rkData = pug.loadPugRatings(pug.ratingsFile, True, mode)
             rkUpdate = False
             if 'rankedgames' in rkData:
                 log.debug(f'rkmaplimit({mode},{limit}) - ranked games present.')
@@ -4957,7 +7320,7 @@ class PUG(commands.Cog):
                             if shuffle[1:2].isnumeric():
                                 x['maps']['startmapfrompick'] = max(0, min(int(shuffle[1:2]),limit))
                         rkUpdate = True
-            if rkUpdate and pug.savePugRatings(pug.ratingsFile, rkData):
+            if rkUpdate and pug.savePugRatings(pug.ratingsFile, rkData, mode, [], []):
                 await ctx.send(f'Map limit updated for ranked game mode {mode}')
                 if (pug.ranked): # reload data for current ranked mode
                     pug.setRankedMode(pug.ranked, True)
@@ -5003,7 +7366,7 @@ class PUG(commands.Cog):
             return True
         pug.maps.adjustRankedMapDesirability(action='resetAll')
         pug.ratings['maps']['maplist'] = pug.maps.mapListWeighting
-        if pug.savePugRatings(pug.ratingsFile):
+        if pug.savePugRatings(pug.ratingsFile, mode=pug.mode, ratings=[], games=[]):
             await ctx.send('Map desirability values reset to pool defaults.')
             return True
 
@@ -5024,7 +7387,7 @@ class PUG(commands.Cog):
             return True
         if pug.maps.adjustRankedMapDesirability(action='mapincrease',map=map, adjustment=factor):
             pug.ratings['maps']['maplist'] = pug.maps.mapListWeighting
-            if pug.savePugRatings(pug.ratingsFile):
+            if pug.savePugRatings(pug.ratingsFile, mode=pug.mode, ratings=[], games=[]):
                 await ctx.send('Map desirability value adjusted.')
                 return True
         else:
@@ -5048,7 +7411,7 @@ class PUG(commands.Cog):
             return True
         if pug.maps.adjustRankedMapDesirability(action='mapdecrease',map=map, adjustment=divisor):
             pug.ratings['maps']['maplist'] = pug.maps.mapListWeighting
-            if pug.savePugRatings(pug.ratingsFile):
+            if pug.savePugRatings(pug.ratingsFile, mode=pug.mode, ratings=[], games=[]):
                 await ctx.send('Map desirability value adjusted.')
                 return True
         else:
@@ -5070,8 +7433,7 @@ class PUG(commands.Cog):
             await ctx.send(f'A ranked match is already underway at {pug.gameServer.format_gameServerURL}')
             await ctx.send('Configuration cannot be modified while a match is in progress.')
             return True
-        pug.savePugRatings(pug.ratingsFile)
-        rkData = pug.loadPugRatings(pug.ratingsFile, True)
+        rkData = pug.loadPugRatings(pug.ratingsFile, True, mode)
         if 'rankedgames' in rkData:
             for x in rkData['rankedgames']:
                 if 'mode' in x and str(x['mode']).upper() == mode.upper():
@@ -5093,7 +7455,7 @@ class PUG(commands.Cog):
                     if capmode == 2 and role is not None:
                         x['capRole'] = role.name
                         newSettings = f'Discord role for captain selection: {x["capRole"]}; '
-            if pug.savePugRatings(pug.ratingsFile, rkData):
+            if pug.savePugRatings(pug.ratingsFile, rkData, mode, [], []):
                 await ctx.send(f'Ranked game mode {mode} configuration updated.\nPrevious settings - {previousSettings}\nNew settings - {newSettings}')
                 if (pug.ranked): # reload data for current ranked mode
                     pug.setRankedMode(pug.ranked, True)
@@ -5119,8 +7481,7 @@ class PUG(commands.Cog):
             await ctx.send(f'A ranked match is already underway at {pug.gameServer.format_gameServerURL}')
             await ctx.send('Configuration cannot be modified while a match is in progress.')
             return True
-        pug.savePugRatings(pug.ratingsFile)
-        rkData = pug.loadPugRatings(pug.ratingsFile, True)
+        rkData = pug.loadPugRatings(pug.ratingsFile, True, mode)
         rkUpdate = False
         if 'rankedgames' in rkData:
             for x in rkData['rankedgames']:
@@ -5149,7 +7510,7 @@ class PUG(commands.Cog):
                         newSettings = newSettings+f', Winning Voluntary Captain: {x["scoring"]["volCapWin"]}, Losing Voluntary Captain: {x["scoring"]["volCapLose"]}'
                     rkUpdate = True
         if rkUpdate == True:
-            if pug.savePugRatings(pug.ratingsFile, rkData):
+            if pug.savePugRatings(pug.ratingsFile, rkData, mode, [], []):
                 await ctx.send(f'Ranked game mode {mode} configuration updated.\nPrevious settings - {previousSettings}\nNew settings - {newSettings}')
                 if (pug.ranked): # reload data for current ranked mode
                         pug.setRankedMode(pug.ranked, True)
@@ -5174,24 +7535,18 @@ class PUG(commands.Cog):
                 return True
         games = []
         msg = []
-        if self.ratingsLock or (pug.pugLocked != True and pug.ranked):
-            pug.savePugRatings(pug.ratingsFile)
-        rkData = pug.loadPugRatings(pug.ratingsFile, True)
-        if 'rankedgames' in rkData:
-            for x in rkData['rankedgames']:
-                if 'mode' in x and str(x['mode']).upper() == mode.upper():
-                    mode = x['mode']
-                    games = sorted(x['games'], key=lambda g: datetime.fromisoformat(g['startdate']), reverse=True)
-                    players = {}
-                    if 'ratings' in x:
-                        for p in x['ratings']:
-                            players[p['did']] = p['dlastnick']
-                    if len(matchref):
-                        allgames = games
-                        games = []
-                        for g in allgames:
-                            if re.search(re.escape(matchref),g['gameref'], re.IGNORECASE):
-                                games.append(g)
+        pug.loadPugRatings(pug.ratingsFile, True, mode)
+        x = self.ratingsRepo.getMode(mode)
+        if x is not None:
+            mode = x['mode']
+            games = self.ratingsRepo.recentGames(mode)
+            players = {did: r['dlastnick'] for did, r in self.ratingsRepo.ratingsByDid[mode.upper()].items()}
+            if len(matchref):
+                allgames = games
+                games = []
+                for g in allgames:
+                    if re.search(re.escape(matchref),g['gameref'], re.IGNORECASE):
+                        games.append(g)
         if len(games):
             if len(games) > last:
                 g_limit = last
@@ -5229,12 +7584,7 @@ class PUG(commands.Cog):
                 msg = msg+f'{i}) Match Ref: `{g["gameref"]}`; Started {g_startdate}, {g_enddate}\n'
                 msg = msg+f'> Red team (RP: {g["rpred"]}): {PLASEP.join(teamred)}\n> Blue team (RP: {g["rpblue"]}): {PLASEP.join(teamblue)}\n'
                 msg = msg+f'> Score :red_square: {g["scorered"]} - {g["scoreblue"]} :blue_square:\n\n'
-        if len(msg) > 4000:
-            for m in msg.split('\n'):
-                if len(m):
-                    await ctx.send(m)
-        else:
-            await ctx.send(msg)
+        await self.outbound.post(ctx, msg)
         return True
 
     @commands.hybrid_command(aliases=['rkreport'])
@@ -5275,12 +7625,12 @@ class PUG(commands.Cog):
             teamRed = pug.red
         matchref = re.sub(r'\'|"', '', matchref)
         if (len(teamRed) > 0 and len(teamBlue) > 0) or (len(matchref) > 0 and matchref not in ['player','']):
-            reports = self.ratingsMatchReport(mode=mode,teamRed=teamRed,teamBlue=teamBlue,matchref=matchref)
+            reports = await self.ratingsMatchReport(mode=mode,teamRed=teamRed,teamBlue=teamBlue,matchref=matchref)
         elif player not in ['',None]:
             if (pid):
-                reports = self.ratingsMatchReport(mode=mode,playerid=player)
+                reports = await self.ratingsMatchReport(mode=mode,playerid=player)
             else:
-                reports = self.ratingsMatchReport(mode=mode,playerid=player.id)
+                reports = await self.ratingsMatchReport(mode=mode,playerid=player.id)
         else:
             await ctx.send('Please provide a valid mode, plus match reference or @player.')
         if len(reports) > 0:
@@ -5313,30 +7663,27 @@ class PUG(commands.Cog):
             return True
         if pug.ranked and pug.mode.upper() == mode.upper():
             mode = pug.mode
-        matchInfo = self.ratingsMatchInfo(mode,matchref)
+        matchInfo = await self.ratingsMatchInfo(mode,matchref)
         if matchInfo == {}:
             await ctx.send('The provided valid match reference could not be found.')
         else:
             started = datetime.fromisoformat(matchInfo['startdate'])
             await ctx.send(f'{"Voiding" if matchInfo["completed"] else "Re-establishing"} match `{matchInfo["gameref"]}` played on {started.strftime("%d/%m/%Y")} at {started.strftime("%H:%M:%S")}...')
-            pug.savePugRatings(pug.ratingsFile)
-            rk = pug.loadPugRatings(pug.ratingsFile, True)
-            if 'rankedgames' in rk:
-                for x in rk['rankedgames']:
-                    if 'games' in x and 'mode' in x and x['mode'].upper() == mode.upper():
-                        for g in x['games']:
-                            if 'gameref' in g and g['gameref'].upper() == matchref.upper():
-                                g['completed'] = not g['completed']
-                                log.debug(f'rkvoidmatch() - Found match data in rk; completed={g["completed"]}')
-            pug.savePugRatings(pug.ratingsFile,rk)
+            g = await self.ratingsRepo.restoreGame(mode, matchref)
+            rk = pug.loadPugRatings(pug.ratingsFile, True, mode)
+            if g is not None:
+                g['completed'] = not g['completed']
+                log.debug(f'rkvoidmatch() - Found match data in rk; completed={g["completed"]}')
+            pug.savePugRatings(pug.ratingsFile, rk, mode, [], [matchref])
             pug.setRankedMode(MODE_CONFIG[pug.mode].isRanked, False)
             players = []
             players.extend(matchInfo['teamred'])
             players.extend(matchInfo['teamblue'])
+            games = await self.ratingsRepo.allGames(mode)
             for p in players:
                 player = self.ratingsPlayerDataHandler('rkget', mode, p)
                 if player not in [None,{},'']:
-                    msg = str(self.ratingsPlayerDataHandler('rkrecalc',mode,p,0)).split("\n")[-2].replace("> ","")
+                    msg = str(self.ratingsPlayerDataHandler('rkrecalc',mode,p,0,games=games)).split("\n")[-2].replace("> ","")
                     await ctx.send(f'> Recalculated RP for {player["dlastnick"]}...\n> - Updated to last event: {msg}')
                 else:
                     await ctx.send(f'> Could not recalculate RP for ID `{p}`; player not found.')
@@ -5517,7 +7864,7 @@ class PUG(commands.Cog):
                             embedInfo.remove_field(x)
                     await ctx.send(embed=embedInfo)
                 else:
-                    await ctx.send(pug.gameServer.format_game_server_status)
+                    await ctx.send(await pug.gameServer.format_game_server_status())
 
     @commands.hybrid_command()
     @commands.guild_only()
@@ -5561,15 +7908,11 @@ class PUG(commands.Cog):
                         serverinfo['ip'] = servermatch.groupdict()['ip']
                         serverinfo['game_port'] = 7777
         if serverinfo != {}:
-            serverinfo['query_port'] = int(serverinfo['game_port'])+1
-            # Set the utQueryData base
-            self._defaultPugInfo.gameServer.utQueryData = serverinfo
-            await self.queryServerStats(cacheonly=True, pug=self._defaultPugInfo)
-            if self._defaultPugInfo.gameServer.utQueryEmbedCache != {}:
-                embedInfo = discord.Embed().from_dict(self._defaultPugInfo.gameServer.utQueryEmbedCache)
-                # Reset caches
-                self._defaultPugInfo.gameServer.utQueryData = {}
-                self._defaultPugInfo.gameServer.utQueryEmbedCache = {}
+            # Query through a private view of the default server, so concurrent lookups don't share query state
+            gameServer = self._defaultPugInfo.gameServer.queryView(serverinfo.get('ip'), serverinfo['game_port'])
+            await self.queryServerStats(cacheonly=True, pug=self._defaultPugInfo, gameServer=gameServer)
+            if gameServer.utQueryEmbedCache != {}:
+                embedInfo = discord.Embed().from_dict(gameServer.utQueryEmbedCache)
                 # Strip objectives from the card data
                 for x, f in enumerate(embedInfo.fields):
                     if 'Objectives' in f.name:
@@ -5765,12 +8108,12 @@ class PUG(commands.Cog):
                 await ctx.send('Force ending match without match code. RP may not be updated correctly.')
                 if targetPug.gameServer.matchCode in [None,'','N/A'] or (targetPug.gameServer.matchCode not in [None,'','N/A'] and len(targetPug.gameServer.matchCode) < 6):
                     targetPug.gameServer.matchCode = f'temp-{datetime.now().strftime("%Y%m%d%H%M%S")}'
-                await self.endMatch(False)
+                await targetPug.gameServer.endMatch(False)
                 self.ratingsLock = False
                 return
             endpoint = f'{targetPug.ratingsSyncAPI["matchDataURL"]}?&matchcode={matchcode}'
             log.debug(f'rksync() - Fetching provided match from API: {endpoint}')
-            syData = self.ratingsSync(endpoint, body='', restrict=True, delay=5)
+            syData = await self.ratingsSync(endpoint, body='', restrict=True, delay=5)
             if syData not in [{},None,''] and 'match_summary' in syData:
                 await ctx.send(f'Ending match with valid match code `{matchcode}`' if matchcode else '')
                 targetPug.gameServer.matchCode = matchcode
@@ -5824,7 +8167,11 @@ class PUG(commands.Cog):
             await ctx.send(f'[**{targetPug.mode}**] Removing all signed players: {targetPug.format_all_players(number=False, mention=True)}')
             if len(targetPug.queuedPlayers):
                 await ctx.send(f'[**{targetPug.mode}**] Removing all queued players: {targetPug.format_queued_players(number=False, mention=True)}')
-            if targetPug.resetPug(True):
+            setupJob = targetPug.setupJob
+            if await targetPug.resetPug(True):
+                if setupJob is not None and not setupJob.done():
+                    # resetPug() cancelled the setup; let the job wind down before confirming
+                    await asyncio.wait({setupJob}, timeout=5)
                 await ctx.send(f'[**{targetPug.mode}**] Pug Reset.')
                 await self.listpugs(ctx)
             else:
@@ -5842,6 +8189,9 @@ class PUG(commands.Cog):
         if targetPug == None:
             await ctx.send('Could not find a valid, failed PUG to retry. Use `!retry <mode>` to specify a game to re-attempt setup for.')
             return
+        if targetPug.setupInProgress:
+            await ctx.send(f'[**{targetPug.mode}**] Setup is already in progress. Use **!reset {targetPug.mode}** to cancel it.')
+            return
         if targetPug.gameServer.matchInProgress is False or targetPug.gameServer.gameServerOnDemand:
             retryAllowed = True
         else:
@@ -6304,13 +8654,27 @@ class PUG(commands.Cog):
             else:
                 await ctx.send('UT Reporter is already active in this channel.')
         else:
-            if targetPug.gameServer.utQueryServer('info'):
+            if await targetPug.gameServer.utQueryServer('info'):
                 self.utReporterChannel = ctx.message.channel
-                if 'code' in targetPug.gameServer.utQueryData and targetPug.gameServer.utQueryData['code'] == 200:
+                if targetPug.gameServer.utQueryData.online:
                     targetPug.gameServer.utQueryStatsActive = True
                     targetPug.gameServer.utQueryReporterActive = True
+                    self.utPollScheduler.reset(targetPug)
                     await ctx.send('Force-started UT Reporter threads in this channel')
         return
 
+def configuredPugModes(configFile: str = DEFAULT_CONFIG_FILE):
+    """Modes of the PUGs saved in the config file, which the cog restores when it starts"""
+    try:
+        with open(configFile) as f:
+            channels = json.load(f).get('pug', {}).get('channels', {})
+    except (OSError, ValueError) as e:
+        log.warning(f'configuredPugModes() - could not read {configFile}: {e}')
+        return []
+    return [mode for gameInfo in channels.values() if isinstance(gameInfo, dict) for mode in gameInfo]
+
 async def setup(bot):
-    await bot.add_cog(PUG(bot, DEFAULT_CONFIG_FILE))
+    ratingsRepo = RatingsRepository(makeRatingsStore(DEFAULT_CONFIG_FILE, DEFAULT_RATING_FILE), DEFAULT_RATING_FILE)
+    await ratingsRepo.open()
+    await ratingsRepo.load(configuredPugModes(DEFAULT_CONFIG_FILE))
+    await bot.add_cog(PUG(bot, DEFAULT_CONFIG_FILE, ratingsRepo))